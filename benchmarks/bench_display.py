@@ -0,0 +1,311 @@
+'''
+Benchmarks for the functions and classes redirecting the output streams.
+
+The measurements cover many tiny captures and single captures of a given
+size, writing from Python ("python" writer) or from C using "printf"
+("c" writer, compiled from "tests/scripts/code/display.c"), for each
+capture backend:
+
+ - "none": the output is written to the (not captured) stdout.
+ - "bytesio": :func:`pyscripts.stdout_redirector` with the default stream.
+ - "tempfile": :func:`pyscripts.stdout_redirector` with a temporary file.
+ - "timestamped": :func:`pyscripts.timestamped_stdout_redirector`.
+ - "pool": :class:`pyscripts.RedirectedPool` with a single worker.
+
+Each measurement runs in a separate process, so the peak resident set size
+is not polluted by the previous ones. The results are written in the JSON
+Lines format, with the throughput (MB/s), the latency per entry (s) and the
+peak RSS (kB) of each configuration, given separately for the benchmark
+process and its children (the worker of the "pool" backend). To run the
+full suite, type
+
+.. code-block:: bash
+
+   python benchmarks/bench_display.py suite --output results.jsonl
+'''
+
+__author__  = ['Miguel Ramos Pernas']
+__email__   = ['miguel.ramos.pernas@cern.ch']
+
+
+# Python
+import argparse
+import ctypes
+import itertools
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+# Local
+import pyscripts
+
+
+__backends__ = ('none', 'bytesio', 'tempfile', 'timestamped', 'pool')
+
+__writers__ = ('python', 'c')
+
+# Size of the chunks of data passed to the writers
+__chunk_size__ = 1 << 16
+
+# Size of the lines in the data
+__line_size__ = 64
+
+# Function to call in the tasks sent to a pool
+_task = None
+
+__code_path__ = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir, 'tests', 'scripts', 'code', 'display.c')
+
+
+def large( backend, writer, size, library, result ):
+    '''
+    Measure the capture of a single block of output of the given size.
+    '''
+    write = _make_writer(writer, library)
+
+    def _write():
+        for c in _chunks(size):
+            write(c)
+
+    elapsed = _run(backend, _write, 1)
+
+    _save_result(result, backend=backend, writer=writer, benchmark='large',
+                 size=size, entries=1, elapsed=elapsed)
+
+
+def tiny( backend, writer, size, entries, library, result ):
+    '''
+    Measure the capture of many entries of a tiny size.
+    '''
+    write = _make_writer(writer, library)
+
+    data = next(iter(_chunks(size)))
+
+    elapsed = _run(backend, lambda: write(data), entries)
+
+    _save_result(result, backend=backend, writer=writer, benchmark='tiny',
+                 size=size * entries, entries=entries, elapsed=elapsed)
+
+
+def suite( output, sizes, tiny_size, entries, backends, writers, library ):
+    '''
+    Run the full set of benchmarks, each on a different process.
+    '''
+    tmpdir = tempfile.mkdtemp()
+    try:
+        _run_suite(tmpdir, output, sizes, tiny_size, entries, backends, writers, library)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def _chunks( size ):
+    '''
+    Generate the chunks of data to write, made of lines of fixed size.
+    '''
+    line = 'x' * (__line_size__ - 1) + '\n'
+
+    chunk = (line * (__chunk_size__ // __line_size__ + 1))[:__chunk_size__]
+
+    full, rest = divmod(size, __chunk_size__)
+
+    for _ in range(full):
+        yield chunk
+
+    if rest:
+        yield chunk[:rest - 1] + '\n'
+
+
+def _make_writer( writer, library ):
+    '''
+    Build the function used to write the data.
+    '''
+    if writer == 'python':
+        def _write( data ):
+            sys.stdout.write(data)
+        return _write
+    else:
+        lib = ctypes.CDLL(library)
+        cache = {}
+        def _write( data ):
+            if data not in cache:
+                cache[data] = data.encode()
+            lib.display(cache[data])
+        return _write
+
+
+def _pool_task( i ):
+    '''
+    Task to run in the worker of a pool.
+    '''
+    _task()
+
+
+def _run( backend, func, entries ):
+    '''
+    Call the function the given number of times, capturing the output of
+    each call with the given backend, and return the elapsed time.
+    '''
+    if backend == 'pool':
+
+        # The function is inherited by the forked worker
+        global _task
+        _task = func
+
+        with pyscripts.RedirectedPool(1) as pool:
+            # Start the worker before measuring
+            pool.map(len, [()])
+            start = time.perf_counter()
+            for _ in pool.imap(_pool_task, range(entries)):
+                pass
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+
+    for _ in range(entries):
+        with _capture(backend):
+            func()
+
+    return time.perf_counter() - start
+
+
+def _run_suite( tmpdir, output, sizes, tiny_size, entries, backends, writers, library ):
+    '''
+    Run the full set of benchmarks, placing the temporary files in the
+    given directory.
+    '''
+    if library is None and 'c' in writers:
+        library = os.path.join(tmpdir, 'display.so')
+        subprocess.check_call(['gcc', '-shared', '-fPIC', '-o', library, __code_path__])
+
+    configs = []
+    for b, w in itertools.product(backends, writers):
+        configs.append(['tiny', '--size', str(tiny_size), '--entries', str(entries), b, w])
+        for s in sizes:
+            configs.append(['large', '--size', str(s), b, w])
+
+    result = os.path.join(tmpdir, 'result.json')
+
+    with open(output, 'w') as f:
+
+        for c in configs:
+
+            args = [sys.executable, os.path.abspath(__file__)] + c + ['--result', result]
+
+            if library is not None:
+                args += ['--library', library]
+
+            # The output of the "none" backend is not captured
+            subprocess.check_call(args, stdout=subprocess.DEVNULL)
+
+            with open(result) as r:
+                res = json.load(r)
+
+            f.write(json.dumps(res) + '\n')
+            f.flush()
+
+            sys.stderr.write('{benchmark:>5} {backend:>11} {writer:>6} size={size:<11} '
+                             '{throughput:10.2f} MB/s {latency:.3e} s/entry '
+                             '{peak_rss:>9} kB (children {peak_rss_children:>9} kB)\n'.format(**res))
+
+
+@contextmanager
+def _capture( backend ):
+    '''
+    Capture the output with the given backend.
+    '''
+    if backend == 'none':
+        yield
+        sys.stdout.flush()
+    elif backend == 'bytesio':
+        with pyscripts.stdout_redirector():
+            yield
+    elif backend == 'tempfile':
+        with pyscripts.stdout_redirector(tempfile.TemporaryFile()) as f:
+            yield
+        f.close()
+    else:
+        with pyscripts.timestamped_stdout_redirector():
+            yield
+
+
+def _save_result( path, **kwargs ):
+    '''
+    Add the derived quantities and save the result of a benchmark.
+    '''
+    kwargs['throughput'] = kwargs['size'] / kwargs['elapsed'] / 1e6
+    kwargs['latency']    = kwargs['elapsed'] / kwargs['entries']
+    kwargs['peak_rss']   = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Largest peak among the child processes (the worker of the "pool"
+    # backend), which can not be added to that of the parent
+    kwargs['peak_rss_children'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    with open(path, 'w') as f:
+        json.dump(kwargs, f)
+
+
+def _add_common_arguments( p ):
+    '''
+    Add the arguments common to the benchmarks.
+    '''
+    p.add_argument('--library', type=str, default=None,
+                   help='Path to the compiled library with the C writer')
+
+
+def _add_measurement_arguments( p ):
+    '''
+    Add the arguments of the modes doing a single measurement.
+    '''
+    p.add_argument('backend', choices=__backends__,
+                   help='Capture backend')
+    p.add_argument('writer', choices=__writers__,
+                   help='Writer of the output')
+    p.add_argument('--size', type=pyscripts.parse_memory, required=True,
+                   help='Size of the data to write')
+    p.add_argument('--result', type=str, required=True,
+                   help='File where to write the result')
+
+
+def _add_suite_arguments( p ):
+    '''
+    Add the arguments to run the full set of benchmarks.
+    '''
+    p.add_argument('--output', type=str, default='bench_display.jsonl',
+                   help='File where to write the results')
+    p.add_argument('--sizes', type=pyscripts.parse_memory, nargs='+',
+                   default=list(map(pyscripts.parse_memory, ('1K', '32K', '1M', '32M', '1G'))),
+                   help='Sizes for the single captures')
+    p.add_argument('--tiny-size', type=pyscripts.parse_memory, default=64,
+                   help='Size of the tiny captures')
+    p.add_argument('--entries', type=int, default=10000,
+                   help='Number of tiny captures')
+    p.add_argument('--backends', nargs='+', default=__backends__,
+                   choices=__backends__, help='Backends to run')
+    p.add_argument('--writers', nargs='+', default=__writers__,
+                   choices=__writers__, help='Writers to use')
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    subparsers = pyscripts.define_modes(parser, [large, tiny, suite],
+                                        apply_to_parsers=_add_common_arguments)
+
+    _add_measurement_arguments(subparsers.choices['large'])
+    _add_measurement_arguments(subparsers.choices['tiny'])
+    _add_suite_arguments(subparsers.choices['suite'])
+
+    subparsers.choices['tiny'].add_argument('--entries', type=int, required=True,
+                                            help='Number of captures')
+
+    args = parser.parse_args()
+
+    pyscripts.call(args)
@@ -0,0 +1,385 @@
+'''
+Benchmarks for the startup time of scripts based on pyscripts.
+
+The measurements are done on fresh interpreters, one per trial, for:
+
+ - "interpreter": start-up of the interpreter alone ("python -c pass"), \
+ as a reference.
+ - "import_cold": "import pyscripts" from a copy of the package without \
+ compiled bytecode.
+ - "import_warm": "import pyscripts" with the bytecode already compiled.
+ - "parser_<N>": building a parser with N modes using \
+ :func:`pyscripts.define_modes`.
+ - "call": a complete script parsing the arguments and calling a mode that \
+ does nothing, through :func:`pyscripts.call`.
+
+For each of them, the median and the 95th percentile of the time measured
+inside the process and of the wall time of the whole process are
+reported, together with the modules taking longer to import, obtained with
+"python -X importtime". The results are compared to a stored baseline, and
+the script fails if the median of any measurement increases by more than
+the tolerance, the minimum difference and the spread of the trials (from
+the median to the 95th percentile) of the baseline or of the results. To
+run the suite and update the baseline, type
+
+.. code-block:: bash
+
+   python benchmarks/bench_startup.py suite --save-baseline
+
+Note that the files of the package are in the cache of the operating
+system for all the trials, so the "cold" import only refers to the
+compilation of the bytecode.
+'''
+
+__author__  = ['Miguel Ramos Pernas']
+__email__   = ['miguel.ramos.pernas@cern.ch']
+
+
+# Python
+import argparse
+import collections
+import compileall
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+# Local
+import pyscripts
+
+
+__baseline_path__ = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'baselines', 'startup.json')
+
+# Code run on each trial, printing the time measured inside the process
+__import_code__ = '''
+import time
+start = time.perf_counter()
+import pyscripts
+print(time.perf_counter() - start)
+'''
+
+__parser_code__ = '''
+import argparse, time
+import pyscripts
+modes = []
+for i in range({modes}):
+    exec('def mode_{{0}}( value ):\\n    """ Mode number {{0}} """'.format(i))
+    modes.append(locals()['mode_{{}}'.format(i)])
+def add_arguments( p ):
+    p.add_argument('--value', type=int, default=0, help='Value')
+start = time.perf_counter()
+parser = argparse.ArgumentParser()
+pyscripts.define_modes(parser, modes, apply_to_parsers=add_arguments)
+print(time.perf_counter() - start)
+'''
+
+__call_code__ = '''
+import time
+start = time.perf_counter()
+import argparse
+import pyscripts
+def noop():
+    """ Mode doing nothing """
+parser = argparse.ArgumentParser()
+pyscripts.define_modes(parser, [noop])
+pyscripts.call(parser.parse_args(['noop']))
+print(time.perf_counter() - start)
+'''
+
+
+def importtime( trials, top ):
+    '''
+    Display the modules taking longer to import with "import pyscripts".
+    '''
+    with _package_copy() as path:
+        modules = _importtime(path, trials)
+
+    _print_importtime(modules, top)
+
+
+def suite( output, trials, modes, top, baseline, save_baseline, tolerance, min_difference ):
+    '''
+    Run the full set of benchmarks and compare them with the baseline.
+    '''
+    benchmarks = collections.OrderedDict()
+    benchmarks['interpreter'] = 'pass'
+    benchmarks['import_cold'] = __import_code__
+    benchmarks['import_warm'] = __import_code__
+    for n in modes:
+        benchmarks['parser_{}'.format(n)] = __parser_code__.format(modes=n)
+    benchmarks['call'] = __call_code__
+
+    results = collections.OrderedDict()
+
+    with _package_copy() as path:
+
+        # Compile the bytecode for the warm measurements
+        compileall.compile_dir(os.path.join(path, 'pyscripts'), quiet=1)
+
+        for name, code in benchmarks.items():
+
+            process, wall = [], []
+            for _ in range(trials):
+                if name == 'import_cold':
+                    with _package_copy() as cold:
+                        p, w = _trial(cold, code)
+                else:
+                    p, w = _trial(path, code)
+                if p is not None:
+                    process.append(p)
+                wall.append(w)
+
+            res = collections.OrderedDict(benchmark=name, trials=trials)
+            res.update(_summary('process', process))
+            res.update(_summary('wall', wall))
+
+            results[name] = res
+
+            sys.stderr.write('{benchmark:>12} process: {process_median:.4f} s (p95 {process_p95:.4f} s) '
+                             'wall: {wall_median:.4f} s (p95 {wall_p95:.4f} s)\n'.format(**_printable(res)))
+
+        modules = _importtime(path, trials)
+
+    with open(output, 'w') as f:
+        for res in results.values():
+            f.write(json.dumps(res) + '\n')
+        f.write(json.dumps({'benchmark': 'importtime', 'modules': modules}) + '\n')
+
+    _print_importtime(modules, top)
+
+    if save_baseline:
+        _save_baseline(baseline, results)
+        sys.stderr.write('Baseline saved to "{}"\n'.format(baseline))
+    elif os.path.exists(baseline):
+        regressions = _compare(baseline, results, tolerance, min_difference)
+        if regressions:
+            raise SystemExit('Startup time regressions found: {}'.format(', '.join(regressions)))
+    else:
+        sys.stderr.write('No baseline found in "{}"\n'.format(baseline))
+
+
+def _compare( path, results, tolerance, min_difference ):
+    '''
+    Compare the results with the baseline, returning the benchmarks whose
+    median is slower than allowed.
+    The increase of the median must exceed the tolerance, the minimum
+    difference and the spread of the measurements (the largest distance
+    from the median to the 95th percentile of the baseline and of the
+    results), so the fluctuations between runs are not reported.
+    '''
+    with open(path) as f:
+        baseline = json.load(f)
+
+    if baseline['python'] != platform.python_version():
+        sys.stderr.write('Baseline obtained with Python {}, running Python {}\n'.format(
+            baseline['python'], platform.python_version()))
+
+    regressions = []
+
+    for name, res in results.items():
+
+        if name not in baseline['benchmarks']:
+            continue
+
+        ref = baseline['benchmarks'][name]
+
+        for prefix in ('process', 'wall'):
+
+            median, p95 = prefix + '_median', prefix + '_p95'
+
+            if res[median] is None or ref.get(median) is None:
+                continue
+
+            spread  = max(ref[p95] - ref[median], res[p95] - res[median])
+            allowed = max(tolerance * ref[median], spread, min_difference)
+
+            sys.stderr.write('{:>12} {:>14}: {:.4f} s (baseline {:.4f} s, {:+.1%}, allowed {:+.4f} s)\n'.format(
+                name, median, res[median], ref[median], res[median] / ref[median] - 1, allowed))
+
+            if res[median] - ref[median] > allowed:
+                regressions.append('{} ({})'.format(name, median))
+
+    return regressions
+
+
+def _environ( path ):
+    '''
+    Build the environment for a trial, importing pyscripts from the given
+    directory and writing its bytecode there.
+    '''
+    env = dict(os.environ)
+
+    # The bytecode must be written and read from the package directory
+    for v in ('PYTHONDONTWRITEBYTECODE', 'PYTHONPYCACHEPREFIX'):
+        env.pop(v, None)
+
+    env['PYTHONPATH'] = os.pathsep.join(p for p in (path, env.get('PYTHONPATH')) if p)
+    return env
+
+
+def _importtime( path, trials ):
+    '''
+    Get the median of the cumulative import time (s) of each module
+    imported with "import pyscripts", sorted in decreasing order.
+    '''
+    times = collections.defaultdict(list)
+
+    for _ in range(trials):
+
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import pyscripts'],
+                              env=_environ(path), stderr=subprocess.PIPE,
+                              universal_newlines=True, check=True)
+
+        for line in proc.stderr.splitlines():
+
+            if not line.startswith('import time:') or 'imported package' in line:
+                continue
+
+            _, cumulative, name = line[len('import time:'):].split('|')
+
+            times[name.strip()].append(int(cumulative) * 1e-6)
+
+    modules = [(n, statistics.median(t)) for n, t in times.items()]
+
+    return sorted(modules, key=lambda m: m[1], reverse=True)
+
+
+@contextmanager
+def _package_copy():
+    '''
+    Copy the package to a temporary directory, without compiled bytecode,
+    so the trials do not depend on its state in the working tree, and
+    yield the directory containing it.
+    '''
+    path = tempfile.mkdtemp()
+
+    source = os.path.dirname(os.path.abspath(pyscripts.__file__))
+
+    shutil.copytree(source, os.path.join(path, 'pyscripts'),
+                    ignore=shutil.ignore_patterns('__pycache__'))
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path)
+
+
+def _percentile( values, q ):
+    '''
+    Calculate the given percentile using the nearest-rank method.
+    '''
+    values = sorted(values)
+    return values[max(int(math.ceil(q / 100. * len(values))) - 1, 0)]
+
+
+def _print_importtime( modules, top ):
+    '''
+    Display the modules with the largest cumulative import time.
+    '''
+    sys.stderr.write('Cumulative import time of the slowest modules:\n')
+    for name, t in modules[:top]:
+        sys.stderr.write('{:>10.2f} ms {}\n'.format(1e3 * t, name))
+
+
+def _printable( res ):
+    '''
+    Replace missing values by NaN so they can be formatted as numbers.
+    '''
+    return {k: float('nan') if v is None else v for k, v in res.items()}
+
+
+def _save_baseline( path, results ):
+    '''
+    Save the medians and 95th percentiles of the results as the baseline.
+    '''
+    keys = ('process_median', 'process_p95', 'wall_median', 'wall_p95')
+
+    baseline = collections.OrderedDict()
+    baseline['python']   = platform.python_version()
+    baseline['platform'] = platform.platform()
+    baseline['benchmarks'] = collections.OrderedDict(
+        (n, collections.OrderedDict((k, r[k]) for k in keys)) for n, r in results.items())
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2)
+        f.write('\n')
+
+
+def _summary( prefix, values ):
+    '''
+    Calculate the median and the 95th percentile of a set of values.
+    '''
+    if not values:
+        return {prefix + '_median': None, prefix + '_p95': None}
+
+    return collections.OrderedDict([(prefix + '_median', statistics.median(values)),
+                                    (prefix + '_p95', _percentile(values, 95))])
+
+
+def _trial( path, code ):
+    '''
+    Run the code on a new interpreter, returning the time printed by the process (if any) and
+    the wall time.
+    '''
+    start = time.perf_counter()
+
+    proc = subprocess.run([sys.executable, '-c', code], env=_environ(path),
+                          stdout=subprocess.PIPE, universal_newlines=True, check=True)
+
+    wall = time.perf_counter() - start
+
+    out = proc.stdout.strip()
+
+    return (float(out.splitlines()[-1]) if out else None), wall
+
+
+def _add_common_arguments( p ):
+    '''
+    Add the arguments common to the benchmarks.
+    '''
+    p.add_argument('--trials', type=int, default=20,
+                   help='Number of trials for each measurement')
+    p.add_argument('--top', type=int, default=15,
+                   help='Number of modules to display in the import time breakdown')
+
+
+def _add_suite_arguments( p ):
+    '''
+    Add the arguments to run the full set of benchmarks.
+    '''
+    p.add_argument('--output', type=str, default='bench_startup.jsonl',
+                   help='File where to write the results')
+    p.add_argument('--modes', type=int, nargs='+', default=[1, 10, 100],
+                   help='Number of modes for the parser construction')
+    p.add_argument('--baseline', type=str, default=__baseline_path__,
+                   help='File with the baseline')
+    p.add_argument('--save-baseline', action='store_true',
+                   help='Save the results as the new baseline instead of comparing them')
+    p.add_argument('--tolerance', type=float, default=0.25,
+                   help='Maximum relative increase of the medians with respect to the baseline')
+    p.add_argument('--min-difference', type=float, default=0.002,
+                   help='Increase of the medians (s) below which no regression is reported')
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    subparsers = pyscripts.define_modes(parser, [importtime, suite],
+                                        apply_to_parsers=_add_common_arguments)
+
+    _add_suite_arguments(subparsers.choices['suite'])
+
+    args = parser.parse_args()
+
+    pyscripts.call(args)
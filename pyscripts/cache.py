@@ -0,0 +1,317 @@
+'''
+Functions and classes to store the results of the modes, avoiding running
+them again when their inputs and code have not changed.
+'''
+
+__author__  = ['Miguel Ramos Pernas']
+__email__   = ['miguel.ramos.pernas@cern.ch']
+
+
+# Python
+# ("hashlib" and "json" are imported in the functions using them, since
+# they are slow to import)
+import inspect
+import os
+import pickle
+import tempfile
+import warnings
+
+# Local
+from pyscripts.deps import dependencies
+from pyscripts.parsers import LazyMode, __callable_name__, _call_mode, _profile_options, process_args
+
+# Default directory to store the cached information
+__cache_path__ = os.path.join(os.environ.get('XDG_CACHE_HOME',
+                                             os.path.join(os.path.expanduser('~'), '.cache')),
+                              'pyscripts')
+
+# Default maximum size of the cache for results (in bytes)
+__cache_size__ = 1 << 30
+
+# Dependencies of the source files already processed
+_dependencies = {}
+
+
+__all__ = ['ResultCache', 'cached_call']
+
+
+class ResultCache(object):
+    '''
+    Persistent storage of results on disk.
+    Each result is pickled in a different file, whose name is given by its
+    key.
+    When the total size of the stored results exceeds "max_size", the least
+    recently used results are removed.
+
+    :param path: directory where to store the results.
+    :type path: str or None
+    :param max_size: maximum size of the cache (in bytes).
+    :type max_size: int
+    '''
+    def __init__( self, path = None, max_size = __cache_size__ ):
+        '''
+        Build the cache, creating the directory if needed.
+        '''
+        self.path     = path if path is not None else os.path.join(__cache_path__, 'results')
+        self.max_size = max_size
+
+        os.makedirs(self.path, exist_ok=True)
+
+    def _entries( self ):
+        '''
+        Get the paths, sizes and last access times of the stored results.
+
+        :returns: path, size and time of the last access of each result.
+        :rtype: list(tuple(str, int, float))
+        '''
+        entries = []
+        for f in os.listdir(self.path):
+            if f.endswith('.pkl'):
+                p = os.path.join(self.path, f)
+                try:
+                    st = os.stat(p)
+                except FileNotFoundError:
+                    continue  # removed by another process
+                entries.append((p, st.st_size, st.st_mtime))
+        return entries
+
+    def _file( self, key ):
+        '''
+        Path to the file storing the result with the given key.
+
+        :param key: key of the result.
+        :type key: str
+        :returns: path to the file.
+        :rtype: str
+        '''
+        return os.path.join(self.path, key + '.pkl')
+
+    def clear( self ):
+        '''
+        Remove all the results.
+        '''
+        for p, _, _ in self._entries():
+            os.remove(p)
+
+    def get( self, key ):
+        '''
+        Get the result associated to the given key.
+        Its time of last access is updated.
+
+        :param key: key of the result.
+        :type key: str
+        :returns: whether the result is found and the result (None if not \
+        found).
+        :rtype: tuple(bool, object)
+        '''
+        p = self._file(key)
+        try:
+            with open(p, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+
+        os.utime(p)
+
+        return True, value
+
+    def key( self, func, kwargs, pkg_name = None ):
+        '''
+        Calculate the key associated to the call of a function with the
+        given arguments.
+        It combines the arguments, the module and qualified name of the
+        function, its source code, the path and contents of the file where
+        it is defined and, if "pkg_name" is provided, the contents of the
+        files of the package that this file depends on.
+        Functions with the same source code in different modules or files
+        have therefore different keys, and modifying any part of the file
+        of the function invalidates its results.
+        Arguments that can be converted to JSON are hashed in this format,
+        and the rest are pickled, so the key depends on their full content
+        and not on their representation.
+
+        :param func: function to call.
+        :type func: callable
+        :param kwargs: arguments to the function.
+        :type kwargs: dict
+        :param pkg_name: name of the package to consider the dependencies.
+        :type pkg_name: str or None
+        :returns: key.
+        :rtype: str
+        :raises TypeError: if the arguments can not be serialized.
+
+        .. seealso:: :func:`pyscripts.dependencies`
+        '''
+        import hashlib
+        import json
+
+        if isinstance(func, LazyMode):
+            func = func.func
+
+        h = hashlib.sha256()
+
+        try:
+            h.update(b'json:' + json.dumps(kwargs, sort_keys=True).encode())
+        except (TypeError, ValueError):
+            try:
+                h.update(b'pickle:' + pickle.dumps(sorted(kwargs.items()), protocol=4))
+            except Exception as e:
+                raise TypeError('Unable to serialize the arguments: {}'.format(e))
+
+        h.update('{}:{}'.format(func.__module__, func.__qualname__).encode())
+
+        try:
+            h.update(inspect.getsource(func).encode())
+        except (OSError, TypeError):
+            pass
+
+        try:
+            pyfile = inspect.getsourcefile(func)
+        except TypeError:
+            pyfile = None
+
+        if pyfile is not None and os.path.isfile(pyfile):
+
+            pyfile = os.path.abspath(pyfile)
+
+            h.update(pyfile.encode())
+            with open(pyfile, 'rb') as f:
+                h.update(hashlib.sha256(f.read()).digest())
+
+        if pkg_name is not None and pyfile is not None:
+
+            for d in sorted(_file_dependencies(pyfile, pkg_name)):
+                h.update(d.encode())
+                with open(d, 'rb') as f:
+                    h.update(hashlib.sha256(f.read()).digest())
+
+        return h.hexdigest()
+
+    def put( self, key, value ):
+        '''
+        Store a result, removing the least recently used ones if the cache
+        exceeds its maximum size.
+
+        :param key: key of the result.
+        :type key: str
+        :param value: result to store. It must be picklable.
+        :type value: object
+        '''
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f)
+            os.replace(tmp, self._file(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+        self.evict()
+
+    @property
+    def size( self ):
+        '''
+        Total size of the stored results (in bytes).
+
+        :type: int
+        '''
+        return sum(s for _, s, _ in self._entries())
+
+    def evict( self ):
+        '''
+        Remove the least recently used results until the size of the cache
+        is below its maximum.
+        '''
+        entries = sorted(self._entries(), key=lambda e: e[2])
+
+        total = sum(s for _, s, _ in entries)
+
+        for p, s, _ in entries:
+
+            if total <= self.max_size:
+                break
+
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+            total -= s
+
+
+def cached_call( args, cache = None, drop = None, call_name = __callable_name__, pkg_name = None ):
+    '''
+    Same as :func:`pyscripts.call`, but returning the stored result if the
+    mode has already been called with the same arguments and its code has
+    not changed.
+
+    >>> args = parser.parse_args()
+    >>> result = cached_call(args, pkg_name='mypkg')
+
+    If the arguments can not be serialized to build the key, or the result
+    can not be stored (it is not picklable), a warning is displayed and
+    the cache is not used.
+
+    :param args: arguments obtained from the parser.
+    :type args: argparse.Namespace
+    :param cache: cache to use. By default a new :class:`ResultCache` \
+    object is created, in the default location.
+    :type cache: ResultCache or None
+    :param drop: values to drop.
+    :type drop: list(str) or None
+    :param call_name: name of the callable in the arguments.
+    :type call_name: str
+    :param pkg_name: name of the package whose files the mode depends on \
+    (see :meth:`ResultCache.key`).
+    :type pkg_name: str or None
+    :returns: whatever is returned in the callable call.
+
+    .. seealso:: :func:`pyscripts.call`
+    '''
+    cache = cache if cache is not None else ResultCache()
+
+    dct  = process_args(args, drop, call_name)
+    func = getattr(args, call_name)
+    prof = _profile_options(args)
+
+    try:
+        key = cache.key(func, dct, pkg_name)
+    except TypeError as e:
+        warnings.warn('Unable to cache the result of "{}": {}'.format(func.__name__, e), RuntimeWarning)
+        return _call_mode(func, dct, prof)
+
+    found, value = cache.get(key)
+    if found:
+        return value
+
+    value = _call_mode(func, dct, prof)
+
+    try:
+        cache.put(key, value)
+    except (pickle.PicklingError, TypeError, AttributeError) as e:
+        warnings.warn('Unable to store the result of "{}": {}'.format(func.__name__, e), RuntimeWarning)
+
+    return value
+
+
+def _file_dependencies( pyfile, pkg_name ):
+    '''
+    Get the absolute paths to the files of a package that the given file
+    depends on, including the file itself.
+    The dependencies are only calculated once per process.
+
+    :param pyfile: path to the python file.
+    :type pyfile: str
+    :param pkg_name: name of the package.
+    :type pkg_name: str
+    :returns: paths to the dependencies.
+    :rtype: set(str)
+    '''
+    pyfile = os.path.abspath(pyfile)
+
+    if (pyfile, pkg_name) not in _dependencies:
+        deps = set(dependencies(pyfile, pkg_name, abspath=True))
+        deps.add(pyfile)
+        _dependencies[pyfile, pkg_name] = deps
+
+    return _dependencies[pyfile, pkg_name]
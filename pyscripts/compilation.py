@@ -0,0 +1,171 @@
+'''
+Functions to compile the python files a script depends on before running
+it, so jobs do not need to compile them at startup.
+'''
+
+__author__  = ['Miguel Ramos Pernas']
+__email__   = ['miguel.ramos.pernas@cern.ch']
+
+
+# Python
+# ("argparse" and "py_compile" are imported in the functions using them)
+import functools
+import multiprocessing
+import os
+import sys
+
+# Local
+from pyscripts.deps import dependencies
+
+# Names of the invalidation modes of the compiled files, and of their
+# values in "py_compile.PycInvalidationMode" (only available since
+# Python 3.7, so it is accessed when compiling)
+__invalidation_modes__ = {'timestamp': 'TIMESTAMP',
+                          'checked-hash': 'CHECKED_HASH',
+                          'unchecked-hash': 'UNCHECKED_HASH'}
+
+
+__all__ = ['precompile', 'precompile_main']
+
+
+def precompile( pyfiles, pkg_name, processes = None, invalidation_mode = 'timestamp', pycache_prefix = None, optimize = -1, executor = None ):
+    '''
+    Compile the files of a package that the given python files depend on,
+    together with the "__init__.py" files of the packages containing them.
+    The files are compiled in parallel.
+    Scripts run as "__main__" are never loaded from compiled files, so the
+    given files are not compiled, unless they are dependencies of another.
+
+    >>> precompile(['fit.py', 'plot.py'], 'mypkg', invalidation_mode='checked-hash')
+
+    If "pycache_prefix" is provided, the compiled files are written to a
+    parallel tree in that directory instead of the "__pycache__"
+    directories (see :attr:`sys.pycache_prefix`).
+    The jobs must then run with the same prefix, setting the environment
+    variable "PYTHONPYCACHEPREFIX" or the "-X pycache_prefix" option.
+
+    :param pyfiles: paths to the python files.
+    :type pyfiles: collection(str)
+    :param pkg_name: name of the package.
+    :type pkg_name: str
+    :param processes: number of processes to compile the files.
+    :type processes: int or None
+    :param invalidation_mode: how the interpreter checks that the compiled \
+    files are up to date: "timestamp", "checked-hash" or "unchecked-hash".
+    :type invalidation_mode: str
+    :param pycache_prefix: directory where to write the compiled files.
+    :type pycache_prefix: str or None
+    :param optimize: optimization level (see :func:`compile`).
+    :type optimize: int
+    :param executor: executor to resolve the dependencies (see \
+    :func:`pyscripts.dependencies`).
+    :type executor: LocalExecutor, RemoteExecutor or None
+    :returns: paths to the compiled files.
+    :rtype: list(str)
+    :raises ValueError: if the invalidation mode is unknown.
+    :raises RuntimeError: if the invalidation mode or the prefix for the \
+    compiled files are not supported by the interpreter (hash-based files \
+    require Python 3.7 and "pycache_prefix" Python 3.8).
+    :raises py_compile.PyCompileError: if a file fails to compile.
+    '''
+    import py_compile
+
+    if invalidation_mode not in __invalidation_modes__:
+        raise ValueError('Unknown invalidation mode "{}"; choose between '\
+                         '{}'.format(invalidation_mode, list(__invalidation_modes__)))
+
+    if invalidation_mode != 'timestamp' and not hasattr(py_compile, 'PycInvalidationMode'):
+        raise RuntimeError('Invalidation mode "{}" requires Python 3.7 or '\
+                           'later'.format(invalidation_mode))
+
+    if pycache_prefix is not None and not hasattr(sys, 'pycache_prefix'):
+        raise RuntimeError('Setting the prefix for the compiled files requires '\
+                           'Python 3.8 or later')
+
+    files = set()
+    for f in pyfiles:
+        files.update(dependencies(f, pkg_name, abspath=True, executor=executor))
+
+    # Add the "__init__.py" files of the packages
+    for f in list(files):
+        d = os.path.dirname(f)
+        while os.path.isfile(os.path.join(d, '__init__.py')):
+            files.add(os.path.join(d, '__init__.py'))
+            d = os.path.dirname(d)
+
+    bound = functools.partial(_compile, invalidation_mode=invalidation_mode,
+                              pycache_prefix=pycache_prefix, optimize=optimize)
+
+    with multiprocessing.Pool(processes) as pool:
+        return pool.map(bound, sorted(files))
+
+
+def precompile_main( argv = None ):
+    '''
+    Entry point of the "pyscripts-precompile" command, which calls
+    :func:`precompile`:
+
+    .. code-block:: bash
+
+       pyscripts-precompile --package mypkg --invalidation-mode checked-hash fit.py plot.py
+
+    :param argv: arguments of the command. By default they are taken from \
+    :attr:`sys.argv`.
+    :type argv: list(str) or None
+    :returns: exit code.
+    :rtype: int
+    '''
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='pyscripts-precompile',
+                                     description='Compile the files of a package the given scripts depend on')
+    parser.add_argument('pyfiles', nargs='+',
+                        help='Paths to the python files')
+    parser.add_argument('--package', type=str, required=True,
+                        help='Name of the package')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Number of processes to use')
+    parser.add_argument('--invalidation-mode', choices=list(__invalidation_modes__),
+                        default='timestamp',
+                        help='How to check that the compiled files are up to date')
+    parser.add_argument('--pycache-prefix', type=str, default=None,
+                        help='Directory where to write the compiled files')
+    parser.add_argument('--optimize', type=int, default=-1,
+                        help='Optimization level')
+
+    args = parser.parse_args(argv)
+
+    compiled = precompile(args.pyfiles, args.package, args.processes,
+                          args.invalidation_mode, args.pycache_prefix, args.optimize)
+
+    sys.stdout.write('Compiled {} files\n'.format(len(compiled)))
+
+    return 0
+
+
+def _compile( path, invalidation_mode, pycache_prefix, optimize ):
+    '''
+    Compile a python file.
+
+    :param path: path to the file.
+    :type path: str
+    :param invalidation_mode: name of the invalidation mode.
+    :type invalidation_mode: str
+    :param pycache_prefix: directory where to write the compiled file.
+    :type pycache_prefix: str or None
+    :param optimize: optimization level.
+    :type optimize: int
+    :returns: path to the compiled file.
+    :rtype: str
+    '''
+    import py_compile
+
+    if pycache_prefix is not None:
+        sys.pycache_prefix = os.path.abspath(pycache_prefix)
+
+    if invalidation_mode == 'timestamp' and not hasattr(py_compile, 'PycInvalidationMode'):
+        return py_compile.compile(path, doraise=True, optimize=optimize)
+
+    mode = getattr(py_compile.PycInvalidationMode, __invalidation_modes__[invalidation_mode])
+
+    return py_compile.compile(path, doraise=True, optimize=optimize, invalidation_mode=mode)
@@ -0,0 +1,312 @@
+'''
+Functions to complete the command line arguments of the scripts without
+importing them.
+The structure of the parser of a script (modes, options and choices) is
+stored in a cache file, which is used to answer the completion requests.
+'''
+
+__author__  = ['Miguel Ramos Pernas']
+__email__   = ['miguel.ramos.pernas@cern.ch']
+
+
+# Python
+# (most modules are imported in the functions using them, since the
+# completion must be fast)
+import os
+import sys
+import tempfile
+
+# Local
+from pyscripts.cache import __cache_path__
+
+# Environment variable used to request the structure of the parser
+__dump_env__ = 'PYSCRIPTS_COMPLETION_DUMP'
+
+# Template of the bash function to complete the arguments of a script (the
+# path to the script and the command must be quoted)
+_bash_template = \
+'''_pyscripts_complete_{name}() {{
+    local IFS=$'\\n'
+    COMPREPLY=( $(pyscripts-complete --script {script} --cword $((COMP_CWORD - 1)) -- "${{COMP_WORDS[@]:1}}") )
+}}
+complete -o default -F _pyscripts_complete_{name} {command}
+'''
+
+
+__all__ = ['autocomplete', 'complete', 'complete_main']
+
+
+def autocomplete( parser ):
+    '''
+    Enable the completion of the arguments of a script.
+    This function must be called once the parser is completely defined,
+    and before parsing the arguments:
+
+    >>> parser = argparse.ArgumentParser()
+    >>> define_modes(parser, ['mypkg.fits:run_fit', 'mypkg.plots:plot'])
+    >>> autocomplete(parser)
+    >>> args = parser.parse_args()
+
+    When the script is run to build the cache of :func:`complete`, the
+    structure of the parser is saved and the process exits.
+    Otherwise this function does nothing.
+
+    :param parser: parser of the script.
+    :type parser: argparse.ArgumentParser
+
+    .. seealso:: :func:`complete`
+    '''
+    import json
+
+    path = os.environ.get(__dump_env__)
+
+    if path is None:
+        return
+
+    with open(path, 'w') as f:
+        json.dump(_parser_structure(parser), f)
+
+    sys.exit(0)
+
+
+def complete( script, words, cword = None, cache_path = None ):
+    '''
+    Get the candidates to complete the arguments of a script.
+    The structure of the parser is read from a cache file, whose name is
+    given by the hash of the script.
+    If the file does not exist, the script is run once to create it (it
+    must call :func:`autocomplete`).
+    Later calls do not need to import the script nor its dependencies.
+
+    :param script: path to the script.
+    :type script: str
+    :param words: arguments of the command line (without the script).
+    :type words: list(str)
+    :param cword: index of the argument to complete. By default it is the \
+    last one.
+    :type cword: int or None
+    :param cache_path: directory where to store the cache files.
+    :type cache_path: str or None
+    :returns: candidates to complete the argument.
+    :rtype: list(str)
+
+    .. seealso:: :func:`autocomplete`, :func:`complete_main`
+    '''
+    cword = cword if cword is not None else len(words) - 1
+
+    structure = _load_structure(script, cache_path)
+
+    prefix = words[cword] if 0 <= cword < len(words) else ''
+
+    # Walk the previous arguments, keeping track of the option waiting for
+    # values and the number of positional arguments
+    option, remaining = None, 0
+    npos = 0
+    for w in words[:cword]:
+
+        if remaining != 0 and not w.startswith('-'):
+            remaining -= 1
+            continue
+
+        remaining = 0
+
+        if w.startswith('-'):
+            opt = _find_option(structure, w)
+            if opt is not None:
+                option, remaining = opt, _number_of_values(opt['nargs'])
+        elif w in structure['subcommands']:
+            structure = structure['subcommands'][w]
+            npos = 0
+        else:
+            npos += 1
+
+    if remaining != 0 and not prefix.startswith('-'):
+        candidates = option['choices'] or []
+    elif prefix.startswith('-'):
+        candidates = [f for o in structure['options'] for f in o['flags']]
+    else:
+        candidates = list(structure['subcommands'])
+        if npos < len(structure['positionals']):
+            candidates += structure['positionals'][npos]['choices'] or []
+
+    return sorted(c for c in candidates if c.startswith(prefix))
+
+
+def complete_main( argv = None ):
+    '''
+    Entry point of the "pyscripts-complete" command.
+    It displays the candidates to complete the arguments of a script, one
+    per line, or the code to register the completion function in bash:
+
+    .. code-block:: bash
+
+       eval "$(pyscripts-complete --script path/to/script.py --bash)"
+
+    :param argv: arguments of the command. By default they are taken from \
+    :attr:`sys.argv`.
+    :type argv: list(str) or None
+    :returns: exit code.
+    :rtype: int
+
+    .. seealso:: :func:`complete`
+    '''
+    import argparse
+    import hashlib
+    import shlex
+
+    parser = argparse.ArgumentParser(prog='pyscripts-complete',
+                                     description='Complete the arguments of a script')
+    parser.add_argument('--script', type=str, required=True,
+                        help='Path to the script')
+    parser.add_argument('--cword', type=int, default=None,
+                        help='Index of the argument to complete')
+    parser.add_argument('--bash', action='store_true',
+                        help='Display the code to register the completion in bash')
+    parser.add_argument('--command', type=str, default=None,
+                        help='Name of the command to complete in bash. By '\
+                        'default it is the name of the script.')
+    parser.add_argument('words', nargs='*',
+                        help='Arguments of the command line')
+
+    args = parser.parse_args(argv)
+
+    if args.bash:
+        script  = os.path.abspath(args.script)
+        command = args.command if args.command is not None else os.path.basename(script)
+        name    = hashlib.sha1(command.encode()).hexdigest()[:12]
+        sys.stdout.write(_bash_template.format(name=name, script=shlex.quote(script),
+                                               command=shlex.quote(command)))
+        return 0
+
+    try:
+        candidates = complete(args.script, args.words, args.cword)
+    except Exception:
+        return 1
+
+    for c in candidates:
+        sys.stdout.write(c + '\n')
+
+    return 0
+
+
+def _find_option( structure, flag ):
+    '''
+    Find the option with the given flag.
+
+    :param structure: structure of the parser.
+    :type structure: dict
+    :param flag: flag of the option.
+    :type flag: str
+    :returns: option, if found.
+    :rtype: dict or None
+    '''
+    for o in structure['options']:
+        if flag in o['flags']:
+            return o
+    return None
+
+
+def _load_structure( script, cache_path = None ):
+    '''
+    Load the structure of the parser of a script from the cache, running
+    the script to create it if needed.
+
+    :param script: path to the script.
+    :type script: str
+    :param cache_path: directory where to store the cache files.
+    :type cache_path: str or None
+    :returns: structure of the parser.
+    :rtype: dict
+    :raises RuntimeError: if the script fails to dump the structure of its \
+    parser.
+    '''
+    import hashlib
+    import json
+    import subprocess
+
+    cache_path = cache_path if cache_path is not None else os.path.join(__cache_path__, 'completion')
+
+    with open(script, 'rb') as f:
+        key = hashlib.sha256(f.read()).hexdigest()
+
+    path = os.path.join(cache_path, key + '.json')
+
+    if not os.path.exists(path):
+
+        os.makedirs(cache_path, exist_ok=True)
+
+        fd, tmp = tempfile.mkstemp(dir=cache_path, suffix='.tmp')
+        os.close(fd)
+
+        try:
+            env = dict(os.environ)
+            env[__dump_env__] = tmp
+
+            subprocess.run([sys.executable, script], env=env,
+                           stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL)
+
+            if os.path.getsize(tmp) == 0:
+                raise RuntimeError('Script "{}" did not dump the structure of its parser; '\
+                                   'make sure it calls "pyscripts.autocomplete"'.format(script))
+
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def _number_of_values( nargs ):
+    '''
+    Number of values taken by an option, with -1 meaning any.
+
+    :param nargs: number of arguments of the option.
+    :type nargs: int, str or None
+    :returns: number of values.
+    :rtype: int
+    '''
+    import argparse
+
+    if nargs is None:
+        return 1
+    elif isinstance(nargs, int):
+        return nargs
+    elif nargs == argparse.OPTIONAL:
+        return 1
+    else:
+        return -1
+
+
+def _parser_structure( parser ):
+    '''
+    Get the structure of a parser: options, positional arguments and
+    subcommands, with their choices.
+
+    :param parser: parser to process.
+    :type parser: argparse.ArgumentParser
+    :returns: structure of the parser.
+    :rtype: dict
+    '''
+    import argparse
+
+    structure = {'options': [], 'positionals': [], 'subcommands': {}}
+
+    for action in parser._actions:
+
+        choices = list(map(str, action.choices)) if action.choices is not None else None
+
+        if isinstance(action, argparse._SubParsersAction):
+            for name, p in action.choices.items():
+                structure['subcommands'][name] = _parser_structure(p)
+        elif action.option_strings:
+            structure['options'].append({'flags': list(action.option_strings),
+                                         'nargs': action.nargs,
+                                         'choices': choices})
+        else:
+            structure['positionals'].append({'nargs': action.nargs,
+                                             'choices': choices})
+
+    return structure
@@ -0,0 +1,401 @@
+'''
+Functions to run the modes of a script from a server process, which keeps
+the modules of the script imported between invocations.
+'''
+
+__author__  = ['Miguel Ramos Pernas']
+__email__   = ['miguel.ramos.pernas@cern.ch']
+
+
+# Python
+# ("argparse" and "json" are imported in the functions using them, to
+# keep the import of the package fast)
+import errno
+import io
+import os
+import selectors
+import signal
+import socket
+import stat
+import struct
+import sys
+
+# Local
+from pyscripts.parsers import __callable_name__, call
+from pyscripts.processes import fork_call, wait_process
+
+# Header of the messages: type and length of the payload
+_header = struct.Struct('!BI')
+
+# Types of messages
+_REQUEST, _STDOUT, _STDERR, _EXIT = range(4)
+
+# Environment variable with the default address of the server
+__socket_env__ = 'PYSCRIPTS_SOCKET'
+
+
+__all__ = ['client', 'client_main', 'serve']
+
+
+def client( address, argv, cwd = None, env = None, stdout = None, stderr = None ):
+    '''
+    Run a mode on a server started with :func:`serve`.
+    The standard output and error of the mode are written to the given
+    streams as they are received.
+
+    :param address: path to the Unix domain socket of the server.
+    :type address: str
+    :param argv: arguments to parse.
+    :type argv: list(str)
+    :param cwd: working directory. By default it is the current one.
+    :type cwd: str or None
+    :param env: environment variables. By default they are those of the \
+    current process.
+    :type env: dict or None
+    :param stdout: binary stream where to write the standard output. By \
+    default it is the buffer of :attr:`sys.stdout`.
+    :type stdout: file or None
+    :param stderr: binary stream where to write the standard error. By \
+    default it is the buffer of :attr:`sys.stderr`.
+    :type stderr: file or None
+    :returns: exit code of the mode (the signal number with negative sign \
+    if it was killed by a signal).
+    :rtype: int
+
+    .. seealso:: :func:`client_main`, :func:`serve`
+    '''
+    import json
+
+    stdout = stdout if stdout is not None else sys.stdout.buffer
+    stderr = stderr if stderr is not None else sys.stderr.buffer
+
+    request = {'argv': list(argv),
+               'cwd': cwd if cwd is not None else os.getcwd(),
+               'env': dict(env if env is not None else os.environ)}
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+
+        sock.connect(address)
+
+        _send(sock, _REQUEST, json.dumps(request).encode())
+
+        while True:
+
+            tp, payload = _recv(sock)
+
+            if tp == _EXIT:
+                return struct.unpack('!i', payload)[0]
+
+            stream = stdout if tp == _STDOUT else stderr
+            stream.write(payload)
+            stream.flush()
+
+
+def client_main( argv = None ):
+    '''
+    Entry point of the "pyscripts-client" command, a replacement of
+    "python script.py ..." that runs the script on a server:
+
+    .. code-block:: bash
+
+       pyscripts-client --socket /tmp/script.sock mode --option value
+
+    The socket can also be set through the "PYSCRIPTS_SOCKET" environment
+    variable.
+
+    :param argv: arguments of the command. By default they are taken from \
+    :attr:`sys.argv`.
+    :type argv: list(str) or None
+    :returns: exit code, following the convention of the shell for \
+    processes killed by a signal.
+    :rtype: int
+
+    .. seealso:: :func:`client`
+    '''
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='pyscripts-client',
+                                     description='Run a script on a server started with "pyscripts.serve"')
+    parser.add_argument('--socket', type=str, default=os.environ.get(__socket_env__),
+                        help='Path to the socket of the server')
+    parser.add_argument('args', nargs=argparse.REMAINDER,
+                        help='Arguments to the script')
+
+    args = parser.parse_args(argv)
+
+    if args.socket is None:
+        parser.error('The socket must be specified with "--socket" or '\
+                     'through the "{}" environment variable'.format(__socket_env__))
+
+    code = client(args.socket, args.args)
+
+    return code if code >= 0 else 128 - code
+
+
+def serve( parser, address, drop = None, call_name = __callable_name__ ):
+    '''
+    Serve the modes of a parser through a Unix domain socket.
+    The modules of the script are imported only once, and each request is
+    run on a child process forked from the server.
+    Requests contain the arguments to parse, the working directory and the
+    environment variables; the standard output and error of the mode are
+    sent back to the client as they are produced, followed by the exit code.
+    The standard input of the mode is not forwarded.
+    A script can be turned into a server with
+
+    >>> if __name__ == '__main__':
+    >>>     parser = argparse.ArgumentParser()
+    >>>     define_modes(parser, [fit, plot])
+    >>>     if os.environ.get('PYSCRIPTS_SERVE'):
+    >>>         serve(parser, os.environ['PYSCRIPTS_SERVE'])
+    >>>     else:
+    >>>         call(parser.parse_args())
+
+    The server runs until it is interrupted or terminated (SIGTERM), and
+    then removes the socket file it created.
+    A socket file left by a server that is no longer running is replaced,
+    but starting a server on the address of a running one fails.
+
+    :param parser: parser with the modes defined by \
+    :func:`pyscripts.define_modes`.
+    :type parser: argparse.ArgumentParser
+    :param address: path to the Unix domain socket to create.
+    :type address: str
+    :param drop: values to drop (see :func:`pyscripts.process_args`).
+    :type drop: list(str) or None
+    :param call_name: name of the callable in the arguments.
+    :type call_name: str
+    :raises OSError: if a server is already listening on the address.
+
+    .. seealso:: :func:`client`
+    '''
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        _remove_stale_socket(address)
+        sock.bind(address)
+    except BaseException:
+        sock.close()
+        raise
+
+    # Identify the socket file, so only the one bound here is removed
+    bound = os.stat(address)
+
+    # Children handling connections are reaped automatically
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    # Terminating the server also removes the socket file
+    sigterm = signal.signal(signal.SIGTERM, _terminate)
+
+    try:
+        sock.listen()
+
+        while True:
+
+            conn, _ = sock.accept()
+
+            fork_call(_handle_connection, sock, conn, parser, drop, call_name)
+
+            conn.close()
+
+    finally:
+        signal.signal(signal.SIGTERM, sigterm)
+        sock.close()
+        try:
+            if os.path.samestat(os.stat(address), bound):
+                os.remove(address)
+        except FileNotFoundError:
+            pass
+
+
+def _handle_connection( sock, conn, parser, drop, call_name ):
+    '''
+    Handle a request to the server, running the mode on a new process and
+    sending the output and the exit code to the client.
+    This function is called on a process forked from the server.
+
+    :param sock: socket of the server, which is closed.
+    :type sock: socket.socket
+    :param conn: connection with the client.
+    :type conn: socket.socket
+    :param parser: parser with the modes.
+    :type parser: argparse.ArgumentParser
+    :param drop: values to drop.
+    :type drop: list(str) or None
+    :param call_name: name of the callable in the arguments.
+    :type call_name: str
+    '''
+    import json
+
+    sock.close()
+
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    try:
+        tp, payload = _recv(conn)
+    except ConnectionError:
+        # Connections closed without a request (e.g. from a server checking
+        # whether this one is alive)
+        return 0
+
+    request = json.loads(payload.decode())
+
+    pipes = {_STDOUT: os.pipe(), _STDERR: os.pipe()}
+
+    pid = fork_call(_run_request, conn, request, pipes[_STDOUT][1], pipes[_STDERR][1],
+                    parser, drop, call_name)
+
+    sel = selectors.DefaultSelector()
+    for t, (r, w) in pipes.items():
+        os.close(w)
+        sel.register(r, selectors.EVENT_READ, t)
+
+    nopen = len(pipes)
+    while nopen:
+        for key, _ in sel.select():
+            data = os.read(key.fd, 1 << 16)
+            if data:
+                _send(conn, key.data, data)
+            else:
+                sel.unregister(key.fd)
+                os.close(key.fd)
+                nopen -= 1
+
+    _send(conn, _EXIT, struct.pack('!i', wait_process(pid)))
+
+    conn.close()
+
+
+def _recv( sock ):
+    '''
+    Receive a message.
+
+    :param sock: socket to read from.
+    :type sock: socket.socket
+    :returns: type and payload of the message.
+    :rtype: tuple(int, bytes)
+    :raises ConnectionError: if the connection is closed before receiving \
+    the full message.
+    '''
+    tp, size = _header.unpack(_recv_exactly(sock, _header.size))
+    return tp, _recv_exactly(sock, size)
+
+
+def _recv_exactly( sock, size ):
+    '''
+    Receive the given number of bytes.
+
+    :param sock: socket to read from.
+    :type sock: socket.socket
+    :param size: number of bytes to read.
+    :type size: int
+    :returns: data.
+    :rtype: bytes
+    :raises ConnectionError: if the connection is closed before receiving \
+    all the data.
+    '''
+    data = bytearray()
+    while len(data) < size:
+        c = sock.recv(size - len(data))
+        if not c:
+            raise ConnectionError('Connection closed by the peer')
+        data += c
+    return bytes(data)
+
+
+def _remove_stale_socket( address ):
+    '''
+    Remove the socket file of a server that is no longer running.
+    Other files are left untouched.
+
+    :param address: path to the Unix domain socket.
+    :type address: str
+    :raises OSError: if a server is listening on the given address.
+    '''
+    try:
+        if not stat.S_ISSOCK(os.stat(address).st_mode):
+            return
+    except FileNotFoundError:
+        return
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(address)
+    except ConnectionRefusedError:
+        os.remove(address)
+        return
+    finally:
+        probe.close()
+
+    raise OSError(errno.EADDRINUSE, 'A server is already listening on "{}"'.format(address))
+
+
+def _run_request( conn, request, stdout_fd, stderr_fd, parser, drop, call_name ):
+    '''
+    Run the mode of a request, sending the output to the given file
+    descriptors.
+    This function is called on a process forked from the one handling the
+    connection, which is closed.
+
+    :param conn: connection with the client.
+    :type conn: socket.socket
+    :param request: arguments, working directory and environment.
+    :type request: dict
+    :param stdout_fd: file descriptor for the standard output.
+    :type stdout_fd: int
+    :param stderr_fd: file descriptor for the standard error.
+    :type stderr_fd: int
+    :param parser: parser with the modes.
+    :type parser: argparse.ArgumentParser
+    :param drop: values to drop.
+    :type drop: list(str) or None
+    :param call_name: name of the callable in the arguments.
+    :type call_name: str
+    '''
+    conn.close()
+
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(stdout_fd, 1)
+    os.dup2(stderr_fd, 2)
+
+    sys.stdout = io.TextIOWrapper(io.FileIO(1, 'wb', closefd=False))
+    sys.stderr = io.TextIOWrapper(io.FileIO(2, 'wb', closefd=False),
+                                  line_buffering=True)
+
+    os.chdir(request['cwd'])
+
+    os.environ.clear()
+    os.environ.update(request['env'])
+
+    sys.argv = sys.argv[:1] + request['argv']
+
+    call(parser.parse_args(request['argv']), drop, call_name)
+
+
+def _send( sock, tp, payload ):
+    '''
+    Send a message.
+
+    :param sock: socket to write to.
+    :type sock: socket.socket
+    :param tp: type of message.
+    :type tp: int
+    :param payload: content of the message.
+    :type payload: bytes
+    '''
+    sock.sendall(_header.pack(tp, len(payload)) + payload)
+
+
+def _terminate( signum, frame ):
+    '''
+    Handle the termination signal of the server, exiting so the socket file
+    is removed.
+
+    :param signum: signal number.
+    :type signum: int
+    :param frame: current stack frame.
+    :type frame: frame
+    '''
+    raise SystemExit(128 + signum)
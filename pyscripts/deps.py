@@ -25,7 +25,7 @@ __pool_size__ = 4
 __all__ = ['dependencies', 'direct_dependencies']
 
 
-def dependencies( pyfile, pkg_name, abspath = False, pool_size = __pool_size__ ):
+def dependencies( pyfile, pkg_name, abspath = False, pool_size = __pool_size__, executor = None ):
     '''
     Return the dependencies on a package for a given python file.
     Dependencies are acquired on a different process, so it does
@@ -41,35 +41,50 @@ def dependencies( pyfile, pkg_name, abspath = False, pool_size = __pool_size__ )
     :param pool_size: parameter to control the amount of processes \
     to create.
     :type pool_size: int
+    :param executor: executor to process the files (see \
+    :class:`pyscripts.LocalExecutor` and :class:`pyscripts.RemoteExecutor`). \
+    If provided, "pool_size" is ignored.
+    :type executor: LocalExecutor, RemoteExecutor or None
     :returns: list with the paths to the files whom the provided file \
     depends on.
     :rtype: list(str)
 
     .. seealso:: :func:`direct_dependencies`
     '''
-    parent, child = multiprocessing.Pipe()
+    bound = functools.partial(direct_dependencies,
+                              pkg_name=pkg_name, abspath=True)
 
-    process = multiprocessing.Process(target=_parallelize_deps,
-                                      args=(pyfile, pkg_name, True, child))
+    if executor is None:
 
-    process.start()
-    deps = set(parent.recv())
-    process.join()
+        parent, child = multiprocessing.Pipe()
 
-    # Now get the dependencies of each of the submodules
-    pool = multiprocessing.Pool(processes=pool_size)
+        process = multiprocessing.Process(target=_parallelize_deps,
+                                          args=(pyfile, pkg_name, True, child))
+
+        process.start()
+        deps = set(parent.recv())
+        process.join()
 
-    diff = deps
-    while diff:
+        pool = multiprocessing.Pool(processes=pool_size)
+    else:
+        deps = set(executor.map(bound, [pyfile])[0])
 
-        bound = functools.partial(direct_dependencies,
-                                  pkg_name=pkg_name, abspath=True)
+        pool = executor
+
+    # Now get the dependencies of each of the submodules
+    try:
+        diff = deps
+        while diff:
 
-        new_deps = set(itertools.chain.from_iterable(pool.map(bound, diff)))
+            new_deps = set(itertools.chain.from_iterable(pool.map(bound, diff)))
 
-        diff = new_deps - deps
+            diff = new_deps - deps
 
-        deps.update(diff)
+            deps.update(diff)
+    finally:
+        if executor is None:
+            pool.close()
+            pool.join()
 
     if not abspath:
 
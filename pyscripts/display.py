@@ -8,16 +8,31 @@ __email__   = ['miguel.ramos.pernas@cern.ch']
 
 
 # Python
+# ("json" and "queue" are only needed by some functions, which import them)
+import array
 import ctypes
 import functools
 import io
+import multiprocessing
 import os
 import sys
 import tempfile
+import threading
+import time
 from contextlib import contextmanager
 
+# Local
+from pyscripts.processes import flush_c_stdout, flush_streams
 
-__all__ = ['stdout_redirector']
+
+__all__ = ['RedirectedPool', 'TimestampedLines', 'stdout_redirector', 'timestamped_stdout_redirector']
+
+# Temporary file where the output of a worker of a RedirectedPool is sent
+_worker_capture = None
+
+# Buffering modes of the C streams (full and line buffering), from "stdio.h"
+_IOFBF = 0
+_IOLBF = 1
 
 
 def decorate( deco ):
@@ -45,6 +60,273 @@ def decorate( deco ):
     return _wrapper
 
 
+class RedirectedPool(object):
+    '''
+    Pool of processes capturing the output of each task.
+    The standard output of each worker (and optionally the standard error)
+    is redirected, at the file descriptor level, to a temporary file owned
+    by the worker.
+    The output produced while running a task is sent back to the parent
+    process together with its result, so it can be processed in order and
+    without mixing the output of different workers:
+
+    >>> with RedirectedPool(4) as pool:
+    >>>     for task_id, result, output in pool.imap(func, items):
+    >>>         print(task_id, output.decode())
+
+    The captured output travels with the results, so the number of messages
+    exchanged depends on the number of chunks of tasks, and not on the
+    number of workers.
+    The exceptions raised by a task carry its captured output in the
+    "output" attribute (and its identifier in "task_id"), so it is not lost
+    when the task fails.
+
+    :param processes: number of worker processes.
+    :type processes: int or None
+    :param stderr: whether to capture also the standard error, which is \
+    merged with the standard output.
+    :type stderr: bool
+    :param context: multiprocessing context to use.
+    :type context: multiprocessing.context.BaseContext or None
+    '''
+    def __init__( self, processes = None, stderr = False, context = None ):
+        '''
+        Build the pool of processes.
+        '''
+        context = context if context is not None else multiprocessing
+
+        self._pool = context.Pool(processes,
+                                  initializer=_init_redirected_worker,
+                                  initargs=(stderr,))
+
+    def __enter__( self ):
+        '''
+        Enter the context, returning this object.
+        '''
+        return self
+
+    def __exit__( self, *args ):
+        '''
+        Terminate the pool of processes.
+        '''
+        self._pool.terminate()
+        self._pool.join()
+
+    def close( self ):
+        '''
+        Prevent any more tasks to be submitted and wait for the workers
+        to finish.
+        '''
+        self._pool.close()
+        self._pool.join()
+
+    def imap( self, func, iterable, chunksize = 1, return_exceptions = False ):
+        '''
+        Apply "func" to each element in "iterable", yielding the task
+        identifier (its position in "iterable"), the result and the captured
+        output of each task, in order.
+        Tasks are sent to (and received from) the workers in chunks of
+        size "chunksize".
+
+        :param func: function to call.
+        :type func: callable
+        :param iterable: values to process.
+        :type iterable: iterable
+        :param chunksize: number of tasks sent to a worker at once.
+        :type chunksize: int
+        :param return_exceptions: if set to True, the exceptions raised by \
+        "func" are returned as the result of the task, instead of being \
+        raised (which stops the iteration).
+        :type return_exceptions: bool
+        :returns: task identifier, result and captured output.
+        :rtype: generator(tuple(int, object, bytes))
+        '''
+        bound = functools.partial(_call_redirected, func, return_exceptions)
+
+        return self._pool.imap(bound, enumerate(iterable), chunksize)
+
+    def imap_unordered( self, func, iterable, chunksize = 1, return_exceptions = False ):
+        '''
+        Same as :meth:`RedirectedPool.imap`, but yielding the tasks as soon as
+        they finish.
+
+        :param func: function to call.
+        :type func: callable
+        :param iterable: values to process.
+        :type iterable: iterable
+        :param chunksize: number of tasks sent to a worker at once.
+        :type chunksize: int
+        :param return_exceptions: if set to True, the exceptions raised by \
+        "func" are returned as the result of the task, instead of being \
+        raised (which stops the iteration).
+        :type return_exceptions: bool
+        :returns: task identifier, result and captured output.
+        :rtype: generator(tuple(int, object, bytes))
+        '''
+        bound = functools.partial(_call_redirected, func, return_exceptions)
+
+        return self._pool.imap_unordered(bound, enumerate(iterable), chunksize)
+
+    def map( self, func, iterable, chunksize = 1, return_exceptions = False ):
+        '''
+        Same as :meth:`RedirectedPool.imap`, but returning a list.
+
+        :param func: function to call.
+        :type func: callable
+        :param iterable: values to process.
+        :type iterable: iterable
+        :param chunksize: number of tasks sent to a worker at once.
+        :type chunksize: int
+        :param return_exceptions: if set to True, the exceptions raised by \
+        "func" are returned as the result of the task, instead of being \
+        raised (which stops the iteration).
+        :type return_exceptions: bool
+        :returns: task identifier, result and captured output of each task.
+        :rtype: list(tuple(int, object, bytes))
+        '''
+        return list(self.imap(func, iterable, chunksize, return_exceptions))
+
+
+class TimestampedLines(object):
+    '''
+    Collection of lines captured from a stream, together with the time at
+    which they were received.
+    The lines are stored in a compact way: the raw data is kept in a single
+    buffer, and the offsets to the end of each line and the timestamps are
+    stored in parallel arrays.
+    The timestamps are obtained from :func:`time.monotonic`, so they can be
+    compared with timings measured in the Python side using the same clock.
+    Accessing a line returns a tuple with its timestamp and its content:
+
+    >>> with timestamped_stdout_redirector() as lines:
+    >>>     print('Hello')
+    >>> lines[0]
+    (1514.3417, b'Hello\\n')
+    '''
+    def __init__( self ):
+        '''
+        Build the (empty) collection.
+        '''
+        self.data       = bytearray()
+        self.ends       = array.array('Q')
+        self.timestamps = array.array('d')
+
+    def __getitem__( self, i ):
+        '''
+        Get the timestamp and the content of the given line.
+
+        :param i: index of the line.
+        :type i: int
+        :returns: timestamp and content of the line.
+        :rtype: tuple(float, bytes)
+        '''
+        if i < 0:
+            i += len(self)
+
+        start = self.ends[i - 1] if i > 0 else 0
+
+        return self.timestamps[i], bytes(self.data[start:self.ends[i]])
+
+    def __iter__( self ):
+        '''
+        Iterate over the timestamps and contents of the lines.
+        '''
+        for i in range(len(self)):
+            yield self[i]
+
+    def __len__( self ):
+        '''
+        Number of complete lines.
+        '''
+        return len(self.ends)
+
+    def append( self, data, timestamp = None ):
+        '''
+        Append a chunk of data, registering a new line for each end-of-line
+        character found in it.
+        All the lines completed in this chunk get the same timestamp.
+
+        :param data: chunk of data.
+        :type data: bytes
+        :param timestamp: time at which the data was received. If None, \
+        :func:`time.monotonic` is used.
+        :type timestamp: float or None
+        :returns: number of lines completed by this chunk.
+        :rtype: int
+        '''
+        timestamp = timestamp if timestamp is not None else time.monotonic()
+
+        offset = len(self.data)
+
+        self.data += data
+
+        n = 0
+
+        idx = data.find(b'\n')
+        while idx >= 0:
+            self.ends.append(offset + idx + 1)
+            self.timestamps.append(timestamp)
+            n += 1
+            idx = data.find(b'\n', idx + 1)
+
+        return n
+
+    def close( self, timestamp = None ):
+        '''
+        Register the remaining data (not ended by an end-of-line
+        character) as a new line.
+
+        :param timestamp: time at which the data was received. If None, \
+        :func:`time.monotonic` is used.
+        :type timestamp: float or None
+        :returns: number of lines completed.
+        :rtype: int
+        '''
+        last = self.ends[-1] if len(self.ends) else 0
+
+        if len(self.data) == last:
+            return 0
+
+        timestamp = timestamp if timestamp is not None else time.monotonic()
+
+        self.ends.append(len(self.data))
+        self.timestamps.append(timestamp)
+
+        return 1
+
+    def to_jsonl( self, path, start = 0, stop = None, mode = 'w' ):
+        '''
+        Export the lines to a file in the JSON Lines format.
+        Each entry contains the index of the line, its timestamp and its
+        content (decoded as UTF-8, without the end-of-line character).
+
+        :param path: path to the output file or file object.
+        :type path: str or file
+        :param start: first line to export.
+        :type start: int
+        :param stop: end of the range of lines to export. If None, all the \
+        lines are exported.
+        :type stop: int or None
+        :param mode: mode to open the file.
+        :type mode: str
+        '''
+        import json
+
+        stop = stop if stop is not None else len(self)
+
+        if isinstance(path, str):
+            with open(path, mode) as f:
+                self.to_jsonl(f, start, stop)
+            return
+
+        for i in range(start, stop):
+            t, l = self[i]
+            path.write(json.dumps({'index': i,
+                                   'timestamp': t,
+                                   'line': l.rstrip(b'\n').decode(errors='replace')}))
+            path.write('\n')
+
+
 @decorate(contextmanager)
 def stdout_redirector( stream = None ):
     '''
@@ -71,25 +353,6 @@ def stdout_redirector( stream = None ):
     # The original fd stdout points to
     original_stdout_fd = sys.stdout.fileno()
 
-    def _redirect_stdout( to_fd ):
-        '''
-        Redirect stdout to the given file descriptor.
-        '''
-        # Flush the C-level buffer stdout
-        libc = ctypes.CDLL(None)
-        c_stdout = ctypes.c_void_p.in_dll(libc, 'stdout')
-        libc.fflush(c_stdout)
-
-        # Flush and close sys.stdout - also closes the file descriptor (fd)
-        sys.stdout.close()
-
-        # Make original_stdout_fd point to the same file as to_fd
-        os.dup2(to_fd, original_stdout_fd)
-
-        # Create a new sys.stdout that points to the redirected fd
-        c = io.FileIO(original_stdout_fd, 'wb')
-        sys.stdout = io.TextIOWrapper(c)
-
     # Save a copy of the original stdout fd in saved_stdout_fd
     saved_stdout_fd = os.dup(original_stdout_fd)
 
@@ -97,11 +360,11 @@ def stdout_redirector( stream = None ):
 
         # Create a temporary file and redirect stdout to it
         tfile = tempfile.TemporaryFile(mode='w+b')
-        _redirect_stdout(tfile.fileno())
+        _redirect_stdout(tfile.fileno(), original_stdout_fd)
 
         # Yield to caller, then redirect stdout back to the saved fd
         yield stream
-        _redirect_stdout(saved_stdout_fd)
+        _redirect_stdout(saved_stdout_fd, original_stdout_fd)
 
         # Copy contents of temporary file to the given stream
         tfile.flush()
@@ -111,3 +374,291 @@ def stdout_redirector( stream = None ):
     finally:
         tfile.close()
         os.close(saved_stdout_fd)
+
+
+@decorate(contextmanager)
+def timestamped_stdout_redirector( jsonl = None ):
+    '''
+    Redirect stdout, splitting the output in lines and registering the
+    time at which each line is received.
+    The output is sent through a pipe to a thread that reads it, so the
+    timestamps correspond to the moment the data is flushed by the writer.
+    Both :attr:`sys.stdout` and the C-level stdout are set to flush the
+    data after each line during the capture (otherwise the C library would
+    buffer the output sent to the pipe), and the buffering of the latter is
+    restored afterwards.
+
+    >>> with timestamped_stdout_redirector('output.jsonl') as lines:
+    >>>     lib.run_fit()
+    >>> for t, l in lines:
+    >>>     print(t, l)
+
+    If "jsonl" is provided, the lines are exported to the given file in the
+    JSON Lines format by a background thread while they are being captured
+    (see :meth:`TimestampedLines.to_jsonl`).
+
+    :param jsonl: path to the file where the lines are exported.
+    :type jsonl: str or None
+    :returns: captured lines.
+    :rtype: TimestampedLines
+    '''
+    lines = TimestampedLines()
+
+    original_stdout_fd = sys.stdout.fileno()
+
+    saved_stdout_fd = os.dup(original_stdout_fd)
+
+    read_fd, write_fd = os.pipe()
+
+    if jsonl is not None:
+        writer = _JSONLinesWriter(lines, jsonl)
+        writer.start()
+    else:
+        writer = None
+
+    reader = threading.Thread(target=_read_lines, args=(read_fd, lines, writer))
+    reader.start()
+
+    try:
+        _redirect_stdout(write_fd, original_stdout_fd, line_buffering=True)
+
+        _set_c_stdout_buffering(_IOLBF)
+
+        # Now the pipe is only open through the stdout fd
+        os.close(write_fd)
+        write_fd = None
+
+        yield lines
+
+    finally:
+
+        # Restoring stdout closes the last write end of the pipe, so the
+        # reader gets the end-of-file
+        _redirect_stdout(saved_stdout_fd, original_stdout_fd)
+
+        # The C library line-buffers terminals and fully buffers the rest
+        _set_c_stdout_buffering(_IOLBF if os.isatty(original_stdout_fd) else _IOFBF)
+
+        if write_fd is not None:
+            os.close(write_fd)
+
+        reader.join()
+
+        os.close(read_fd)
+        os.close(saved_stdout_fd)
+
+        if writer is not None:
+            writer.finish()
+
+
+class _JSONLinesWriter(threading.Thread):
+    '''
+    Thread exporting the lines of a :class:`TimestampedLines` object as they
+    are captured.
+    '''
+    def __init__( self, lines, path ):
+        '''
+        Build the thread from the lines and the path to the output file.
+        '''
+        import queue
+
+        super(_JSONLinesWriter, self).__init__(daemon=True)
+
+        self._lines = lines
+        self._path  = path
+        self._queue = queue.Queue()
+
+    def finish( self ):
+        '''
+        Notify that no more lines will be added, and wait for the thread to
+        export the remaining ones.
+        '''
+        self._queue.put(None)
+        self.join()
+
+    def notify( self, stop ):
+        '''
+        Notify that the lines up to the given index are available.
+        '''
+        self._queue.put(stop)
+
+    def run( self ):
+        '''
+        Export the lines as they are notified.
+        '''
+        with open(self._path, 'w') as f:
+
+            start = 0
+
+            while True:
+
+                stop = self._queue.get()
+
+                # Process all the pending notifications at once
+                while stop is not None and not self._queue.empty():
+                    stop = self._queue.get()
+
+                end = stop if stop is not None else len(self._lines)
+
+                self._lines.to_jsonl(f, start, end)
+                f.flush()
+
+                start = end
+
+                if stop is None:
+                    break
+
+
+def _call_redirected( func, return_exceptions, task ):
+    '''
+    Call the function on a worker of a :class:`RedirectedPool`, returning
+    the result and the output produced during the call.
+    If the function raises an exception, the captured output is attached
+    to it as the "output" attribute, together with the task identifier as
+    "task_id".
+
+    :param func: function to call.
+    :type func: callable
+    :param return_exceptions: whether to return the exception raised by \
+    the function as its result, instead of raising it.
+    :type return_exceptions: bool
+    :param task: task identifier and value to process.
+    :type task: tuple(int, object)
+    :returns: task identifier, result and captured output.
+    :rtype: tuple(int, object, bytes)
+    '''
+    index, value = task
+
+    try:
+        result = func(value)
+    except Exception as error:
+        error.task_id = index
+        error.output  = _read_worker_capture()
+        if return_exceptions:
+            return index, error, error.output
+        raise
+    except BaseException:
+        _read_worker_capture()
+        raise
+
+    return index, result, _read_worker_capture()
+
+
+def _read_lines( fd, lines, writer = None ):
+    '''
+    Read the data from the given file descriptor until the end-of-file is
+    reached, storing it in the given :class:`TimestampedLines` object.
+
+    :param fd: file descriptor to read from.
+    :type fd: int
+    :param lines: object where to store the lines.
+    :type lines: TimestampedLines
+    :param writer: thread exporting the lines.
+    :type writer: _JSONLinesWriter or None
+    '''
+    while True:
+
+        data = os.read(fd, 1 << 16)
+
+        if not data:
+            break
+
+        if lines.append(data) and writer is not None:
+            writer.notify(len(lines))
+
+    lines.close()
+
+
+def _init_redirected_worker( stderr ):
+    '''
+    Initialize a worker of a :class:`RedirectedPool`, redirecting its output
+    to a temporary file.
+
+    :param stderr: whether to redirect also the standard error.
+    :type stderr: bool
+    '''
+    global _worker_capture
+
+    flush_c_stdout()
+
+    fds = [1, 2] if stderr else [1]
+
+    _worker_capture = tempfile.TemporaryFile(mode='w+b')
+
+    for fd in fds:
+        os.dup2(_worker_capture.fileno(), fd)
+
+    # The Python streams might not point to the file descriptors (e.g. if
+    # they have been replaced), so they are rebuilt
+    sys.stdout = io.TextIOWrapper(io.FileIO(1, 'wb', closefd=False),
+                                  line_buffering=True)
+    if stderr:
+        sys.stderr = io.TextIOWrapper(io.FileIO(2, 'wb', closefd=False),
+                                      line_buffering=True)
+
+
+def _redirect_stdout( to_fd, original_stdout_fd, line_buffering = False ):
+    '''
+    Redirect stdout to the given file descriptor.
+
+    :param to_fd: file descriptor where to send the output.
+    :type to_fd: int
+    :param original_stdout_fd: file descriptor of stdout.
+    :type original_stdout_fd: int
+    :param line_buffering: whether the new :attr:`sys.stdout` must flush \
+    the data after each line.
+    :type line_buffering: bool
+    '''
+    # Flush the C-level buffer stdout
+    flush_c_stdout()
+
+    # Flush and close sys.stdout - also closes the file descriptor (fd)
+    sys.stdout.close()
+
+    # Make original_stdout_fd point to the same file as to_fd
+    os.dup2(to_fd, original_stdout_fd)
+
+    # Create a new sys.stdout that points to the redirected fd
+    c = io.FileIO(original_stdout_fd, 'wb')
+    sys.stdout = io.TextIOWrapper(c, line_buffering=line_buffering)
+
+
+def _set_c_stdout_buffering( mode ):
+    '''
+    Set the buffering mode of the C-level stdout, which must have been
+    flushed.
+
+    :param mode: buffering mode (:data:`_IOFBF` or :data:`_IOLBF`).
+    :type mode: int
+    '''
+    libc = ctypes.CDLL(None)
+    c_stdout = ctypes.c_void_p.in_dll(libc, 'stdout')
+    libc.setvbuf(c_stdout, None, mode, 0)
+
+
+def _read_worker_capture():
+    '''
+    Read and clear the output captured in a worker of a
+    :class:`RedirectedPool`.
+
+    :returns: captured output.
+    :rtype: bytes
+    '''
+    flush_streams()
+
+    fd = _worker_capture.fileno()
+
+    os.lseek(fd, 0, os.SEEK_SET)
+
+    chunks = []
+    while True:
+        c = os.read(fd, 1 << 20)
+        if not c:
+            break
+        chunks.append(c)
+
+    # The standard output shares the offset with the temporary file
+    os.ftruncate(fd, 0)
+    os.lseek(fd, 0, os.SEEK_SET)
+
+    return b''.join(chunks)
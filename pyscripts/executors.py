@@ -0,0 +1,661 @@
+'''
+Classes to execute tasks on pools of processes, either on the local
+machine or on workers running on other hosts.
+They are accepted by :func:`pyscripts.dependencies` and
+:func:`pyscripts.sweep`.
+'''
+
+__author__  = ['Miguel Ramos Pernas']
+__email__   = ['miguel.ramos.pernas@cern.ch']
+
+
+# Python
+# ("multiprocessing.managers", "argparse", "queue" and "traceback" are
+# imported in the functions using them, since they are slow to import)
+import itertools
+import multiprocessing
+import os
+import pickle
+import socket
+import threading
+import time
+
+# Environment variable with the default authentication key of the workers
+__authkey_env__ = 'PYSCRIPTS_AUTHKEY'
+
+# Interval between the messages sent by the workers to signal they are
+# alive (in seconds)
+__heartbeat__ = 1.
+
+# Queues of tasks and results, living in the process of the manager (they
+# are created together with the class of the manager)
+_tasks   = None
+_results = None
+
+
+__all__ = ['LocalExecutor', 'RemoteExecutor', 'worker_main']
+
+
+class LocalExecutor(object):
+    '''
+    Executor running the tasks on a pool of processes in the local machine.
+    It is a thin wrapper around :class:`multiprocessing.pool.Pool`.
+
+    :param processes: number of worker processes.
+    :type processes: int or None
+    :param context: multiprocessing context to use.
+    :type context: multiprocessing.context.BaseContext or None
+    '''
+    def __init__( self, processes = None, context = None ):
+        '''
+        Build the pool of processes.
+        '''
+        context = context if context is not None else multiprocessing
+
+        self.processes = processes if processes is not None else os.cpu_count()
+
+        self._pool = context.Pool(self.processes)
+
+    def __enter__( self ):
+        '''
+        Enter the context, returning this object.
+        '''
+        return self
+
+    def __exit__( self, *args ):
+        '''
+        Terminate the pool of processes.
+        '''
+        self.terminate()
+        self.join()
+
+    def apply_async( self, func, args = (), kwds = None, callback = None, error_callback = None ):
+        '''
+        Call a function asynchronously.
+
+        :param func: function to call.
+        :type func: callable
+        :param args: positional arguments.
+        :type args: tuple
+        :param kwds: keyword arguments.
+        :type kwds: dict or None
+        :param callback: function called with the result when it is ready.
+        :type callback: callable or None
+        :param error_callback: function called with the exception if the \
+        call fails.
+        :type error_callback: callable or None
+        :returns: object to get the result.
+        :rtype: multiprocessing.pool.AsyncResult
+        '''
+        return self._pool.apply_async(func, args, kwds if kwds is not None else {},
+                                      callback, error_callback)
+
+    def close( self ):
+        '''
+        Prevent any more tasks to be submitted.
+        '''
+        self._pool.close()
+
+    def join( self ):
+        '''
+        Wait for the workers to finish. Must be called after :meth:`close`
+        or :meth:`terminate`.
+        '''
+        self._pool.join()
+
+    def map( self, func, iterable ):
+        '''
+        Apply a function to each element of the given iterable.
+
+        :param func: function to call.
+        :type func: callable
+        :param iterable: values to process.
+        :type iterable: iterable
+        :returns: results, in the same order as the input values.
+        :rtype: list
+        '''
+        return self._pool.map(func, iterable)
+
+    def terminate( self ):
+        '''
+        Stop the workers immediately.
+        '''
+        self._pool.terminate()
+
+
+class RemoteExecutor(object):
+    '''
+    Executor sending the tasks to workers that connect to it through TCP,
+    possibly from other hosts.
+    Tasks are stored in a queue served by a :mod:`multiprocessing.managers`
+    server, and the workers, started with :func:`worker_main` (or the
+    "pyscripts-worker" command), pull them and send back the results:
+
+    >>> with RemoteExecutor(('', 5000), authkey=b'secret') as executor:
+    >>>     for r in sweep(parser, argvs, executor=executor):
+    >>>         print(r.result)
+
+    .. code-block:: bash
+
+       PYSCRIPTS_AUTHKEY=secret pyscripts-worker --address host:5000 --processes 8
+
+    Functions and their arguments are pickled in this process and loaded on
+    the workers, so they must be importable there (modes defined in the
+    "__main__" module of a script can not be used, but
+    :class:`pyscripts.LazyMode` objects can), and paths to files must be
+    valid on the hosts of the workers.
+    The workers send a message every second while they are alive, from a
+    separate thread. Tasks running on a worker that stops sending messages
+    for "worker_timeout" seconds are sent again, up to "retries" times, and
+    fail afterwards. The timeout must then be larger than the time that the
+    tasks can hold the global interpreter lock.
+    Tasks that are taken from the queue but never start (the connection of a
+    worker that died can still take one) are sent again in the same way,
+    once the queue has been empty for "worker_timeout" seconds.
+    Tasks that take longer than "timeout" since they are submitted also
+    fail.
+
+    :param address: host and port where to listen. If the port is zero, a \
+    free one is chosen (see :attr:`RemoteExecutor.address`).
+    :type address: tuple(str, int)
+    :param authkey: key to authenticate the workers. By default, it is \
+    taken from the "PYSCRIPTS_AUTHKEY" environment variable or generated \
+    randomly.
+    :type authkey: bytes or None
+    :param processes: expected number of workers. It is only used to \
+    decide the number of pending tasks in :func:`pyscripts.sweep`.
+    :type processes: int or None
+    :param worker_timeout: time without messages from a worker after which \
+    it is considered dead (in seconds).
+    :type worker_timeout: float
+    :param retries: number of times a task is sent again if its worker dies.
+    :type retries: int
+    :param timeout: maximum time for a task to finish since it is \
+    submitted (in seconds). By default there is no limit.
+    :type timeout: float or None
+    '''
+    def __init__( self, address = ('', 0), authkey = None, processes = None, worker_timeout = 10., retries = 1, timeout = None ):
+        '''
+        Start the server with the queues.
+        '''
+        if authkey is None:
+            if __authkey_env__ in os.environ:
+                authkey = os.environ[__authkey_env__].encode()
+            else:
+                authkey = os.urandom(16).hex().encode()
+
+        self.authkey        = authkey
+        self.processes      = processes
+        self.worker_timeout = worker_timeout
+        self.retries        = retries
+        self.timeout        = timeout
+
+        self._manager = _queue_manager()(address=address, authkey=authkey)
+        self._manager.start()
+
+        self._tasks   = self._manager.tasks()
+        self._ids     = itertools.count()
+        self._pending = {}  # identifier -> task
+        self._workers = {}  # worker -> time of the last message
+        self._empty   = None  # time since the queue of tasks is empty
+        self._lock    = threading.Lock()
+        self._closed  = False
+
+        self._thread = threading.Thread(target=self._collect, daemon=True)
+        self._thread.start()
+
+    def __enter__( self ):
+        '''
+        Enter the context, returning this object.
+        '''
+        return self
+
+    def __exit__( self, *args ):
+        '''
+        Stop the server.
+        '''
+        self.terminate()
+        self.join()
+
+    def _check( self, now ):
+        '''
+        Send again or fail the tasks of the workers that are not alive, or
+        that were taken from the queue but never started, and fail the tasks
+        that exceed the timeout.
+        '''
+        dead = {w for w, t in self._workers.items() if now - t > self.worker_timeout}
+        for w in dead:
+            del self._workers[w]
+
+        # Once the queue is empty, any task sent before has been taken, so
+        # it must start shortly after
+        try:
+            empty = self._tasks.qsize() == 0
+        except (EOFError, OSError):
+            empty = False
+
+        if not empty:
+            self._empty = None
+        elif self._empty is None:
+            self._empty = now
+
+        if self._empty is not None and now - self._empty > self.worker_timeout:
+            lost = self._empty
+        else:
+            lost = None
+
+        failed = []
+
+        with self._lock:
+            for tid, task in list(self._pending.items()):
+                if self.timeout is not None and now - task['submitted'] > self.timeout:
+                    failed.append((self._pending.pop(tid), multiprocessing.TimeoutError(
+                        'Task not finished after {} seconds'.format(self.timeout))))
+                elif task['worker'] in dead or (task['worker'] is None and lost is not None and task['sent'] < lost):
+                    if task['attempts'] < self.retries:
+                        task['attempts'] += 1
+                        task['worker'] = None
+                        task['sent']   = now
+                        self._tasks.put((tid, task['payload']))
+                    else:
+                        failed.append((self._pending.pop(tid), RuntimeError(
+                            'The worker running the task stopped responding')))
+
+        for task, exc in failed:
+            task['result']._set(False, exc)
+
+    def _collect( self ):
+        '''
+        Collect the messages sent by the workers.
+        '''
+        import queue
+
+        results = self._manager.results()
+
+        last_check = time.time()
+
+        while True:
+
+            try:
+                kind, worker, tid, value = results.get(timeout=__heartbeat__)
+            except queue.Empty:
+                kind = None
+            except (EOFError, OSError):
+                break
+
+            now = time.time()
+
+            if kind is not None:
+                self._workers[worker] = now
+
+            if kind == 'start':
+                with self._lock:
+                    if tid in self._pending:
+                        self._pending[tid]['worker'] = worker
+            elif kind == 'done':
+                with self._lock:
+                    task = self._pending.pop(tid, None)
+                if task is not None:  # tasks sent again can finish twice
+                    ok, payload = value
+                    if ok:
+                        try:
+                            task['result']._set(True, pickle.loads(payload))
+                        except Exception as e:
+                            task['result']._set(False, e)
+                    else:
+                        task['result']._set(False, RuntimeError('Task failed on a worker:\n' + payload))
+
+            if now - last_check >= __heartbeat__:
+                self._check(now)
+                last_check = now
+
+        # The server has been stopped
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        for task in pending.values():
+            task['result']._set(False, RuntimeError('The executor has been terminated'))
+
+    @property
+    def address( self ):
+        '''
+        Host and port where the server listens.
+
+        :type: tuple(str, int)
+        '''
+        return self._manager.address
+
+    def apply_async( self, func, args = (), kwds = None, callback = None, error_callback = None ):
+        '''
+        Call a function asynchronously on a worker.
+
+        :param func: function to call.
+        :type func: callable
+        :param args: positional arguments.
+        :type args: tuple
+        :param kwds: keyword arguments.
+        :type kwds: dict or None
+        :param callback: function called with the result when it is ready.
+        :type callback: callable or None
+        :param error_callback: function called with the exception if the \
+        call fails.
+        :type error_callback: callable or None
+        :returns: object to get the result.
+        :rtype: object with the interface of \
+        :class:`multiprocessing.pool.AsyncResult`
+        :raises ValueError: if the executor is closed.
+        '''
+        if self._closed:
+            raise ValueError('The executor is closed')
+
+        r = _RemoteResult(callback, error_callback)
+
+        try:
+            payload = pickle.dumps((func, args, kwds if kwds is not None else {}))
+        except Exception as e:
+            r._set(False, e)
+            return r
+
+        tid = next(self._ids)
+
+        with self._lock:
+            self._pending[tid] = {'result': r, 'payload': payload, 'worker': None,
+                                  'attempts': 0, 'submitted': time.time(), 'sent': time.time()}
+
+        self._tasks.put((tid, payload))
+
+        return r
+
+    def close( self ):
+        '''
+        Prevent any more tasks to be submitted.
+        The server is stopped in :meth:`join`, once all the results are
+        received.
+        '''
+        self._closed = True
+
+    def join( self ):
+        '''
+        Wait for the pending tasks and stop the server. Must be called
+        after :meth:`close` or :meth:`terminate`.
+        '''
+        while True:
+            with self._lock:
+                pending = [t['result'] for t in self._pending.values()]
+            if not pending:
+                break
+            pending[0].wait()
+
+        self.terminate()
+
+    def map( self, func, iterable ):
+        '''
+        Apply a function to each element of the given iterable.
+
+        :param func: function to call.
+        :type func: callable
+        :param iterable: values to process.
+        :type iterable: iterable
+        :returns: results, in the same order as the input values.
+        :rtype: list
+        '''
+        return [r.get() for r in [self.apply_async(func, (v,)) for v in iterable]]
+
+    def terminate( self ):
+        '''
+        Stop the server immediately. Pending tasks fail.
+        '''
+        self._closed = True
+        if self._thread.is_alive():
+            self._manager.shutdown()
+            self._thread.join()
+
+
+class _RemoteResult(object):
+    '''
+    Result of a task sent to a :class:`RemoteExecutor`.
+    '''
+    def __init__( self, callback = None, error_callback = None ):
+        '''
+        Build the object from the functions to call when the result is ready.
+        '''
+        self._callback       = callback
+        self._error_callback = error_callback
+        self._event          = threading.Event()
+        self._success        = None
+        self._value          = None
+
+    def _set( self, success, value ):
+        '''
+        Set the result, calling the corresponding callback.
+        Exceptions raised by the callbacks are displayed, so they do not
+        stop the collection of the results.
+        '''
+        self._success, self._value = success, value
+        try:
+            if success and self._callback is not None:
+                self._callback(value)
+            elif not success and self._error_callback is not None:
+                self._error_callback(value)
+        except Exception:
+            import traceback
+            traceback.print_exc()
+        finally:
+            self._event.set()
+
+    def get( self, timeout = None ):
+        '''
+        Get the result, raising the exception if the task failed.
+        '''
+        if not self._event.wait(timeout):
+            raise multiprocessing.TimeoutError()
+        if not self._success:
+            raise self._value
+        return self._value
+
+    def ready( self ):
+        '''
+        Whether the task has finished.
+        '''
+        return self._event.is_set()
+
+    def successful( self ):
+        '''
+        Whether the task finished without errors.
+        '''
+        if not self.ready():
+            raise ValueError('The result is not ready')
+        return self._success
+
+    def wait( self, timeout = None ):
+        '''
+        Wait for the result.
+        '''
+        self._event.wait(timeout)
+
+
+def worker_main( argv = None ):
+    '''
+    Entry point of the "pyscripts-worker" command, which runs the tasks of
+    a :class:`RemoteExecutor`:
+
+    .. code-block:: bash
+
+       pyscripts-worker --address host:5000 --authkey secret --processes 4
+
+    The workers stop when the server of the executor stops.
+
+    :param argv: arguments of the command. By default they are taken from \
+    :attr:`sys.argv`.
+    :type argv: list(str) or None
+    :returns: exit code.
+    :rtype: int
+    '''
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='pyscripts-worker',
+                                     description='Run the tasks of a pyscripts executor')
+    parser.add_argument('--address', type=str, required=True,
+                        help='Address of the executor, as "host:port"')
+    parser.add_argument('--authkey', type=str, default=os.environ.get(__authkey_env__),
+                        help='Authentication key. By default it is taken from '\
+                        'the "{}" environment variable'.format(__authkey_env__))
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Number of worker processes to run')
+    parser.add_argument('--wait', type=float, default=10.,
+                        help='Time to wait for the executor to be available (in seconds)')
+
+    args = parser.parse_args(argv)
+
+    if args.authkey is None:
+        parser.error('The authentication key must be provided')
+
+    host, port = args.address.rsplit(':', 1)
+
+    wargs = ((host, int(port)), args.authkey.encode(), args.wait)
+
+    if args.processes == 1:
+        _worker_loop(*wargs)
+    else:
+        workers = [multiprocessing.Process(target=_worker_loop, args=wargs)
+                   for _ in range(args.processes)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+
+    return 0
+
+
+def _get_results():
+    '''
+    Get the queue of results.
+
+    :returns: queue of results.
+    :rtype: queue.Queue
+    '''
+    return _results
+
+
+def _get_tasks():
+    '''
+    Get the queue of tasks.
+
+    :returns: queue of tasks.
+    :rtype: queue.Queue
+    '''
+    return _tasks
+
+
+def _queue_manager():
+    '''
+    Get the class of the manager serving the queues of tasks and results.
+    It is defined the first time it is needed, to avoid importing
+    :mod:`multiprocessing.managers` with the package.
+
+    :returns: class of the manager.
+    :rtype: type
+    '''
+    global _QueueManager, _tasks, _results
+
+    if '_QueueManager' not in globals():
+
+        import multiprocessing.managers
+        import queue
+
+        _tasks   = queue.Queue()
+        _results = queue.Queue()
+
+        class _QueueManager(multiprocessing.managers.BaseManager):
+            '''
+            Manager serving the queues of tasks and results.
+            '''
+            pass
+
+        _QueueManager.register('tasks', callable=_get_tasks)
+        _QueueManager.register('results', callable=_get_results)
+
+    return _QueueManager
+
+
+def _worker_loop( address, authkey, wait = 0. ):
+    '''
+    Run the tasks of an executor until it stops.
+
+    :param address: host and port of the executor.
+    :type address: tuple(str, int)
+    :param authkey: authentication key.
+    :type authkey: bytes
+    :param wait: time to wait for the executor to be available (in seconds).
+    :type wait: float
+    '''
+    import queue
+    import traceback
+
+    manager = _queue_manager()(address=address, authkey=authkey)
+
+    deadline = time.time() + wait
+    while True:
+        try:
+            manager.connect()
+            break
+        except ConnectionRefusedError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+    tasks, results = manager.tasks(), manager.results()
+
+    worker = '{}:{}:{}'.format(socket.gethostname(), os.getpid(), os.urandom(4).hex())
+
+    stop = threading.Event()
+
+    def _heartbeat():
+        while not stop.wait(__heartbeat__):
+            try:
+                results.put(('alive', worker, None, None))
+            except (EOFError, OSError):
+                break
+
+    thread = threading.Thread(target=_heartbeat, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+
+            # Poll the queue, so a request of a worker that dies does not
+            # take tasks for long
+            try:
+                tid, payload = tasks.get(timeout=__heartbeat__)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break  # the executor has stopped
+
+            try:
+                results.put(('start', worker, tid, None))
+            except (EOFError, OSError):
+                break
+
+            try:
+                func, args, kwds = pickle.loads(payload)
+                out = (True, pickle.dumps(func(*args, **kwds)))
+            except (Exception, SystemExit):
+                out = (False, traceback.format_exc())
+
+            try:
+                results.put(('done', worker, tid, out))
+            except (EOFError, OSError):
+                break
+    finally:
+        stop.set()
+
+
+def __getattr__( name ):
+    '''
+    Build the class of the manager the first time it is accessed, so it
+    can be found when unpickling it on spawned processes.
+    '''
+    if name == '_QueueManager':
+        return _queue_manager()
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
@@ -0,0 +1,338 @@
+'''
+Functions to process large collections of argument sets (manifests),
+reading, parsing and running them lazily so the memory usage does not
+depend on their size.
+'''
+
+__author__  = ['Miguel Ramos Pernas']
+__email__   = ['miguel.ramos.pernas@cern.ch']
+
+
+# Python
+# (the modules to read the files are imported in the functions using them)
+import itertools
+import os
+
+# Local
+from pyscripts.parsers import __callable_name__, _option_args, sweep
+
+# Formats of the manifests, by extension
+__formats__ = {'.jsonl': 'jsonl', '.ndjson': 'jsonl', '.csv': 'csv'}
+
+
+__all__ = ['call_manifest', 'parse_manifest', 'read_manifest']
+
+
+def call_manifest( parser, manifest, processes = None, drop = None, call_name = __callable_name__, chunksize = 100, max_pending = None, executor = None ):
+    '''
+    Run the modes for all the argument sets in a manifest.
+    The argument sets are read and parsed lazily, and sent to the workers
+    in chunks, so the memory usage does not depend on the size of the
+    manifest.
+    Records that can not be read are reported as errors of the
+    corresponding tasks, whose argument vector is set to None:
+
+    >>> for r in call_manifest(parser, 'manifest.jsonl', processes=16):
+    >>>     if r.error is not None:
+    >>>         print('Failed: {}'.format(r.argv))
+
+    :param parser: parser with the modes defined by \
+    :func:`pyscripts.define_modes`.
+    :type parser: argparse.ArgumentParser
+    :param manifest: path to a manifest file or iterable of records (see \
+    :func:`read_manifest`).
+    :type manifest: str or iterable
+    :param processes: number of worker processes.
+    :type processes: int or None
+    :param drop: values to drop (see :func:`pyscripts.process_args`).
+    :type drop: list(str) or None
+    :param call_name: name of the callable in the arguments.
+    :type call_name: str
+    :param chunksize: number of argument sets sent to a worker at once.
+    :type chunksize: int
+    :param max_pending: maximum number of chunks submitted and not finished.
+    :type max_pending: int or None
+    :param executor: executor to run the tasks.
+    :type executor: LocalExecutor, RemoteExecutor or None
+    :returns: results of the tasks (see :func:`pyscripts.sweep`).
+    :rtype: generator(SweepResult)
+
+    .. seealso:: :func:`pyscripts.sweep`
+    '''
+    return sweep(parser, _argvs(manifest), processes=processes, drop=drop,
+                 call_name=call_name, max_pending=max_pending,
+                 executor=executor, chunksize=chunksize)
+
+
+def parse_manifest( parser, manifest, chunksize = 1000 ):
+    '''
+    Parse the argument sets in a manifest lazily, in chunks.
+    Each chunk is a list of tuples with the position of the argument set,
+    the parsed arguments (None if they are not valid) and the error message
+    (None if they are valid).
+    Records that can not be read are also reported as errors, without
+    stopping the processing of the rest:
+
+    >>> for chunk in parse_manifest(parser, 'manifest.csv'):
+    >>>     for i, args, error in chunk:
+    >>>         ...
+
+    :param parser: parser with the modes defined by \
+    :func:`pyscripts.define_modes`.
+    :type parser: argparse.ArgumentParser
+    :param manifest: path to a manifest file or iterable of records (see \
+    :func:`read_manifest`).
+    :type manifest: str or iterable
+    :param chunksize: number of argument sets in each chunk.
+    :type chunksize: int
+    :returns: chunks of parsed arguments.
+    :rtype: generator(list(tuple(int, argparse.Namespace or None, str or None)))
+    '''
+    import traceback
+
+    argvs = enumerate(_argvs(manifest))
+
+    while True:
+
+        chunk = []
+        for i, argv in itertools.islice(argvs, chunksize):
+            if isinstance(argv, Exception):
+                chunk.append((i, None, ''.join(traceback.format_exception_only(type(argv), argv))))
+                continue
+            try:
+                chunk.append((i, parser.parse_args(argv), None))
+            except (Exception, SystemExit):
+                chunk.append((i, None, traceback.format_exc()))
+
+        if not chunk:
+            break
+
+        yield chunk
+
+
+def read_manifest( path, format = None, mode_key = 'mode', args_key = 'args', errors = 'raise' ):
+    '''
+    Read the argument sets of a manifest file, one at a time, converting
+    them to argument vectors.
+    Two formats are supported:
+
+     - JSON Lines: each line is a list with the arguments, or an object \
+     (see below).
+     - CSV: each row is an object, whose keys are the names of the columns. \
+     Empty values are omitted, and "true" and "false" (in any case) are \
+     interpreted as booleans, except for the mode and the positional \
+     arguments.
+
+    JSON documents (".json" files) are not supported, since they must be
+    fully loaded in memory.
+    Lines that can not be decoded are treated as invalid records.
+
+    Objects are converted to argument vectors taking the mode from the
+    key "mode_key", the positional arguments from "args_key" (a list or
+    a string, which is split as in a shell), and the options from the rest
+    of keys.
+    Keys not starting with "-" are converted to long options, replacing
+    underscores by hyphens.
+    Values set to True are considered as flags, and those set to False or
+    None are omitted. Lists are expanded as multiple values:
+
+    .. code-block:: json
+
+       {"mode": "fit", "args": ["data.root"], "year": 2016, "verbose": true}
+
+    is equivalent to "fit data.root --year 2016 --verbose".
+
+    :param path: path to the manifest.
+    :type path: str
+    :param format: format of the file ("jsonl" or "csv"). By default it is \
+    inferred from the extension.
+    :type format: str or None
+    :param mode_key: key with the mode.
+    :type mode_key: str
+    :param args_key: key with the positional arguments.
+    :type args_key: str
+    :param errors: what to do with the records that can not be read: \
+    "raise" an exception or "yield" it in place of the argument vector.
+    :type errors: str
+    :returns: argument vectors.
+    :rtype: generator(list(str) or ValueError)
+    :raises ValueError: if the format is unknown, or if a record can not \
+    be read and "errors" is set to "raise".
+    '''
+    import csv
+    import json
+
+    if errors not in ('raise', 'yield'):
+        raise ValueError('Unknown value for "errors": "{}"'.format(errors))
+
+    if format is None:
+
+        extension = os.path.splitext(path)[1].lower()
+
+        if extension == '.json':
+            raise ValueError('JSON documents can not be used as manifests ("{}"); '\
+                             'write one record per line in the JSON Lines format'.format(path))
+
+        format = __formats__.get(extension)
+
+    if format not in ('jsonl', 'csv'):
+        raise ValueError('Unable to determine the format of "{}"'.format(path))
+
+    # The bytes that can not be decoded are replaced by surrogates, so the
+    # rest of lines can still be read
+    with open(path, newline='' if format == 'csv' else None, errors='surrogateescape') as f:
+
+        # Number of lines read, used to locate the invalid records (also
+        # when they can not be parsed)
+        read = [0]
+
+        def _lines():
+            for line in f:
+                read[0] += 1
+                yield line
+
+        if format == 'jsonl':
+            lines  = _lines()
+            reader = None
+        else:
+            reader = csv.DictReader(_lines())
+
+        while True:
+
+            try:
+                if reader is None:
+                    line = next(lines)
+                    if not line.strip():
+                        continue
+                    record = json.loads(_check_decoded(line))
+                else:
+                    record = _csv_record(next(reader), (mode_key, args_key))
+                argv = _record_argv(record, mode_key, args_key)
+            except StopIteration:
+                break
+            except Exception as e:
+                argv = ValueError('Invalid record in line {} of "{}": {}'.format(read[0], path, e))
+                if errors == 'raise':
+                    raise argv
+
+            yield argv
+
+
+def _argvs( manifest ):
+    '''
+    Get the argument vectors of a manifest, with the records that can not
+    be read replaced by the corresponding errors.
+
+    :param manifest: path to a manifest file or iterable of records.
+    :type manifest: str or iterable
+    :returns: argument vectors or errors.
+    :rtype: generator(list(str) or ValueError)
+    '''
+    if isinstance(manifest, str):
+        for argv in read_manifest(manifest, errors='yield'):
+            yield argv
+    else:
+        for i, record in enumerate(manifest):
+            try:
+                yield _record_argv(record)
+            except Exception as e:
+                yield ValueError('Invalid record {}: {}'.format(i, e))
+
+
+def _check_decoded( text ):
+    '''
+    Check that a string read with the "surrogateescape" error handler was
+    decoded without errors.
+
+    :param text: string to check.
+    :type text: str
+    :returns: the same string.
+    :rtype: str
+    :raises ValueError: if the string contains bytes that could not be \
+    decoded.
+    '''
+    try:
+        text.encode('utf-8')
+    except UnicodeEncodeError as e:
+        raise ValueError('Unable to decode the byte in position {}'.format(e.start))
+    return text
+
+
+def _csv_record( row, keep = () ):
+    '''
+    Convert the values of a row of a CSV file.
+
+    :param row: row of the file.
+    :type row: dict(str, str)
+    :param keep: keys whose values are kept as strings.
+    :type keep: collection(str)
+    :returns: record.
+    :rtype: dict
+    :raises ValueError: if the row has more values than columns.
+    '''
+    if None in row:
+        raise ValueError('More values than columns')
+
+    record = {}
+    for k, v in row.items():
+        if v is None or v == '':
+            continue
+        _check_decoded(k)
+        _check_decoded(v)
+        if k in keep:
+            record[k] = v
+        elif v.lower() == 'true':
+            record[k] = True
+        elif v.lower() == 'false':
+            record[k] = False
+        else:
+            record[k] = v
+    return record
+
+
+def _record_argv( record, mode_key = 'mode', args_key = 'args' ):
+    '''
+    Convert a record to an argument vector.
+
+    :param record: record to convert.
+    :type record: dict, list or str
+    :param mode_key: key with the mode.
+    :type mode_key: str
+    :param args_key: key with the positional arguments.
+    :type args_key: str
+    :returns: argument vector.
+    :rtype: list(str)
+    :raises ValueError: if the type of the record is not supported.
+    '''
+    import shlex
+
+    if isinstance(record, str):
+        return shlex.split(record)
+    elif isinstance(record, (list, tuple)):
+        return list(map(str, record))
+    elif not isinstance(record, dict):
+        raise ValueError('Records must be objects, lists or strings, not "{}"'.format(type(record).__name__))
+
+    argv = []
+
+    if mode_key in record:
+        argv.append(str(record[mode_key]))
+
+    args = record.get(args_key, [])
+    if isinstance(args, str):
+        argv += shlex.split(args)
+    elif isinstance(args, (list, tuple)):
+        argv += list(map(str, args))
+    else:
+        argv.append(str(args))
+
+    for k, v in record.items():
+
+        if k in (mode_key, args_key):
+            continue
+
+        option = k if k.startswith('-') else '--' + k.replace('_', '-')
+
+        argv += _option_args(option, v)
+
+    return argv
@@ -6,12 +6,176 @@ __author__  = ['Miguel Ramos Pernas']
 __email__   = ['miguel.ramos.pernas@cern.ch']
 
 
+# Python
+# ("queue", "shlex" and "traceback" are imported in the functions using them,
+# so building parsers does not need them)
+import ast
+import collections
+import functools
+import importlib
+import importlib.machinery
+import itertools
+import multiprocessing
+import inspect
+import os
+import pickle
+import selectors
+import signal
+import sys
+import threading
+
+# Local
+from pyscripts.processes import fork_call, wait_process
+from pyscripts.profiling import profiled_call
+
+
 # Default name of the callable in the attributes of the Namespace
 # obtained after processing the arguments.
 __callable_name__ = 'func'
 
 
-__all__ = ['call', 'define_modes', 'process_args']
+# Destinations of the options added to profile the modes
+__profile_names__ = ('pyscripts_profile', 'pyscripts_profile_dump', 'pyscripts_profile_tracemalloc')
+
+# Name of the attribute with the resources declared for a mode
+__resources_name__ = 'pyscripts_resources'
+
+
+# Docstrings of the callables in the source files, read without importing
+# the modules
+_docstrings = {}
+
+
+# Result of a task in a sweep
+SweepResult = collections.namedtuple('SweepResult', ['index', 'argv', 'result', 'error'])
+
+
+__all__ = ['LazyMode', 'argument_grid', 'call', 'call_concurrently', 'define_modes', 'process_args', 'sweep']
+
+
+class LazyMode(object):
+    '''
+    Mode defined from an import string, with the form "module:callable".
+    The module is imported the first time the mode is called, so building
+    a parser with many modes does not need to import their dependencies:
+
+    >>> parser = argparse.ArgumentParser()
+    >>> define_modes(parser, [LazyMode('mypkg.fits:run_fit'), 'mypkg.plots:plot'])
+
+    The name of the mode is that of the callable, unless "name" is given.
+    If "help" is not provided, the docstring of the callable is used. It is
+    read from the source file of the module, which is parsed (but not
+    executed) and cached for the rest of the modes defined in it.
+
+    :param spec: import string of the callable.
+    :type spec: str
+    :param name: name of the mode.
+    :type name: str or None
+    :param help: help text of the mode.
+    :type help: str or None
+    :raises ValueError: if the import string is not valid.
+    '''
+    def __init__( self, spec, name = None, help = None ):
+        '''
+        Build the mode from its import string.
+        '''
+        module, _, attr = spec.partition(':')
+
+        if not module or not attr:
+            raise ValueError('Invalid mode "{}"; it must have the '\
+                             'form "module:callable"'.format(spec))
+
+        self.spec     = spec
+        self.__name__ = name if name is not None else attr.rsplit('.', 1)[-1]
+        self.__doc__  = help if help is not None else _lazy_docstring(module, attr)
+
+        self._func = None
+
+    def __call__( self, *args, **kwargs ):
+        '''
+        Call the underlying callable, importing it if needed.
+        '''
+        return self.func(*args, **kwargs)
+
+    def __getstate__( self ):
+        '''
+        Get the state to pickle, without the imported callable.
+        '''
+        state = dict(self.__dict__)
+        state['_func'] = None
+        return state
+
+    def __repr__( self ):
+        '''
+        Representation of the mode.
+        '''
+        return '{}({!r})'.format(self.__class__.__name__, self.spec)
+
+    @property
+    def func( self ):
+        '''
+        Callable associated to the mode, imported on the first access.
+
+        :type: callable
+        '''
+        if self._func is None:
+
+            module, _, attr = self.spec.partition(':')
+
+            obj = importlib.import_module(module)
+            for a in attr.split('.'):
+                obj = getattr(obj, a)
+
+            self._func = obj
+
+        return self._func
+
+
+def argument_grid( modes, grid = None, prefix = None ):
+    '''
+    Build the argument vectors for all the combinations of the given values
+    of the options (the cartesian product):
+
+    >>> argument_grid('fit', {'--year': [2016, 2017], '--model': ['a', 'b']})
+    [['fit', '--year', '2016', '--model', 'a'],
+     ['fit', '--year', '2016', '--model', 'b'],
+     ['fit', '--year', '2017', '--model', 'a'],
+     ['fit', '--year', '2017', '--model', 'b']]
+
+    Values set to True are considered as flags, and those set to False or
+    None are omitted. Lists or tuples are expanded as multiple values of
+    the same option.
+
+    :param modes: mode or modes to run.
+    :type modes: str or collection(str)
+    :param grid: values for each option.
+    :type grid: dict(str, collection) or None
+    :param prefix: arguments to put before the mode (those of the main \
+    parser).
+    :type prefix: list(str) or None
+    :returns: argument vectors.
+    :rtype: list(list(str))
+
+    .. seealso:: :func:`sweep`
+    '''
+    modes  = [modes] if isinstance(modes, str) else list(modes)
+    grid   = grid if grid is not None else {}
+    prefix = list(prefix) if prefix is not None else []
+
+    options = list(grid.keys())
+
+    argvs = []
+    for m in modes:
+        for values in itertools.product(*(grid[o] for o in options)):
+
+            argv = prefix + [m]
+
+            for o, v in zip(options, values):
+                argv += _option_args(o, v)
+
+            argvs.append(argv)
+
+    return argvs
 
 
 def call( args, drop = None, call_name = __callable_name__ ):
@@ -27,14 +191,95 @@ def call( args, drop = None, call_name = __callable_name__ ):
     :type call_name: str
     :returns: whatever is returned in the callable call.
 
-    .. seealso:: :func:`process_args`
+    If the modes were defined with "profile" set (see :func:`define_modes`)
+    and the profiling options are provided, the call is done through
+    :func:`pyscripts.profiled_call`.
+    A :class:`ValueError` is raised if "--profile-dump" or
+    "--profile-tracemalloc" are given without "--profile".
+    Coroutine functions (defined with "async def") are run until completion
+    on a new event loop.
+
+    .. seealso:: :func:`call_concurrently`, :func:`process_args`
     '''
     dct = process_args(args, drop, call_name)
 
-    return getattr(args, call_name)(**dct)
+    return _call_mode(getattr(args, call_name), dct, _profile_options(args))
 
 
-def define_modes( parser, modes, call_name = __callable_name__, defaults = None, apply_to_parsers = None ):
+def call_concurrently( args, limit = None, drop = None, call_name = __callable_name__, return_exceptions = False ):
+    '''
+    Call the modes associated to many sets of arguments concurrently, in a
+    single event loop.
+    Coroutine functions are awaited in the loop, whilst the rest of modes
+    are run on the default executor of the loop (a pool of threads), so
+    I/O-bound modes overlap:
+
+    >>> argvs = [['fetch', '--file', f] for f in files]
+    >>> results = call_concurrently([parser.parse_args(a) for a in argvs], limit=8)
+
+    The profiling options are ignored, since the modes overlap in time.
+
+    :param args: collection of arguments obtained from the parser.
+    :type args: collection(argparse.Namespace)
+    :param limit: maximum number of modes running at the same time. By \
+    default there is no limit.
+    :type limit: int or None
+    :param drop: values to drop.
+    :type drop: list(str) or None
+    :param call_name: name of the callable in the arguments.
+    :type call_name: str
+    :param return_exceptions: if set to True, the exceptions raised by the \
+    modes are returned instead of the results. Otherwise the first exception \
+    is raised.
+    :type return_exceptions: bool
+    :returns: values returned by the modes, in the same order as "args".
+    :rtype: list
+
+    .. seealso:: :func:`call`
+    '''
+    # Imported here, since it is only needed for coroutines and it is slow
+    # to import
+    import asyncio
+
+    async def _call( a, semaphore ):
+        '''
+        Call the mode associated to the arguments.
+        '''
+        func = getattr(a, call_name)
+        dct  = process_args(a, drop, call_name)
+
+        if semaphore is not None:
+            await semaphore.acquire()
+
+        try:
+            if inspect.iscoroutinefunction(func.func if isinstance(func, LazyMode) else func):
+                return await func(**dct)
+
+            loop = asyncio.get_running_loop()
+
+            result = await loop.run_in_executor(None, functools.partial(func, **dct))
+
+            if inspect.isawaitable(result):
+                result = await result
+
+            return result
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+    async def _main():
+        '''
+        Call all the modes.
+        '''
+        semaphore = asyncio.Semaphore(limit) if limit is not None else None
+
+        return await asyncio.gather(*(_call(a, semaphore) for a in args),
+                                    return_exceptions=return_exceptions)
+
+    return list(asyncio.run(_main()))
+
+
+def define_modes( parser, modes, call_name = __callable_name__, defaults = None, apply_to_parsers = None, profile = False, resources = None ):
     '''
     Build subparsers in the given parser, from the given set of callables
     (modes) to run.
@@ -59,8 +304,10 @@ def define_modes( parser, modes, call_name = __callable_name__, defaults = None,
 
     :param parser: parser where to add the subparsers.
     :type parser: argparse.ArgumentParser
-    :param modes: collection of callables (modes) to add.
-    :type modes: collection(callable)
+    :param modes: collection of callables (modes) to add. Import strings \
+    with the form "module:callable" are converted to :class:`LazyMode`. \
+    Coroutine functions are also allowed (see :func:`call`).
+    :type modes: collection(callable or str)
     :param call_name: name for the callable callable after parsing the \
     arguments.
     :type call_name: str
@@ -70,6 +317,14 @@ def define_modes( parser, modes, call_name = __callable_name__, defaults = None,
     :param apply_to_parsers: callable to call on each parser. It must take a \
     parser as the only argument.
     :type apply_to_parsers: callable or None
+    :param profile: whether to add the options "--profile", \
+    "--profile-dump" and "--profile-tracemalloc" to each parser, to \
+    measure the resources used by the modes when calling them with \
+    :func:`call` (see :func:`pyscripts.profiled_call`).
+    :type profile: bool
+    :param resources: resources needed by each mode, by name. They are used \
+    by :func:`pyscripts.schedule` to run many modes at the same time.
+    :type resources: dict(str, Resources) or None
     :returns: collection of subparsers.
     :rtype: argparse._SubParsersAction
     '''
@@ -78,13 +333,25 @@ def define_modes( parser, modes, call_name = __callable_name__, defaults = None,
     defaults = defaults if defaults is not None else {}
 
     for m in modes:
+
+        if isinstance(m, str):
+            m = LazyMode(m)
+
         p = subparsers.add_parser(m.__name__, help=m.__doc__)
 
         defaults[call_name] = m
 
+        if resources is not None and m.__name__ in resources:
+            defaults[__resources_name__] = resources[m.__name__]
+        else:
+            defaults.pop(__resources_name__, None)
+
         if apply_to_parsers is not None:
             apply_to_parsers(p)
 
+        if profile:
+            _add_profile_arguments(p)
+
         p.set_defaults(**defaults)
 
     return subparsers
@@ -95,6 +362,8 @@ def process_args( args, drop = None, call_name = __callable_name__ ):
     Process the arguments obtained by
     :meth:`argparse.ArgumentParser.parse_args`, dropping from its values
     everything specified in "drop" and "call_name".
+    The values of the options added by :func:`define_modes` to profile the
+    modes, and the resources declared for them, are also dropped.
     A dictionary is returned instead.
 
     :param args: arguments obtained from the parser.
@@ -116,4 +385,535 @@ def process_args( args, drop = None, call_name = __callable_name__ ):
 
     dct.pop(call_name)
 
+    for n in __profile_names__ + (__resources_name__,):
+        dct.pop(n, None)
+
     return dct
+
+
+def sweep( parser, argvs, processes = None, drop = None, call_name = __callable_name__, max_pending = None, executor = None, chunksize = 1 ):
+    '''
+    Run the modes associated to many argument vectors on a pool of processes.
+    The argument vectors are parsed lazily, as the tasks are submitted, and
+    the results are yielded as soon as they are available (not in order):
+
+    >>> parser = argparse.ArgumentParser()
+    >>> define_modes(parser, [fit, plot], apply_to_parsers=add_arguments)
+    >>> argvs = argument_grid('fit', {'--year': [2016, 2017]})
+    >>> for r in sweep(parser, argvs, processes=4):
+    >>>     if r.error is not None:
+    >>>         print('Task {} failed: {}'.format(r.argv, r.error))
+
+    Each result is a named tuple with the position of the argument vector
+    ("index"), the argument vector itself ("argv"), the value returned by the
+    mode ("result") and the error message, if any ("error").
+    Errors, including those found when parsing the arguments, do not stop
+    the rest of the tasks.
+    Exceptions can be given in place of argument vectors (for example, when
+    the arguments can not be read), and are reported as the errors of the
+    corresponding tasks, with the argument vector set to None.
+    Each chunk of tasks runs on a new process forked from the current one,
+    so it starts with the modules of the script already imported, and a
+    process that dies (for example, due to a segmentation fault) only makes
+    the tasks of its chunk fail.
+    The modes and their results must be picklable (modes defined at module
+    level or as :class:`LazyMode` objects).
+    The tasks can also be sent to an executor (see
+    :class:`pyscripts.LocalExecutor` and :class:`pyscripts.RemoteExecutor`),
+    which is not closed at the end.
+
+    :param parser: parser with the modes defined by :func:`define_modes`.
+    :type parser: argparse.ArgumentParser
+    :param argvs: argument vectors (lists or strings) to process.
+    :type argvs: iterable(list(str) or str or Exception)
+    :param processes: number of worker processes.
+    :type processes: int or None
+    :param drop: values to drop (see :func:`process_args`).
+    :type drop: list(str) or None
+    :param call_name: name of the callable in the arguments.
+    :type call_name: str
+    :param max_pending: maximum number of tasks submitted and not \
+    finished. By default it is twice the number of processes.
+    :type max_pending: int or None
+    :param executor: executor to run the tasks. By default, a new pool of \
+    "processes" workers is created.
+    :type executor: LocalExecutor, RemoteExecutor or None
+    :param chunksize: number of argument vectors sent to a worker at once. \
+    If a chunk can not be sent, all its tasks fail. The maximum number of \
+    pending tasks is given in chunks.
+    :type chunksize: int
+    :returns: results of the tasks.
+    :rtype: generator(SweepResult)
+
+    .. seealso:: :func:`argument_grid`, :func:`call`
+    '''
+    import queue
+    import shlex
+    import traceback
+
+    if processes is None:
+        processes = getattr(executor, 'processes', None) or multiprocessing.cpu_count()
+
+    max_pending = max_pending if max_pending is not None else 2 * processes
+
+    results = queue.Queue()
+
+    if executor is None:
+        pool = _ForkPool(processes)
+    else:
+        pool = executor
+
+    def _submit( chunk ):
+        '''
+        Send a chunk of tasks to the pool.
+        '''
+        def _callback( values ):
+            results.put([SweepResult(i, argv, r, e)
+                         for (i, argv, _), (r, e) in zip(chunk, values)])
+
+        def _error_callback( exc ):
+            msg = ''.join(traceback.format_exception_only(type(exc), exc))
+            results.put([SweepResult(i, argv, None, msg) for i, argv, _ in chunk])
+
+        pool.apply_async(_run_modes, ([t for _, _, t in chunk],),
+                         callback=_callback, error_callback=_error_callback)
+
+    # Marks the end of the argument vectors, so any value given by the user
+    # (like None) is processed as a task
+    _end = object()
+
+    try:
+        pending = 0
+
+        chunk = []
+
+        for i, argv in enumerate(itertools.chain(argvs, [_end])):
+
+            if isinstance(argv, Exception):
+                yield SweepResult(i, None, None, ''.join(traceback.format_exception_only(type(argv), argv)))
+                continue
+
+            elif argv is not _end:
+
+                if isinstance(argv, str):
+                    argv = shlex.split(argv)
+
+                try:
+                    if argv is None:
+                        # Otherwise the arguments of the script would be parsed
+                        raise TypeError('Argument vectors must be lists or strings, not None')
+                    args = parser.parse_args(argv)
+                    func = getattr(args, call_name)
+                    dct  = process_args(args, drop, call_name)
+                    prof = _profile_options(args)
+                except (Exception, SystemExit):
+                    yield SweepResult(i, argv, None, traceback.format_exc())
+                    continue
+
+                chunk.append((i, argv, (func, dct, prof)))
+
+                if len(chunk) < chunksize:
+                    continue
+
+            elif not chunk:
+                break
+
+            _submit(chunk)
+
+            chunk = []
+
+            pending += 1
+
+            while pending >= max_pending:
+                for r in results.get():
+                    yield r
+                pending -= 1
+
+        while pending:
+            for r in results.get():
+                yield r
+            pending -= 1
+
+    finally:
+        if executor is None:
+            pool.terminate()
+            pool.join()
+
+
+class _ForkPool(object):
+    '''
+    Pool running each call on a new process forked from the current one,
+    with at most "processes" calls at the same time.
+    The result is sent back through a pipe, so a call whose process dies
+    without sending it fails, without affecting the rest.
+    The processes are started and collected from a separate thread.
+
+    :param processes: maximum number of processes running at the same time.
+    :type processes: int
+    '''
+    def __init__( self, processes ):
+        '''
+        Start the thread managing the processes.
+        '''
+        self._processes = processes
+        self._waiting   = collections.deque()
+        self._running   = {}  # read end of the pipe -> process and data
+        self._lock      = threading.Lock()
+        self._stop      = False
+
+        # Pipe to wake up the thread when calls are submitted or the pool
+        # is terminated
+        self._wakeup = os.pipe()
+
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _finish( self, fd ):
+        '''
+        Collect the process associated to the given pipe, calling the
+        corresponding callback.
+
+        :param fd: read end of the pipe.
+        :type fd: int
+        '''
+        os.close(fd)
+
+        r = self._running.pop(fd)
+
+        code = wait_process(r['pid'])
+
+        try:
+            ok, value = pickle.loads(bytes(r['data']))
+        except Exception:
+            ok, value = False, RuntimeError('The process running the task exited with code {} '\
+                                            'without sending the result'.format(code))
+
+        if ok:
+            r['callback'](value)
+        else:
+            r['error_callback'](value)
+
+    def _loop( self ):
+        '''
+        Start the processes of the submitted calls and collect their results.
+        '''
+        sel = selectors.DefaultSelector()
+        sel.register(self._wakeup[0], selectors.EVENT_READ)
+
+        try:
+            while True:
+
+                with self._lock:
+                    if self._stop:
+                        break
+                    while self._waiting and len(self._running) < self._processes:
+                        payload, callback, error_callback = self._waiting.popleft()
+                        rfd, wfd = os.pipe()
+                        pid = fork_call(_run_piped, payload, rfd, wfd)
+                        os.close(wfd)
+                        self._running[rfd] = {'pid': pid, 'data': bytearray(), 'callback': callback,
+                                              'error_callback': error_callback}
+                        sel.register(rfd, selectors.EVENT_READ)
+
+                for key, _ in sel.select():
+                    if key.fd == self._wakeup[0]:
+                        os.read(key.fd, 1 << 16)
+                        continue
+                    chunk = os.read(key.fd, 1 << 16)
+                    if chunk:
+                        self._running[key.fd]['data'] += chunk
+                    else:
+                        sel.unregister(key.fd)
+                        self._finish(key.fd)
+        finally:
+            sel.close()
+            for fd, r in self._running.items():
+                try:
+                    os.kill(r['pid'], signal.SIGKILL)
+                    os.waitpid(r['pid'], 0)
+                except OSError:
+                    pass
+                os.close(fd)
+            self._running.clear()
+
+    def apply_async( self, func, args = (), callback = None, error_callback = None ):
+        '''
+        Call a function on a new process.
+        The function and its arguments are pickled, so the call fails if
+        they can not be sent to a separate process.
+
+        :param func: function to call.
+        :type func: callable
+        :param args: positional arguments.
+        :type args: tuple
+        :param callback: function called with the result.
+        :type callback: callable or None
+        :param error_callback: function called with the exception if the \
+        call fails.
+        :type error_callback: callable or None
+        '''
+        callback       = callback if callback is not None else (lambda v: None)
+        error_callback = error_callback if error_callback is not None else (lambda e: None)
+
+        try:
+            payload = pickle.dumps((func, args))
+        except Exception as e:
+            error_callback(e)
+            return
+
+        with self._lock:
+            self._waiting.append((payload, callback, error_callback))
+
+        os.write(self._wakeup[1], b'x')
+
+    def join( self ):
+        '''
+        Wait for the thread managing the processes to finish. Must be
+        called after :meth:`terminate`.
+        '''
+        self._thread.join()
+
+        for fd in self._wakeup:
+            os.close(fd)
+
+    def terminate( self ):
+        '''
+        Kill the running processes and discard the waiting calls.
+        '''
+        with self._lock:
+            if self._stop:
+                return
+            self._stop = True
+            self._waiting.clear()
+
+        os.write(self._wakeup[1], b'x')
+
+
+def _add_profile_arguments( parser ):
+    '''
+    Add the arguments to profile a mode to the given parser.
+    The options requiring "--profile" are checked when the mode is called
+    (see :func:`_profile_options`).
+
+    :param parser: parser of the mode.
+    :type parser: argparse.ArgumentParser
+    '''
+    group = parser.add_argument_group('profiling')
+    group.add_argument('--profile', dest=__profile_names__[0], metavar='METRICS',
+                       default=None,
+                       help='Append the time and memory used by the mode to '\
+                       'the given JSON Lines file')
+    group.add_argument('--profile-dump', dest=__profile_names__[1], metavar='PATH',
+                       default=None,
+                       help='Save the statistics of cProfile to the given path, '\
+                       'which can contain the fields "{mode}" and "{pid}". '\
+                       'Requires "--profile".')
+    group.add_argument('--profile-tracemalloc', dest=__profile_names__[2],
+                       action='store_true',
+                       help='Trace the memory allocations with tracemalloc. '\
+                       'Requires "--profile".')
+
+
+def _call_mode( func, kwargs, profile = None ):
+    '''
+    Call a mode, profiling it if requested.
+
+    :param func: mode to call.
+    :type func: callable
+    :param kwargs: arguments to the mode.
+    :type kwargs: dict
+    :param profile: arguments to :func:`pyscripts.profiled_call`.
+    :type profile: dict or None
+    :returns: whatever is returned by the mode.
+    '''
+    @functools.wraps(func)
+    def _wrapper( **kwargs ):
+        '''
+        Call the mode, running it on an event loop if it is a coroutine.
+        '''
+        result = func(**kwargs)
+
+        if inspect.isawaitable(result):
+
+            # Imported here, since it is slow to import
+            import asyncio
+
+            result = asyncio.run(_await(result))
+
+        return result
+
+    if profile is not None:
+        return profiled_call(_wrapper, kwargs, **profile)
+    else:
+        return _wrapper(**kwargs)
+
+
+def _lazy_docstring( module, attr ):
+    '''
+    Get the docstring of a callable in a module, parsing its source file
+    if it has not been imported yet.
+    Parent packages are not imported either.
+
+    :param module: name of the module.
+    :type module: str
+    :param attr: name of the callable in the module.
+    :type attr: str
+    :returns: docstring of the callable (if found).
+    :rtype: str or None
+    '''
+    if module in sys.modules:
+        obj = sys.modules[module]
+        for a in attr.split('.'):
+            obj = getattr(obj, a, None)
+        return getattr(obj, '__doc__', None)
+
+    # Locate the source file
+    path, origin = None, None
+    parts = module.split('.')
+    for i in range(len(parts)):
+
+        spec = importlib.machinery.PathFinder.find_spec('.'.join(parts[:i + 1]), path)
+        if spec is None:
+            return None
+
+        path, origin = spec.submodule_search_locations, spec.origin
+
+    if origin is None or not origin.endswith('.py'):
+        return None
+
+    if origin not in _docstrings:
+
+        docs = {}
+
+        def _collect( node, prefix ):
+            for n in ast.iter_child_nodes(node):
+                if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    docs[prefix + n.name] = ast.get_docstring(n, clean=False)
+                    if isinstance(n, ast.ClassDef):
+                        _collect(n, prefix + n.name + '.')
+
+        with open(origin, 'rb') as f:
+            _collect(ast.parse(f.read(), origin), '')
+
+        _docstrings[origin] = docs
+
+    return _docstrings[origin].get(attr)
+
+
+def _option_args( option, value ):
+    '''
+    Build the arguments to set the given value of an option.
+    Values set to True are considered as flags, and those set to False or
+    None are omitted. Lists or tuples are expanded as multiple values.
+
+    :param option: name of the option.
+    :type option: str
+    :param value: value of the option.
+    :type value: object
+    :returns: arguments.
+    :rtype: list(str)
+    '''
+    if value is True:
+        return [option]
+    elif value is False or value is None:
+        return []
+    elif isinstance(value, (list, tuple)):
+        return [option] + list(map(str, value))
+    else:
+        return [option, str(value)]
+
+
+def _profile_options( args ):
+    '''
+    Get the arguments to :func:`pyscripts.profiled_call` from the parsed
+    arguments.
+
+    :param args: arguments obtained from the parser.
+    :type args: argparse.Namespace
+    :returns: arguments to profile the mode, or None if it must not be \
+    profiled.
+    :rtype: dict or None
+    :raises ValueError: if the options requiring "--profile" are given \
+    without it.
+    '''
+    metrics, dump, trace_memory = (getattr(args, n, None) for n in __profile_names__)
+
+    if metrics is None:
+        if dump is not None or trace_memory:
+            raise ValueError('"--profile-dump" and "--profile-tracemalloc" require "--profile"')
+        return None
+
+    return {'metrics': metrics, 'dump': dump, 'trace_memory': bool(trace_memory)}
+
+
+def _run_mode( func, kwargs, profile = None ):
+    '''
+    Run a mode on a worker, capturing the errors.
+
+    :param func: mode to run.
+    :type func: callable
+    :param kwargs: arguments to the mode.
+    :type kwargs: dict
+    :param profile: arguments to :func:`pyscripts.profiled_call`.
+    :type profile: dict or None
+    :returns: result of the mode and error message.
+    :rtype: tuple(object, str or None)
+    '''
+    import traceback
+
+    try:
+        return _call_mode(func, kwargs, profile), None
+    except (Exception, SystemExit):
+        return None, traceback.format_exc()
+
+
+def _run_modes( tasks ):
+    '''
+    Run a chunk of modes on a worker, capturing the errors.
+
+    :param tasks: modes to run, together with their arguments and the \
+    arguments to profile them.
+    :type tasks: list(tuple(callable, dict, dict or None))
+    :returns: result of each mode and error message.
+    :rtype: list(tuple(object, str or None))
+    '''
+    return [_run_mode(*t) for t in tasks]
+
+
+def _run_piped( payload, rfd, wfd ):
+    '''
+    Call a pickled function on a process forked by a :class:`_ForkPool`,
+    sending the result (or the exception) through a pipe.
+
+    :param payload: pickled function and arguments.
+    :type payload: bytes
+    :param rfd: read end of the pipe, which is closed.
+    :type rfd: int
+    :param wfd: write end of the pipe.
+    :type wfd: int
+    '''
+    os.close(rfd)
+
+    try:
+        func, args = pickle.loads(payload)
+        out = pickle.dumps((True, func(*args)))
+    except Exception as e:
+        try:
+            out = pickle.dumps((False, e))
+        except Exception:
+            out = pickle.dumps((False, RuntimeError(repr(e))))
+
+    view = memoryview(out)
+    while view:
+        view = view[os.write(wfd, view):]
+
+
+async def _await( awaitable ):
+    '''
+    Wait for an awaitable object.
+
+    :param awaitable: object to wait for.
+    :type awaitable: awaitable
+    :returns: result of the awaitable.
+    '''
+    return await awaitable
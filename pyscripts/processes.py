@@ -0,0 +1,130 @@
+'''
+Functions to run code on processes forked from the current one, flushing
+the standard streams and collecting the exit codes.
+'''
+
+__author__  = ['Miguel Ramos Pernas']
+__email__   = ['miguel.ramos.pernas@cern.ch']
+
+
+# Python
+# ("traceback" is imported when a forked function fails)
+import ctypes
+import os
+import sys
+
+
+__all__ = ['exit_code', 'exit_status', 'flush_c_stdout', 'flush_streams', 'fork_call', 'wait_process']
+
+
+def exit_code( exc ):
+    '''
+    Get the exit code associated to a :class:`SystemExit` exception,
+    displaying its message in the standard error if needed.
+
+    :param exc: exception.
+    :type exc: SystemExit
+    :returns: exit code.
+    :rtype: int
+    '''
+    if exc.code is None:
+        return 0
+    elif isinstance(exc.code, int):
+        return exc.code
+    else:
+        sys.stderr.write('{}\n'.format(exc.code))
+        return 1
+
+
+def exit_status( status ):
+    '''
+    Get the exit code of a process from the status returned by
+    :func:`os.waitpid`.
+
+    :param status: status of the process.
+    :type status: int
+    :returns: exit code of the process (the signal number with negative \
+    sign if the process was killed by a signal).
+    :rtype: int
+    '''
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    else:
+        return os.WEXITSTATUS(status)
+
+
+def flush_c_stdout():
+    '''
+    Flush the C-level buffer of stdout.
+    '''
+    libc = ctypes.CDLL(None)
+    c_stdout = ctypes.c_void_p.in_dll(libc, 'stdout')
+    libc.fflush(c_stdout)
+
+
+def flush_streams():
+    '''
+    Flush the standard output and error, together with the C-level buffer
+    of stdout.
+    '''
+    sys.stdout.flush()
+    sys.stderr.flush()
+    flush_c_stdout()
+
+
+def fork_call( func, *args ):
+    '''
+    Call a function on a child process forked from the current one.
+    The streams are flushed before forking, so the buffered output is not
+    written twice, and before the child exits.
+    The child exits with the code returned by the function (zero if it
+    returns None).
+    If the function raises :class:`SystemExit`, the code is obtained from
+    it, and if any other exception is raised, the traceback is displayed
+    and the child exits with code 1.
+    The function never returns on the child process:
+
+    >>> pid = fork_call(run_fit, 'data.root')
+    >>> assert wait_process(pid) == 0
+
+    :param func: function to call.
+    :type func: callable
+    :param args: arguments to the function.
+    :type args: tuple
+    :returns: identifier of the child process.
+    :rtype: int
+    '''
+    flush_streams()
+
+    pid = os.fork()
+
+    if pid != 0:
+        return pid
+
+    code = 1
+    try:
+        code = func(*args)
+    except SystemExit as e:
+        code = exit_code(e)
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+    finally:
+        try:
+            flush_streams()
+        finally:
+            os._exit(code if code is not None else 0)
+
+
+def wait_process( pid ):
+    '''
+    Wait for a child process to finish.
+
+    :param pid: identifier of the process.
+    :type pid: int
+    :returns: exit code of the process (the signal number with negative \
+    sign if the process was killed by a signal).
+    :rtype: int
+    '''
+    _, status = os.waitpid(pid, 0)
+    return exit_status(status)
@@ -0,0 +1,108 @@
+'''
+Functions to measure the time and memory used by the modes.
+'''
+
+__author__  = ['Miguel Ramos Pernas']
+__email__   = ['miguel.ramos.pernas@cern.ch']
+
+
+# Python
+# (the profilers are imported when profiling a call, since importing them
+# slows down the startup of the scripts)
+import os
+import socket
+import sys
+import time
+
+
+__all__ = ['profiled_call']
+
+
+def profiled_call( func, kwargs, metrics, dump = None, trace_memory = False ):
+    '''
+    Call a function, measuring the time and memory it uses.
+    A new entry is appended to the JSON Lines file "metrics" after the
+    call (even if it fails) with the following fields:
+
+     - "mode": name of the function.
+     - "argv": command line arguments of the process.
+     - "host", "pid": host name and identifier of the process.
+     - "start": time when the call started (seconds since the epoch).
+     - "wall", "cpu": wall and CPU (user plus system) time spent, in seconds.
+     - "cpu_children": CPU time spent by finished child processes.
+     - "process_max_rss": peak resident set size of the whole process since \
+     it started (in kB), so it accounts for the previous calls made in \
+     the same process.
+     - "tracemalloc_peak": peak of the memory allocated by Python (in \
+     bytes), if "trace_memory" is set.
+     - "error": representation of the exception raised, if any.
+
+    The entry is written in a single call, so many processes can append
+    metrics to the same file.
+    If "dump" is provided, the call is profiled with :mod:`cProfile` and
+    the statistics are saved to the given path, which can contain the
+    fields "{mode}" and "{pid}".
+
+    :param func: function to call.
+    :type func: callable
+    :param kwargs: arguments to the function.
+    :type kwargs: dict
+    :param metrics: path to the file where to append the metrics.
+    :type metrics: str
+    :param dump: path to the file where to save the profile statistics.
+    :type dump: str or None
+    :param trace_memory: whether to trace the memory allocations with \
+    :mod:`tracemalloc`. It slows down the execution notably.
+    :type trace_memory: bool
+    :returns: whatever is returned by the function.
+    '''
+    import cProfile
+    import json
+    import resource
+    import tracemalloc
+
+    name = getattr(func, '__name__', repr(func))
+
+    record = {'mode': name,
+              'argv': sys.argv[1:],
+              'host': socket.gethostname(),
+              'pid': os.getpid(),
+              'start': time.time()}
+
+    if trace_memory:
+        tracemalloc.start()
+
+    profiler = cProfile.Profile() if dump is not None else None
+
+    times = os.times()
+    start = time.perf_counter()
+
+    try:
+        if profiler is not None:
+            return profiler.runcall(func, **kwargs)
+        else:
+            return func(**kwargs)
+
+    except BaseException as e:
+        record['error'] = repr(e)
+        raise
+
+    finally:
+        end = time.perf_counter()
+        new = os.times()
+
+        record['wall']            = end - start
+        record['cpu']             = (new.user - times.user) + (new.system - times.system)
+        record['cpu_children']    = (new.children_user - times.children_user) + \
+                                    (new.children_system - times.children_system)
+        record['process_max_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        if trace_memory:
+            record['tracemalloc_peak'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        if profiler is not None:
+            profiler.dump_stats(dump.format(mode=name, pid=os.getpid()))
+
+        with open(metrics, 'a') as f:
+            f.write(json.dumps(record) + '\n')
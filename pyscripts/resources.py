@@ -0,0 +1,337 @@
+'''
+Classes and functions to run many modes at the same time, taking into
+account the resources (cores and memory) they need.
+'''
+
+__author__  = ['Miguel Ramos Pernas']
+__email__   = ['miguel.ramos.pernas@cern.ch']
+
+
+# Python
+# ("json" and "traceback" are imported in the functions using them)
+import collections
+import os
+import pickle
+import selectors
+import signal
+import sys
+import time
+
+# Local
+from pyscripts.parsers import __callable_name__, __resources_name__, _call_mode, _profile_options, process_args
+from pyscripts.processes import exit_status, fork_call
+
+# Environment variables controlling the number of threads of common libraries
+__threads_env__ = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                   'NUMEXPR_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS')
+
+# Result of a scheduled task
+ScheduleResult = collections.namedtuple('ScheduleResult', ['index', 'result', 'error', 'usage'])
+
+
+__all__ = ['Resources', 'parse_memory', 'schedule']
+
+
+class Resources(object):
+    '''
+    Resources needed by a mode.
+    The memory can be given in bytes or as a string with the suffixes "K",
+    "M", "G" or "T" (powers of 1024):
+
+    >>> define_modes(parser, [fit, plot],
+    >>>              resources={'fit': Resources(cores=8, memory='16G'),
+    >>>                         'plot': Resources(memory='200M')})
+
+    :param cores: number of cores.
+    :type cores: int
+    :param memory: memory (in bytes).
+    :type memory: int, str or None
+    :param threads: number of threads to use in the libraries, set through \
+    the "OMP_NUM_THREADS" and similar environment variables. By default it \
+    is equal to the number of cores.
+    :type threads: int or None
+    '''
+    def __init__( self, cores = 1, memory = None, threads = None ):
+        '''
+        Build the object from the resources.
+        '''
+        self.cores   = cores
+        self.memory  = parse_memory(memory) if memory is not None else 0
+        self.threads = threads if threads is not None else cores
+
+    def __repr__( self ):
+        '''
+        Representation of the object.
+        '''
+        return '{}(cores={}, memory={}, threads={})'.format(
+            self.__class__.__name__, self.cores, self.memory, self.threads)
+
+
+def parse_memory( memory ):
+    '''
+    Parse an amount of memory, allowing the suffixes "K", "M", "G" and "T"
+    (optionally followed by "B"), in powers of 1024:
+
+    >>> parse_memory('1.5G')
+    1610612736
+
+    :param memory: amount of memory.
+    :type memory: int or str
+    :returns: amount of memory in bytes.
+    :rtype: int
+    :raises ValueError: if the value can not be parsed.
+    '''
+    if not isinstance(memory, str):
+        return int(memory)
+
+    factors = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+    m = memory.strip().upper().rstrip('B')
+
+    if m and m[-1] in factors:
+        return int(float(m[:-1]) * factors[m[-1]])
+
+    return int(m)
+
+
+def schedule( args, cores = None, memory = None, drop = None, call_name = __callable_name__, lookahead = 64, log = None ):
+    '''
+    Run the modes associated to many sets of arguments at the same time,
+    keeping the sum of the resources they declare (see
+    :func:`pyscripts.define_modes`) within the budget of the machine.
+    Modes with no declared resources are assumed to need one core.
+    Each mode runs on a child process forked from the current one, with the
+    environment variables controlling the number of threads of the common
+    libraries ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", ...) set to
+    the declared value; libraries initialized before the fork are not
+    affected.
+    The results are yielded as they finish:
+
+    >>> args = [parser.parse_args(a) for a in argvs]
+    >>> for r in schedule(args, memory='64G', log='usage.jsonl'):
+    >>>     print(r.index, r.usage['peak_rss'])
+
+    Each result is a named tuple with the position of the arguments
+    ("index"), the value returned by the mode ("result"), the error message,
+    if any ("error") and the measured usage of the resources ("usage"): the
+    declared resources, the peak resident set size ("peak_rss", in bytes,
+    including the memory shared with the parent process), the start and end
+    times, and the wall and CPU times.
+    Tasks are started in order when there are enough free resources.
+    If the first waiting task does not fit, those in the following
+    "lookahead" positions that fit are started before it, but only once:
+    no more tasks are started until it does, so tasks needing many
+    resources are not delayed indefinitely.
+    A task needing more resources than those available is run alone.
+
+    :param args: collection of arguments obtained from the parser.
+    :type args: iterable(argparse.Namespace)
+    :param cores: number of cores available. By default it is the number \
+    of cores of the machine.
+    :type cores: int or None
+    :param memory: memory available. By default it is the physical memory \
+    of the machine.
+    :type memory: int, str or None
+    :param drop: values to drop.
+    :type drop: list(str) or None
+    :param call_name: name of the callable in the arguments.
+    :type call_name: str
+    :param lookahead: number of tasks considered to fill the free resources.
+    :type lookahead: int
+    :param log: path to a JSON Lines file where to append the usage of \
+    each task.
+    :type log: str or None
+    :returns: results of the tasks.
+    :rtype: generator(ScheduleResult)
+    '''
+    import json
+
+    cores  = cores if cores is not None else os.cpu_count()
+    memory = parse_memory(memory) if memory is not None else _physical_memory()
+
+    args = enumerate(args)
+
+    pending = collections.deque()
+    running = {}  # read end of the pipe -> task
+
+    sel = selectors.DefaultSelector()
+
+    used_cores, used_memory = 0, 0
+
+    exhausted = False
+
+    # First waiting task that has already been overtaken by others
+    overtaken = None
+
+    try:
+        while True:
+
+            # Fill the window of pending tasks
+            while not exhausted and len(pending) < lookahead:
+                try:
+                    i, a = next(args)
+                except StopIteration:
+                    exhausted = True
+                    break
+                res = getattr(a, __resources_name__, None)
+                pending.append((i, a, res if res is not None else Resources()))
+
+            if not pending and not running:
+                break
+
+            # Start the tasks that fit in the free resources
+            first = True
+
+            for task in list(pending):
+
+                res = task[2]
+
+                fits = used_cores + res.cores <= cores and used_memory + res.memory <= memory
+
+                if fits or not running:
+                    pending.remove(task)
+                    fd, pid = _start(task[1], res, drop, call_name)
+                    sel.register(fd, selectors.EVENT_READ)
+                    running[fd] = {'task': task, 'pid': pid, 'data': bytearray(), 'start': time.time()}
+                    used_cores  += res.cores
+                    used_memory += res.memory
+                elif first:
+                    # The following tasks can only overtake this one once
+                    if overtaken == task[0]:
+                        break
+                    overtaken = task[0]
+                    first = False
+
+            # Wait for any task to finish
+            finished = None
+            while finished is None:
+                for key, _ in sel.select():
+                    chunk = os.read(key.fd, 1 << 16)
+                    if chunk:
+                        running[key.fd]['data'] += chunk
+                    else:
+                        finished = key.fd
+                        break
+
+            sel.unregister(finished)
+            os.close(finished)
+
+            r = running.pop(finished)
+
+            _, status, usage = os.wait4(r['pid'], 0)
+
+            end = time.time()
+
+            i, a, res = r['task']
+
+            used_cores  -= res.cores
+            used_memory -= res.memory
+
+            try:
+                ok, value = pickle.loads(bytes(r['data']))
+            except Exception:
+                ok, value = False, 'Process finished with exit code {}'.format(exit_status(status))
+
+            # On Linux the resident set size is given in kB
+            peak = usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+            record = {'mode': getattr(getattr(a, call_name), '__name__', None),
+                      'index': i,
+                      'cores': res.cores,
+                      'memory': res.memory,
+                      'threads': res.threads,
+                      'peak_rss': peak,
+                      'start': r['start'],
+                      'end': end,
+                      'wall': end - r['start'],
+                      'cpu': usage.ru_utime + usage.ru_stime,
+                      'failed': not ok}
+
+            if log is not None:
+                with open(log, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+
+            yield ScheduleResult(i, value if ok else None, None if ok else value, record)
+
+    finally:
+        for fd, r in running.items():
+            try:
+                os.kill(r['pid'], signal.SIGKILL)
+                os.waitpid(r['pid'], 0)
+            except OSError:
+                pass
+            os.close(fd)
+        sel.close()
+
+
+def _physical_memory():
+    '''
+    Get the physical memory of the machine.
+
+    :returns: physical memory in bytes.
+    :rtype: int
+    '''
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+def _run_task( args, res, drop, call_name, rfd, wfd ):
+    '''
+    Run a mode on a child process, sending its result (or the formatted
+    exception) through a pipe.
+
+    :param args: arguments obtained from the parser.
+    :type args: argparse.Namespace
+    :param res: resources of the mode.
+    :type res: Resources
+    :param drop: values to drop.
+    :type drop: list(str) or None
+    :param call_name: name of the callable in the arguments.
+    :type call_name: str
+    :param rfd: read end of the pipe, which is closed.
+    :type rfd: int
+    :param wfd: write end of the pipe.
+    :type wfd: int
+    '''
+    import traceback
+
+    os.close(rfd)
+
+    for v in __threads_env__:
+        os.environ[v] = str(res.threads)
+
+    try:
+        out = (True, _call_mode(getattr(args, call_name),
+                                process_args(args, drop, call_name),
+                                _profile_options(args)))
+        payload = pickle.dumps(out)
+    except (Exception, SystemExit):
+        payload = pickle.dumps((False, traceback.format_exc()))
+
+    view = memoryview(payload)
+    while view:
+        view = view[os.write(wfd, view):]
+
+
+def _start( args, res, drop, call_name ):
+    '''
+    Start a child process running a mode.
+
+    :param args: arguments obtained from the parser.
+    :type args: argparse.Namespace
+    :param res: resources of the mode.
+    :type res: Resources
+    :param drop: values to drop.
+    :type drop: list(str) or None
+    :param call_name: name of the callable in the arguments.
+    :type call_name: str
+    :returns: read end of the pipe to receive the result and identifier of \
+    the process.
+    :rtype: tuple(int, int)
+    '''
+    rfd, wfd = os.pipe()
+
+    pid = fork_call(_run_task, args, res, drop, call_name, rfd, wfd)
+
+    os.close(wfd)
+
+    return rfd, pid
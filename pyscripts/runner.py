@@ -0,0 +1,137 @@
+'''
+Functions to run scripts within the current process or on processes
+forked from it, reusing the modules already imported.
+'''
+
+__author__  = ['Miguel Ramos Pernas']
+__email__   = ['miguel.ramos.pernas@cern.ch']
+
+
+# Python
+# ("runpy" and "traceback" are imported when running the scripts)
+import io
+import os
+import sys
+
+# Local
+from pyscripts.processes import exit_code, fork_call, wait_process
+
+
+__all__ = ['run_script']
+
+
+def run_script( path, argv = None, fork = False, keep_modules = None ):
+    '''
+    Run a script as "python path argv..." would do, but without creating
+    a new interpreter.
+    The script is executed as "__main__" using :func:`runpy.run_path`.
+    The values of :attr:`sys.argv` and :attr:`sys.path` are restored after
+    the execution, and the modules imported by the script are removed
+    from :attr:`sys.modules` unless "keep_modules" returns True for them.
+    By default, only the modules placed in the directory of the script (or
+    its subdirectories) are removed, so the packages it depends on are
+    imported only once:
+
+    >>> for year in (2016, 2017, 2018):
+    >>>     assert run_script('fit.py', ['fit', '--year', str(year)]) == 0
+
+    If "fork" is set, the script is run on a child process forked from the
+    current one, so it starts with all the modules of this process already
+    imported, and any change it does to the state of the interpreter is
+    discarded.
+    The standard streams of the child are those associated to the file
+    descriptors 0, 1 and 2.
+
+    :param path: path to the script.
+    :type path: str
+    :param argv: arguments to the script.
+    :type argv: list(str) or None
+    :param fork: whether to run the script on a forked process.
+    :type fork: bool
+    :param keep_modules: function to decide whether to keep a module \
+    imported by the script, taking the module as the only argument.
+    :type keep_modules: callable or None
+    :returns: exit code of the script (the signal number with negative \
+    sign if the process was killed by a signal).
+    :rtype: int
+    '''
+    argv = list(argv) if argv is not None else []
+
+    if not fork:
+        return _run_in_process(path, argv, keep_modules)
+
+    return wait_process(fork_call(_run_forked, path, argv, keep_modules))
+
+
+def _run_forked( path, argv, keep_modules = None ):
+    '''
+    Run a script on a forked process, using streams associated to the
+    file descriptors 0, 1 and 2, since they might have been replaced in the
+    parent.
+
+    :param path: path to the script.
+    :type path: str
+    :param argv: arguments to the script.
+    :type argv: list(str)
+    :param keep_modules: function to decide whether to keep a module \
+    imported by the script.
+    :type keep_modules: callable or None
+    :returns: exit code of the script.
+    :rtype: int
+    '''
+    sys.stdin  = io.TextIOWrapper(io.FileIO(0, 'rb', closefd=False))
+    sys.stdout = io.TextIOWrapper(io.FileIO(1, 'wb', closefd=False))
+    sys.stderr = io.TextIOWrapper(io.FileIO(2, 'wb', closefd=False),
+                                  line_buffering=True)
+
+    return _run_in_process(path, argv, keep_modules)
+
+
+def _run_in_process( path, argv, keep_modules = None ):
+    '''
+    Run a script in the current process.
+
+    :param path: path to the script.
+    :type path: str
+    :param argv: arguments to the script.
+    :type argv: list(str)
+    :param keep_modules: function to decide whether to keep a module \
+    imported by the script.
+    :type keep_modules: callable or None
+    :returns: exit code of the script.
+    :rtype: int
+    '''
+    import runpy
+    import traceback
+
+    directory = os.path.dirname(os.path.abspath(path))
+
+    if keep_modules is None:
+        def keep_modules( m ):
+            f = getattr(m, '__file__', None)
+            return f is None or not os.path.abspath(f).startswith(directory + os.sep)
+
+    saved_argv    = sys.argv
+    saved_path    = list(sys.path)
+    saved_modules = set(sys.modules)
+
+    sys.argv = [path] + argv
+    sys.path.insert(0, directory)
+
+    try:
+        runpy.run_path(path, run_name='__main__')
+        code = 0
+    except SystemExit as e:
+        code = exit_code(e)
+    except Exception:
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.argv    = saved_argv
+        sys.path[:] = saved_path
+
+        for n in set(sys.modules) - saved_modules:
+            if not keep_modules(sys.modules[n]):
+                del sys.modules[n]
+
+    return code
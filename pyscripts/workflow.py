@@ -0,0 +1,389 @@
+'''
+Classes and functions to run sets of scripts with dependencies among them,
+skipping those whose outputs are up to date.
+'''
+
+__author__  = ['Miguel Ramos Pernas']
+__email__   = ['miguel.ramos.pernas@cern.ch']
+
+
+# Python
+# ("hashlib", "queue", "subprocess" and "multiprocessing.pool" are imported
+# in the functions using them, since they are slow to import)
+import collections
+import multiprocessing
+import os
+import sys
+import time
+
+# Local
+from pyscripts.deps import dependencies
+
+# Maximum length of the names of the log files (without the extension)
+__log_name_size__ = 100
+
+# Dependencies of the scripts already processed
+_dependencies = {}
+
+
+__all__ = ['Task', 'run_workflow']
+
+
+class Task(object):
+    '''
+    Invocation of a script, with the files it reads and writes.
+    A task depends on another if it reads any of its outputs.
+
+    >>> fit = Task('fit.py', ['fit', '--year', '2016'],
+    >>>            inputs=['data_2016.root'], outputs=['fit_2016.json'],
+    >>>            pkg_name='mypkg')
+
+    :param script: path to the script.
+    :type script: str
+    :param argv: arguments to the script.
+    :type argv: list(str) or None
+    :param inputs: files read by the script.
+    :type inputs: collection(str) or None
+    :param outputs: files written by the script.
+    :type outputs: collection(str) or None
+    :param pkg_name: name of the package whose files the script depends on. \
+    If provided, the task is also run when any of these files is newer than \
+    the outputs (see :func:`pyscripts.dependencies`).
+    :type pkg_name: str or None
+    :param name: name of the task. By default it is built from the script \
+    and the arguments.
+    :type name: str or None
+    '''
+    def __init__( self, script, argv = None, inputs = None, outputs = None, pkg_name = None, name = None ):
+        '''
+        Build the task.
+        '''
+        self.script   = script
+        self.argv     = list(argv) if argv is not None else []
+        self.inputs   = list(inputs) if inputs is not None else []
+        self.outputs  = list(outputs) if outputs is not None else []
+        self.pkg_name = pkg_name
+        self.name     = name if name is not None else ' '.join([os.path.basename(script)] + self.argv)
+
+    def __repr__( self ):
+        '''
+        Representation of the task.
+        '''
+        return '{}({!r})'.format(self.__class__.__name__, self.name)
+
+    def up_to_date( self ):
+        '''
+        Check whether all the outputs exist and are newer than the inputs,
+        the script and the files of the package it depends on.
+        The dependencies of each script are only calculated once per
+        process.
+
+        :returns: whether the outputs are up to date.
+        :rtype: bool
+        '''
+        if not self.outputs:
+            return False
+
+        try:
+            oldest = min(os.path.getmtime(o) for o in self.outputs)
+        except OSError:
+            return False
+
+        sources = list(self.inputs) + [self.script]
+        if self.pkg_name is not None:
+            sources += _script_dependencies(self.script, self.pkg_name)
+
+        try:
+            newest = max(os.path.getmtime(s) for s in sources)
+        except OSError:
+            return False
+
+        return newest <= oldest
+
+
+def run_workflow( tasks, processes = None, force = False, log_dir = None ):
+    '''
+    Run a set of tasks, taking into account the dependencies among them.
+    Tasks are run (using the current python executable) as soon as the tasks
+    they depend on finish, with at most "processes" of them running at the
+    same time.
+    Tasks whose outputs are up to date are skipped (see
+    :meth:`Task.up_to_date`), and those depending on a task that fails are
+    not run.
+    The returned report contains, for each task, a dictionary with its
+    "status" ("done", "failed", "skipped" or "cancelled"), the exit code
+    ("code") and the "start", "end" and "elapsed" times (tasks that can not
+    be started also have the reason in "error"), together with the
+    critical path ("critical_path"), which is the chain of dependent tasks
+    with the longest elapsed time ("critical_time").
+
+    >>> report = run_workflow([fit_2016, fit_2017, merge], processes=2)
+    >>> print(report['critical_path'], report['critical_time'])
+
+    :param tasks: tasks to run.
+    :type tasks: collection(Task)
+    :param processes: maximum number of tasks running at the same time.
+    :type processes: int or None
+    :param force: whether to run the tasks even if they are up to date.
+    :type force: bool
+    :param log_dir: directory where to write the output of each task, in \
+    a file with the name of the task (long names are truncated and \
+    completed with a hash). By default the output is not redirected.
+    :type log_dir: str or None
+    :returns: report of the execution.
+    :rtype: dict
+    :raises ValueError: if there are several tasks with the same name or \
+    producing the same output, or if the dependencies are cyclic.
+    '''
+    import multiprocessing.pool
+    import queue
+
+    processes = processes if processes is not None else multiprocessing.cpu_count()
+
+    tasks = list(tasks)
+
+    names = [t.name for t in tasks]
+    if len(set(names)) != len(names):
+        raise ValueError('Several tasks have the same name')
+
+    tasks = dict(zip(names, tasks))
+
+    upstream, downstream = _task_graph(tasks.values())
+
+    # Order the tasks topologically, to detect cycles
+    _topological_order(tasks, upstream, downstream)
+
+    if log_dir is not None:
+        os.makedirs(log_dir, exist_ok=True)
+
+    status = {n: {'status': None, 'code': None, 'start': None, 'end': None, 'elapsed': 0.}
+              for n in tasks}
+
+    remaining = {n: len(upstream[n]) for n in tasks}
+
+    results = queue.Queue()
+
+    ready = collections.deque(n for n, r in remaining.items() if r == 0)
+
+    running = 0
+
+    with multiprocessing.pool.ThreadPool(processes) as pool:
+
+        while ready or running:
+
+            finished = []
+
+            while ready:
+
+                n = ready.popleft()
+                t = tasks[n]
+
+                if any(status[u]['status'] in ('failed', 'cancelled') for u in upstream[n]):
+                    status[n]['status'] = 'cancelled'
+                    finished.append(n)
+                elif not force and t.up_to_date():
+                    status[n]['status'] = 'skipped'
+                    finished.append(n)
+                else:
+                    log = os.path.join(log_dir, _log_name(n)) if log_dir is not None else None
+                    pool.apply_async(_run_task, (t.script, t.argv, log),
+                                     callback=lambda r, n=n: results.put((n, r)),
+                                     error_callback=lambda e, n=n: results.put((n, e)))
+                    running += 1
+
+            if not finished:
+                n, r = results.get()
+                running -= 1
+                if isinstance(r, BaseException):
+                    # The task could not be started
+                    status[n].update({'status': 'failed', 'error': '{}: {}'.format(r.__class__.__name__, r)})
+                else:
+                    code, start, end = r
+                    status[n].update({'status': 'done' if code == 0 else 'failed',
+                                      'code': code, 'start': start, 'end': end, 'elapsed': end - start})
+                finished.append(n)
+
+            for n in finished:
+                for d in downstream[n]:
+                    remaining[d] -= 1
+                    if remaining[d] == 0:
+                        ready.append(d)
+
+    path, total = _critical_path(tasks, upstream, downstream, status)
+
+    return {'tasks': status, 'critical_path': path, 'critical_time': total}
+
+
+def _critical_path( tasks, upstream, downstream, status ):
+    '''
+    Calculate the chain of dependent tasks with the longest elapsed time.
+
+    :param tasks: tasks by name.
+    :type tasks: dict(str, Task)
+    :param upstream: tasks each task depends on.
+    :type upstream: dict(str, set(str))
+    :param downstream: tasks depending on each task.
+    :type downstream: dict(str, set(str))
+    :param status: status of the tasks.
+    :type status: dict(str, dict)
+    :returns: names of the tasks in the critical path and its elapsed time.
+    :rtype: tuple(list(str), float)
+    '''
+    longest = {}
+    previous = {}
+
+    for n in _topological_order(tasks, upstream, downstream):
+
+        best = max(upstream[n], key=lambda u: longest[u], default=None)
+
+        previous[n] = best
+        longest[n]  = status[n]['elapsed'] + (longest[best] if best is not None else 0.)
+
+    if not longest:
+        return [], 0.
+
+    n = max(longest, key=lambda k: longest[k])
+
+    total = longest[n]
+
+    path = []
+    while n is not None:
+        path.append(n)
+        n = previous[n]
+
+    return path[::-1], total
+
+
+def _log_name( name ):
+    '''
+    Build the name of the log file of a task.
+    Names that are too long are truncated, adding a hash of the full name
+    to keep them unique.
+
+    :param name: name of the task.
+    :type name: str
+    :returns: name of the log file.
+    :rtype: str
+    '''
+    import hashlib
+
+    log = name.replace(os.sep, '_')
+
+    if len(log) > __log_name_size__:
+        digest = hashlib.sha1(name.encode()).hexdigest()[:16]
+        log = log[:__log_name_size__ - len(digest) - 1] + '-' + digest
+
+    return log + '.log'
+
+
+def _run_task( script, argv, log = None ):
+    '''
+    Run a script on a new process.
+
+    :param script: path to the script.
+    :type script: str
+    :param argv: arguments to the script.
+    :type argv: list(str)
+    :param log: file where to write the output.
+    :type log: str or None
+    :returns: exit code and start and end times.
+    :rtype: tuple(int, float, float)
+    '''
+    import subprocess
+
+    start = time.time()
+
+    if log is not None:
+        with open(log, 'wb') as f:
+            code = subprocess.call([sys.executable, script] + argv,
+                                   stdout=f, stderr=subprocess.STDOUT)
+    else:
+        code = subprocess.call([sys.executable, script] + argv)
+
+    return code, start, time.time()
+
+
+def _script_dependencies( script, pkg_name ):
+    '''
+    Get the absolute paths to the files of a package that the given script
+    depends on, calculating them only once per process.
+
+    :param script: path to the script.
+    :type script: str
+    :param pkg_name: name of the package.
+    :type pkg_name: str
+    :returns: paths to the dependencies.
+    :rtype: list(str)
+    '''
+    key = (os.path.abspath(script), pkg_name)
+
+    if key not in _dependencies:
+        _dependencies[key] = dependencies(key[0], pkg_name, abspath=True)
+
+    return _dependencies[key]
+
+
+def _task_graph( tasks ):
+    '''
+    Build the graph of dependencies among the tasks.
+
+    :param tasks: tasks to process.
+    :type tasks: collection(Task)
+    :returns: tasks each task depends on and tasks depending on each task.
+    :rtype: tuple(dict(str, set(str)), dict(str, set(str)))
+    :raises ValueError: if several tasks produce the same output.
+    '''
+    producers = {}
+    for t in tasks:
+        for o in t.outputs:
+            o = os.path.abspath(o)
+            if o in producers:
+                raise ValueError('Output "{}" is produced by tasks "{}" '\
+                                 'and "{}"'.format(o, producers[o], t.name))
+            producers[o] = t.name
+
+    upstream   = {t.name: set() for t in tasks}
+    downstream = {t.name: set() for t in tasks}
+
+    for t in tasks:
+        for i in t.inputs:
+            p = producers.get(os.path.abspath(i))
+            if p is not None and p != t.name:
+                upstream[t.name].add(p)
+                downstream[p].add(t.name)
+
+    return upstream, downstream
+
+
+def _topological_order( tasks, upstream, downstream ):
+    '''
+    Order the tasks so each one appears after those it depends on.
+
+    :param tasks: tasks by name.
+    :type tasks: dict(str, Task)
+    :param upstream: tasks each task depends on.
+    :type upstream: dict(str, set(str))
+    :param downstream: tasks depending on each task.
+    :type downstream: dict(str, set(str))
+    :returns: names of the tasks.
+    :rtype: list(str)
+    :raises ValueError: if the dependencies are cyclic.
+    '''
+    remaining = {n: len(upstream[n]) for n in tasks}
+
+    ready = collections.deque(n for n, r in remaining.items() if r == 0)
+
+    order = []
+    while ready:
+        n = ready.popleft()
+        order.append(n)
+        for d in downstream[n]:
+            remaining[d] -= 1
+            if remaining[d] == 0:
+                ready.append(d)
+
+    if len(order) != len(tasks):
+        raise ValueError('Cyclic dependencies among the '\
+                         'tasks: {}'.format(sorted(set(tasks) - set(order))))
+
+    return order
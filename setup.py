@@ -99,6 +99,16 @@ def setup_package():
         # Requisites
         install_requires = install_requirements(),
 
+        # Command line tools
+        entry_points = {
+            'console_scripts': [
+                'pyscripts-client = pyscripts.daemon:client_main',
+                'pyscripts-complete = pyscripts.completion:complete_main',
+                'pyscripts-precompile = pyscripts.compilation:precompile_main',
+                'pyscripts-worker = pyscripts.executors:worker_main',
+            ],
+        },
+
         # Test requirements
         setup_requires = ['pytest-runner'],
 
@@ -0,0 +1,61 @@
+'''
+Script to test the compilation of the dependencies of a script.
+'''
+
+# Python
+import argparse
+import os
+
+# Local
+import pyscripts
+
+__deps_path__ = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'deps.py')
+
+
+def _check( prefix, flags ):
+    '''
+    Check that the compiled files exist in the given prefix, with the
+    flags corresponding to the invalidation mode.
+    '''
+    package = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'package')
+
+    for m in ('__init__', 'mod1', 'mod2', 'mod3'):
+
+        d = os.path.join(prefix, package.lstrip(os.sep))
+        matches = [f for f in os.listdir(d) if f.startswith(m + '.')]
+        assert len(matches) == 1
+
+        with open(os.path.join(d, matches[0]), 'rb') as f:
+            assert int.from_bytes(f.read(8)[4:], 'little') == flags
+
+
+def precompile( prefix ):
+    '''
+    Execute the test for the "precompile" function.
+    '''
+    compiled = pyscripts.precompile([__deps_path__], 'package', processes=2,
+                                    invalidation_mode='checked-hash', pycache_prefix=prefix)
+
+    assert len(compiled) == 4
+
+    _check(prefix, 3)
+
+
+def precompile_main( prefix ):
+    '''
+    Execute the test for the "precompile_main" function.
+    '''
+    assert pyscripts.precompile_main([__deps_path__, '--package', 'package',
+                                      '--pycache-prefix', prefix]) == 0
+
+    _check(prefix, 0)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    pyscripts.define_modes(parser, [precompile, precompile_main],
+                           apply_to_parsers=lambda p: p.add_argument('prefix'))
+
+    pyscripts.call(parser.parse_args())
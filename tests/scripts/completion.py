@@ -0,0 +1,33 @@
+'''
+Script to test the completion of the arguments.
+'''
+
+# Python
+import argparse
+
+# Local
+import pyscripts
+
+
+def add_arguments( p ):
+    '''
+    Add the arguments to the parser of each mode.
+    '''
+    p.add_argument('year', type=int, choices=[2016, 2017, 2018])
+    p.add_argument('--model', choices=['gauss', 'crystal-ball'])
+    p.add_argument('--verbose', action='store_true')
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--config', type=str)
+
+    # The modules of the modes do not exist, but they are never imported
+    pyscripts.define_modes(parser, [pyscripts.LazyMode('missing.fits:fit', help='Fit'),
+                                    pyscripts.LazyMode('missing.plots:plot', help='Plot')],
+                           apply_to_parsers=add_arguments)
+
+    pyscripts.autocomplete(parser)
+
+    pyscripts.call(parser.parse_args())
@@ -0,0 +1,49 @@
+'''
+Script to test the behaviour of the server of modes.
+'''
+
+# Python
+import argparse
+import os
+import sys
+
+# Local
+import pyscripts
+
+
+def display( message ):
+    '''
+    Display a message in the standard output and error.
+    '''
+    print(message)
+    sys.stderr.write('error: {}\n'.format(message))
+
+
+def environment( variable ):
+    '''
+    Display the working directory and the value of an environment variable.
+    '''
+    print(os.getcwd())
+    print(os.environ.get(variable))
+
+
+def fail( code ):
+    '''
+    Exit with the given code, or raise an exception if it is zero.
+    '''
+    if code == 0:
+        raise RuntimeError('Failed')
+    sys.exit(code)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    subparsers = pyscripts.define_modes(parser, [display, environment, fail])
+
+    subparsers.choices['display'].add_argument('message', type=str)
+    subparsers.choices['environment'].add_argument('variable', type=str)
+    subparsers.choices['fail'].add_argument('code', type=int)
+
+    pyscripts.serve(parser, sys.argv[1])
@@ -24,6 +24,19 @@ def dependencies():
     assert all(d in match for d in deps)
 
 
+def dependencies_executor():
+    '''
+    Execute the test for the "dependencies" function using an executor.
+    '''
+    with pyscripts.LocalExecutor(2) as executor:
+        deps = pyscripts.dependencies(__file__, 'package', executor=executor)
+
+    match = [os.path.join('package', d)
+             for d in ('mod1.py', 'mod2.py', 'mod3.py')]
+
+    assert sorted(deps) == sorted(match)
+
+
 def direct_dependencies():
     '''
     Execute the test for the "dependencies" function.
@@ -37,7 +50,7 @@ if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description='Determine dependencies')
 
-    pyscripts.define_modes(parser, [dependencies, direct_dependencies])
+    pyscripts.define_modes(parser, [dependencies, dependencies_executor, direct_dependencies])
 
     args = parser.parse_args()
 
@@ -0,0 +1,87 @@
+'''
+Script to test the behaviour of the "RedirectedPool" class.
+'''
+
+# Python
+import argparse
+import ctypes
+import sys
+
+# Local
+import pyscripts
+
+
+def display( i ):
+    '''
+    Display a message from Python and C, returning the given value.
+    '''
+    print('python {}'.format(i))
+    lib.display('c {}\n'.format(i).encode())
+    return i
+
+
+def display_and_fail( i ):
+    '''
+    Display a message and raise an exception for odd values.
+    '''
+    print('python {}'.format(i))
+    if i % 2:
+        raise ValueError('odd value {}'.format(i))
+    return i
+
+
+def display_stderr( i ):
+    '''
+    Display a message in the standard error.
+    '''
+    sys.stderr.write('error {}\n'.format(i))
+    return i
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('library', type=str,
+                        help='Path to the library')
+
+    args = parser.parse_args()
+
+    lib = ctypes.CDLL(args.library)
+
+    # Capture standard output, in order
+    with pyscripts.RedirectedPool(3) as pool:
+
+        results = pool.map(display, range(10), chunksize=2)
+
+    assert [r[0] for r in results] == list(range(10))
+    assert [r[1] for r in results] == list(range(10))
+    for i, _, output in results:
+        assert output == 'python {}\nc {}\n'.format(i, i).encode()
+
+    # Capture standard error
+    with pyscripts.RedirectedPool(2, stderr=True) as pool:
+
+        results = sorted(pool.imap_unordered(display_stderr, range(4)))
+
+    for i, r, output in results:
+        assert output == 'error {}\n'.format(i).encode()
+
+    # Keep the output of the tasks raising exceptions
+    with pyscripts.RedirectedPool(2) as pool:
+
+        results = pool.map(display_and_fail, range(4), return_exceptions=True)
+
+        assert [r[0] for r in results] == list(range(4))
+        for i, r, output in results:
+            assert output == 'python {}\n'.format(i).encode()
+            if i % 2:
+                assert isinstance(r, ValueError) and r.output == output and r.task_id == i
+            else:
+                assert r == i
+
+        try:
+            pool.map(display_and_fail, range(4))
+        except ValueError as error:
+            assert error.task_id == 1 and error.output == b'python 1\n'
+        else:
+            raise AssertionError('the exception was not raised')
@@ -0,0 +1,21 @@
+'''
+Script to test the behaviour of the "run_script" function.
+'''
+
+# Python
+import sys
+
+# Local
+from package import mod1
+
+
+if __name__ == '__main__':
+
+    mod1.value = getattr(mod1, 'value', 0) + 1
+
+    print(' '.join(sys.argv[1:]))
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'fail':
+        raise RuntimeError('Failed')
+
+    sys.exit(mod1.value if len(sys.argv) > 1 and sys.argv[1] == 'value' else 0)
@@ -0,0 +1,60 @@
+'''
+Script to test the behaviour of the "timestamped_stdout_redirector" function.
+'''
+
+# Python
+import argparse
+import ctypes
+import json
+import time
+
+# Local
+import pyscripts
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('library', type=str,
+                        help='Path to the library')
+    parser.add_argument('output', type=str,
+                        help='Path to the output JSON Lines file')
+
+    args = parser.parse_args()
+
+    lib = ctypes.CDLL(args.library)
+
+    start = time.monotonic()
+
+    with pyscripts.timestamped_stdout_redirector(args.output) as lines:
+
+        print('first')
+        time.sleep(0.1)
+        print('second')
+        lib.display(b'third\n')
+        time.sleep(0.1)
+        lib.display(b'fourth')
+
+    end = time.monotonic()
+
+    assert len(lines) == 4
+
+    assert [l for _, l in lines] == [b'first\n', b'second\n', b'third\n', b'fourth']
+
+    timestamps = [t for t, _ in lines]
+
+    assert start <= timestamps[0]
+    assert timestamps[1] - timestamps[0] >= 0.1
+    assert timestamps[3] - timestamps[2] >= 0.1  # the C output is flushed after each line
+    assert timestamps == sorted(timestamps)
+    assert timestamps[-1] <= end
+
+    assert lines[-1] == (timestamps[-1], b'fourth')
+
+    # The exported file must contain the same information
+    with open(args.output) as f:
+        entries = [json.loads(l) for l in f]
+
+    assert [e['index'] for e in entries] == list(range(4))
+    assert [e['line'] for e in entries] == ['first', 'second', 'third', 'fourth']
+    assert [e['timestamp'] for e in entries] == timestamps
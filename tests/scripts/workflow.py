@@ -0,0 +1,32 @@
+'''
+Script to test the execution of workflows. It concatenates the input files
+into the output file, after waiting for some time.
+'''
+
+# Python
+import argparse
+import os
+import sys
+import time
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('output', type=str)
+    parser.add_argument('inputs', nargs='*')
+    parser.add_argument('--sleep', type=float, default=0.)
+    parser.add_argument('--fail', action='store_true')
+
+    args = parser.parse_args()
+
+    time.sleep(args.sleep)
+
+    if args.fail:
+        sys.exit(1)
+
+    with open(args.output, 'w') as f:
+        f.write(os.path.basename(args.output) + '\n')
+        for i in args.inputs:
+            with open(i) as fi:
+                f.write(fi.read())
@@ -0,0 +1,157 @@
+'''
+Test functions for the "cache" module.
+'''
+
+__author__ = ['Miguel Ramos Pernas']
+__email__  = ['miguel.ramos.pernas@cern.ch']
+
+# Python
+import argparse
+import importlib.util
+import os
+import pytest
+import time
+
+# Local
+import pyscripts
+
+# Number of times the mode has been called
+_ncalls = 0
+
+
+def _mode( value ):
+    ''' Mode whose result is cached '''
+    global _ncalls
+    _ncalls += 1
+    return [value] * 3
+
+
+class _Data(object):
+    ''' Object whose representation does not show its content '''
+    def __init__( self, values ):
+        self.values = values
+
+    def __repr__( self ):
+        return '_Data(...)'
+
+
+def test_cached_call( tmpdir ):
+    '''
+    Test the "cached_call" function.
+    '''
+    parser = argparse.ArgumentParser()
+
+    pyscripts.define_modes(parser, [_mode], apply_to_parsers=lambda p: p.add_argument('value', type=int))
+
+    cache = pyscripts.ResultCache(str(tmpdir))
+
+    ncalls = _ncalls
+
+    assert pyscripts.cached_call(parser.parse_args('_mode 1'.split()), cache) == [1, 1, 1]
+    assert pyscripts.cached_call(parser.parse_args('_mode 1'.split()), cache) == [1, 1, 1]
+    assert _ncalls == ncalls + 1
+
+    assert pyscripts.cached_call(parser.parse_args('_mode 2'.split()), cache) == [2, 2, 2]
+    assert _ncalls == ncalls + 2
+
+    # Arguments that can not be serialized are not cached
+    args = parser.parse_args('_mode 1'.split())
+    args.value = lambda: None
+
+    with pytest.warns(RuntimeWarning):
+        assert len(pyscripts.cached_call(args, cache)) == 3
+    assert _ncalls == ncalls + 3
+
+
+def test_resultcache( tmpdir, monkeypatch ):
+    '''
+    Test the "ResultCache" class.
+    '''
+    cache = pyscripts.ResultCache(str(tmpdir), max_size=2500)
+
+    assert cache.get('a') == (False, None)
+
+    cache.put('a', b'a' * 1000)
+    cache.put('b', b'b' * 1000)
+
+    # Make "a" more recent than "b"
+    os.utime(cache._file('b'), (time.time() - 10, time.time() - 10))
+    assert cache.get('a') == (True, b'a' * 1000)
+
+    cache.put('c', b'c' * 1000)
+
+    assert cache.get('b') == (False, None)
+    assert cache.get('a')[0] and cache.get('c')[0]
+    assert cache.size <= cache.max_size
+
+    cache.clear()
+    assert cache.size == 0
+
+    # The key depends on the arguments, the code and the dependencies
+    k = cache.key(_mode, {'value': 1})
+    assert k == cache.key(_mode, {'value': 1})
+    assert k != cache.key(_mode, {'value': 2})
+    assert k != cache.key(test_resultcache, {'value': 1})
+
+    # Arguments that can not be converted to JSON
+    assert cache.key(_mode, {'value': _Data([1, 2])}) == cache.key(_mode, {'value': _Data([1, 2])})
+    assert cache.key(_mode, {'value': _Data([1, 2])}) != cache.key(_mode, {'value': _Data([1, 3])})
+
+    with pytest.raises(TypeError):
+        cache.key(_mode, {'value': lambda: None})
+
+    dep = tmpdir.join('dep.py')
+    dep.write('a = 1')
+
+    monkeypatch.setitem(pyscripts.cache._dependencies, (os.path.abspath(__file__), 'package'), {str(dep)})
+
+    k = cache.key(_mode, {'value': 1}, pkg_name='package')
+    assert k == cache.key(_mode, {'value': 1}, pkg_name='package')
+
+    dep.write('a = 2')
+    assert k != cache.key(_mode, {'value': 1}, pkg_name='package')
+
+
+def test_resultcache_key_modules( tmpdir ):
+    '''
+    Test that functions with the same code in different files have
+    different keys, and that the keys depend on the whole file.
+    '''
+    code = '''
+FACTOR = {}
+
+def fit( value ):
+    \'\'\' Mode reading a global variable \'\'\'
+    return FACTOR * value
+'''
+    modules = []
+    for name, factor in (('a', 2), ('b', 100)):
+
+        path = tmpdir.join(name + '.py')
+        path.write(code.format(factor))
+
+        spec = importlib.util.spec_from_file_location(name, str(path))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+        modules.append(module)
+
+    cache = pyscripts.ResultCache(str(tmpdir.join('cache')))
+
+    results = []
+    for m in modules:
+        parser = argparse.ArgumentParser()
+        pyscripts.define_modes(parser, [m.fit], apply_to_parsers=lambda p: p.add_argument('value', type=int))
+        results.append(pyscripts.cached_call(parser.parse_args('fit 3'.split()), cache))
+
+    assert results == [6, 300]
+
+    # Modifying other parts of the file changes the key
+    k = cache.key(modules[0].fit, {'value': 3})
+
+    tmpdir.join('a.py').write(code.format(2) + '''
+def helper():
+    \'\'\' Function added to the file \'\'\'
+''')
+
+    assert k != cache.key(modules[0].fit, {'value': 3})
@@ -0,0 +1,53 @@
+'''
+Test functions for the "compilation" module.
+'''
+
+__author__ = ['Miguel Ramos Pernas']
+__email__  = ['miguel.ramos.pernas@cern.ch']
+
+# Python
+import os
+import py_compile
+import pytest
+import sys
+
+# Local
+import pyscripts
+
+__script_path__ = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts/compilation.py')
+
+
+def test_precompile( tmpdir ):
+    '''
+    Test the "precompile" function.
+    '''
+    assert pyscripts.run_script(__script_path__, ['precompile', str(tmpdir)], fork=True) == 0
+
+    with pytest.raises(ValueError):
+        pyscripts.precompile([], 'pkg', invalidation_mode='unknown')
+
+
+def test_precompile_unsupported( monkeypatch ):
+    '''
+    Test the "precompile" function with options not supported by the
+    interpreter.
+    '''
+    with monkeypatch.context() as m:
+        # The imports need "sys.pycache_prefix", so it is only removed here
+        m.delattr(sys, 'pycache_prefix', raising=False)
+        with pytest.raises(RuntimeError):
+            pyscripts.precompile([], 'pkg', pycache_prefix='cache')
+
+    monkeypatch.delattr(py_compile, 'PycInvalidationMode', raising=False)
+
+    with pytest.raises(RuntimeError):
+        pyscripts.precompile([], 'pkg', invalidation_mode='checked-hash')
+
+    assert pyscripts.precompile([], 'pkg') == []
+
+
+def test_precompile_main( tmpdir ):
+    '''
+    Test the "precompile_main" function.
+    '''
+    assert pyscripts.run_script(__script_path__, ['precompile_main', str(tmpdir)], fork=True) == 0
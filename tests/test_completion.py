@@ -0,0 +1,90 @@
+'''
+Test functions for the "completion" module.
+'''
+
+__author__ = ['Miguel Ramos Pernas']
+__email__  = ['miguel.ramos.pernas@cern.ch']
+
+# Python
+import hashlib
+import json
+import os
+import pytest
+import subprocess
+
+# Local
+import pyscripts
+
+__script_path__ = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts/completion.py')
+
+
+def test_autocomplete( tmpdir ):
+    '''
+    Test the "autocomplete" function.
+    '''
+    path = tmpdir.join('structure.json')
+
+    env = dict(os.environ)
+    env[pyscripts.completion.__dump_env__] = str(path)
+
+    p = subprocess.Popen(['python', __script_path__], env=env)
+    assert p.wait() == 0
+
+    structure = json.loads(path.read())
+
+    assert sorted(structure['subcommands']) == ['fit', 'plot']
+    assert structure['subcommands']['fit']['positionals'] == [{'nargs': None, 'choices': ['2016', '2017', '2018']}]
+
+
+def test_complete( tmpdir ):
+    '''
+    Test the "complete" function.
+    '''
+    cache = str(tmpdir.join('cache'))
+
+    def _complete( *words ):
+        return pyscripts.complete(__script_path__, list(words), cache_path=cache)
+
+    assert _complete('') == ['fit', 'plot']
+    assert len(os.listdir(cache)) == 1
+
+    assert _complete('f') == ['fit']
+    assert _complete('--') == ['--config', '--help']
+    assert _complete('--config', '') == []
+    assert _complete('--config', 'file', 'p') == ['plot']
+    assert _complete('fit', '') == ['2016', '2017', '2018']
+    assert _complete('fit', '--v') == ['--verbose']
+    assert _complete('fit', '--model', 'g') == ['gauss']
+    assert _complete('fit', '--model', 'gauss', '201') == ['2016', '2017', '2018']
+    assert _complete('fit', '2016', '') == []
+    assert pyscripts.complete(__script_path__, ['fit', ''], cword=0, cache_path=cache) == ['fit']
+
+    # The cache is used without running the script
+    script = tmpdir.join('script.py')
+    script.write('raise RuntimeError()')
+
+    with pytest.raises(RuntimeError):
+        pyscripts.complete(str(script), [''], cache_path=cache)
+
+    key = os.listdir(cache)[0]
+    tmpdir.join('cache', key).copy(tmpdir.join('cache', hashlib.sha256(script.read_binary()).hexdigest() + '.json'))
+
+    assert pyscripts.complete(str(script), [''], cache_path=cache) == ['fit', 'plot']
+
+
+def test_complete_main( tmpdir, capsys, monkeypatch ):
+    '''
+    Test the "complete_main" function.
+    '''
+    monkeypatch.setattr(pyscripts.completion, '__cache_path__', str(tmpdir))
+
+    assert pyscripts.complete_main(['--script', __script_path__, '--', 'fit', '--model', '']) == 0
+    assert capsys.readouterr().out == 'crystal-ball\ngauss\n'
+
+    assert pyscripts.complete_main(['--script', __script_path__, '--bash', '--command', 'fit.py']) == 0
+    assert 'complete -o default -F _pyscripts_complete_' in capsys.readouterr().out
+
+    # The path and the command are quoted in the bash code
+    assert pyscripts.complete_main(['--script', __script_path__, '--bash', '--command', 'my fit.py; ls']) == 0
+    assert "complete -o default -F _pyscripts_complete_{} 'my fit.py; ls'\n".format(
+        hashlib.sha1(b'my fit.py; ls').hexdigest()[:12]) in capsys.readouterr().out
@@ -0,0 +1,153 @@
+'''
+Test functions for the "daemon" module.
+'''
+
+__author__ = ['Miguel Ramos Pernas']
+__email__  = ['miguel.ramos.pernas@cern.ch']
+
+# Python
+import argparse
+import io
+import multiprocessing.pool
+import os
+import pytest
+import signal
+import socket
+import subprocess
+import time
+
+# Local
+import pyscripts
+
+__script_path__ = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts/daemon.py')
+
+
+@pytest.fixture
+def server( tmpdir ):
+    '''
+    Start a server, returning the path to its socket.
+    '''
+    address = str(tmpdir.join('daemon.sock'))
+
+    p = _start(address)
+
+    yield address
+
+    p.terminate()
+    p.wait()
+
+
+def _start( address ):
+    '''
+    Start a server on the given address, waiting until it is ready.
+    '''
+    p = subprocess.Popen(['python', __script_path__, address])
+
+    while True:
+        assert p.poll() is None
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(address)
+                break
+            except OSError:
+                time.sleep(0.01)
+
+    return p
+
+
+def _run( address, *args, **kwargs ):
+    '''
+    Run a mode on the server, returning the exit code and the output.
+    '''
+    stdout, stderr = io.BytesIO(), io.BytesIO()
+
+    code = pyscripts.client(address, list(args), stdout=stdout, stderr=stderr, **kwargs)
+
+    return code, stdout.getvalue(), stderr.getvalue()
+
+
+def test_client( server, tmpdir ):
+    '''
+    Test the "client" function.
+    '''
+    code, out, err = _run(server, 'display', 'hello')
+
+    assert code == 0
+    assert out == b'hello\n'
+    assert err == b'error: hello\n'
+
+    code, out, _ = _run(server, 'environment', 'VARIABLE', cwd=str(tmpdir), env={'VARIABLE': 'value'})
+
+    assert code == 0
+    assert out.decode().split() == [str(tmpdir), 'value']
+
+    code, _, err = _run(server, 'fail', '0')
+
+    assert code == 1
+    assert b'RuntimeError' in err
+
+    assert _run(server, 'fail', '3')[0] == 3
+
+    # Errors parsing the arguments
+    assert _run(server, 'fail', 'none')[0] == 2
+
+
+def test_client_main( server, capfd ):
+    '''
+    Test the "client_main" function.
+    '''
+    assert pyscripts.client_main(['--socket', server, 'display', 'hello']) == 0
+
+    out, err = capfd.readouterr()
+
+    assert out == 'hello\n'
+    assert err == 'error: hello\n'
+
+    assert pyscripts.client_main(['--socket', server, 'fail', '4']) == 4
+
+
+def test_serve( server ):
+    '''
+    Test the "serve" function.
+    '''
+    # Several requests processed at the same time
+    with multiprocessing.pool.ThreadPool(4) as pool:
+        results = pool.map(lambda i: _run(server, 'display', str(i)), range(10))
+
+    assert [r[1] for r in results] == ['{}\n'.format(i).encode() for i in range(10)]
+
+
+def test_serve_socket_file( server, tmpdir, capfd ):
+    '''
+    Test the handling of the socket file by the "serve" function.
+    '''
+    # A second server does not remove the socket of a running one
+    with pytest.raises(OSError):
+        pyscripts.serve(argparse.ArgumentParser(), server)
+
+    assert os.path.exists(server)
+    assert _run(server, 'display', 'alive')[0] == 0
+
+    # The socket file is removed when the server is terminated
+    address = str(tmpdir.join('other.sock'))
+
+    p = _start(address)
+    p.terminate()
+    assert p.wait() == 128 + signal.SIGTERM
+    assert not os.path.exists(address)
+
+    # Stale sockets of killed servers are replaced
+    p = _start(address)
+    p.kill()
+    p.wait()
+    assert os.path.exists(address)
+
+    p = _start(address)
+    try:
+        assert _run(address, 'display', 'restarted')[1] == b'restarted\n'
+    finally:
+        p.terminate()
+        p.wait()
+
+    # The probe of the second server does not produce errors in the first one
+    assert 'Traceback' not in capfd.readouterr().err
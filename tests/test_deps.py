@@ -7,7 +7,6 @@ __email__  = ['miguel.ramos.pernas@cern.ch']
 
 # Python
 import os
-import subprocess
 
 # Local
 import pyscripts
@@ -19,13 +18,12 @@ def test_dependencies():
     '''
     Test the "dependencies" function.
     '''
-    p = subprocess.Popen('python {} dependencies'.format(__script_path__).split())
-    assert p.wait() == 0
+    assert pyscripts.run_script(__script_path__, ['dependencies'], fork=True) == 0
+    assert pyscripts.run_script(__script_path__, ['dependencies_executor'], fork=True) == 0
 
 
 def test_direct_dependencies():
     '''
     Test the "direct_dependencies" function.
     '''
-    p = subprocess.Popen('python {} direct_dependencies'.format(__script_path__).split())
-    assert p.wait() == 0
+    assert pyscripts.run_script(__script_path__, ['direct_dependencies'], fork=True) == 0
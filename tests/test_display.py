@@ -10,30 +10,105 @@ import pyscripts
 
 # Python
 import ctypes
+import json
 import os
 import subprocess
+import sys
 
 
-def test_stdout_redirector( tmpdir ):
-    '''
-    Test for the "stdout_redirector" function.
-    '''
-    # Define path to the directories
-    path = os.path.dirname(os.path.abspath(__file__))
+__scripts_path__ = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts')
 
-    scripts_path = os.path.join(path, 'scripts')
 
-    # Compile C code
-    code_path = os.path.join(scripts_path, 'code/display.c')
+def _compile_library( tmpdir ):
+    '''
+    Compile the C code used to display messages, returning the path to the
+    library.
+    '''
+    code_path = os.path.join(__scripts_path__, 'code/display.c')
 
     lib_path = tmpdir.join('testlib.so')
 
     os.system('gcc -shared -o {} -fPIC {}'.format(lib_path, code_path))
 
+    return lib_path
+
+
+def test_redirectedpool( tmpdir ):
+    '''
+    Test for the "RedirectedPool" class.
+    '''
+    lib_path = _compile_library(tmpdir)
+
+    script_path = os.path.join(__scripts_path__, 'redirected_pool.py')
+
+    assert pyscripts.run_script(script_path, [str(lib_path)], fork=True) == 0
+
+
+def test_stdout_redirector( tmpdir ):
+    '''
+    Test for the "stdout_redirector" function.
+    '''
+    lib_path = _compile_library(tmpdir)
+
     # Define the path to the script
-    script_path = os.path.join(scripts_path, 'redirect_stdout.py')
+    script_path = os.path.join(__scripts_path__, 'redirect_stdout.py')
 
     # Test default stream (must use a script to do not interfere with pytest)
-    p = subprocess.Popen('python {} {}'.format(script_path, lib_path).split())
-    if p.wait() != 0:
-        assert False
+    assert pyscripts.run_script(script_path, [str(lib_path)], fork=True) == 0
+
+
+def test_timestampedlines( tmpdir ):
+    '''
+    Test for the "TimestampedLines" class.
+    '''
+    lines = pyscripts.TimestampedLines()
+
+    assert lines.append(b'a\nb', timestamp=1.) == 1
+    assert lines.append(b'c\nd\ne\n', timestamp=2.) == 3
+    assert lines.append(b'f', timestamp=3.) == 0
+    assert lines.close(timestamp=4.) == 1
+    assert lines.close() == 0
+
+    assert list(lines) == [(1., b'a\n'), (2., b'bc\n'), (2., b'd\n'), (2., b'e\n'), (4., b'f')]
+
+    path = tmpdir.join('lines.jsonl')
+
+    lines.to_jsonl(str(path), start=1, stop=3)
+
+    assert [json.loads(l) for l in path.readlines()] == [
+        {'index': 1, 'timestamp': 2., 'line': 'bc'},
+        {'index': 2, 'timestamp': 2., 'line': 'd'}]
+
+
+def test_timestamped_stdout_redirector( tmpdir ):
+    '''
+    Test for the "timestamped_stdout_redirector" function.
+    '''
+    lib_path = _compile_library(tmpdir)
+
+    script_path = os.path.join(__scripts_path__, 'timestamped_stdout.py')
+
+    output = tmpdir.join('output.jsonl')
+
+    assert pyscripts.run_script(script_path, [str(lib_path), str(output)], fork=True) == 0
+
+
+def test_timestamped_stdout_redirector_c_buffering( tmpdir ):
+    '''
+    Test that the lines written by C code through "timestamped_stdout_redirector"
+    are received as soon as they are written, on a new interpreter whose
+    output is not forced to be unbuffered.
+    '''
+    lib_path = _compile_library(tmpdir)
+
+    script_path = os.path.join(__scripts_path__, 'timestamped_stdout.py')
+
+    output = tmpdir.join('output.jsonl')
+
+    env = dict(os.environ)
+    env.pop('PYTHONUNBUFFERED', None)
+
+    p = subprocess.Popen([sys.executable, script_path, str(lib_path), str(output)], env=env,
+                         stdout=subprocess.PIPE)
+    p.communicate()
+    assert p.returncode == 0
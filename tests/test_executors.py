@@ -0,0 +1,200 @@
+'''
+Test functions for the "executors" module.
+'''
+
+__author__ = ['Miguel Ramos Pernas']
+__email__  = ['miguel.ramos.pernas@cern.ch']
+
+# Python
+import argparse
+import math
+import multiprocessing
+import os
+import pytest
+import subprocess
+import sys
+import threading
+import time
+
+# Local
+import pyscripts
+
+
+def _check_executor( executor ):
+    '''
+    Check the common interface of the executors.
+    '''
+    assert executor.map(math.factorial, range(6)) == [1, 1, 2, 6, 24, 120]
+
+    results = []
+    errors  = []
+
+    r = executor.apply_async(pow, (2, 3), callback=results.append)
+    assert r.get(timeout=10) == 8
+
+    r = executor.apply_async(math.sqrt, (-1,), error_callback=errors.append)
+    with pytest.raises(Exception):
+        r.get(timeout=10)
+
+    assert results == [8]
+    assert len(errors) == 1
+
+
+def test_localexecutor():
+    '''
+    Test the "LocalExecutor" class.
+    '''
+    with pyscripts.LocalExecutor(2) as executor:
+        assert executor.processes == 2
+        _check_executor(executor)
+
+
+def test_remoteexecutor():
+    '''
+    Test the "RemoteExecutor" class.
+    '''
+    with pyscripts.RemoteExecutor(('127.0.0.1', 0), authkey=b'test', processes=4) as executor:
+
+        address = '{}:{}'.format(*executor.address)
+
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts')
+
+        env = dict(os.environ)
+        env[pyscripts.executors.__authkey_env__] = 'test'
+        env['PYTHONPATH'] = os.pathsep.join([path] + sys.path)
+
+        workers = [subprocess.Popen([sys.executable, '-c',
+                                     'import sys, pyscripts; sys.exit(pyscripts.worker_main())',
+                                     '--address', address, '--processes', '2'], env=env)
+                   for _ in range(2)]
+
+        _check_executor(executor)
+
+        # Sweeps, with modes importable from the workers
+        parser = argparse.ArgumentParser()
+
+        pyscripts.define_modes(parser, ['textwrap:dedent'],
+                               apply_to_parsers=lambda p: p.add_argument('text'))
+
+        results = sorted(pyscripts.sweep(parser, [['dedent', ' a'], ['dedent', ' b']], executor=executor))
+
+        assert [r.result for r in results] == ['a', 'b']
+
+        # Dependencies
+        deps = pyscripts.dependencies(os.path.join(path, 'runner.py'), 'package',
+                                      abspath=True, executor=executor)
+
+        assert deps == [os.path.join(path, 'package', 'mod1.py')]
+
+        executor.close()
+        executor.join()
+
+        with pytest.raises(ValueError):
+            executor.apply_async(pow, (2, 3))
+
+    for w in workers:
+        assert w.wait(timeout=10) == 0
+
+
+def test_remoteexecutor_failures( capfd ):
+    '''
+    Test the "RemoteExecutor" class when the workers die, the tasks take
+    too long or the callbacks fail.
+    '''
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(pyscripts.__file__))))
+
+    def start_worker( executor ):
+        return subprocess.Popen([sys.executable, '-c', 'import sys, pyscripts; sys.exit(pyscripts.worker_main())',
+                                 '--address', '{}:{}'.format(*executor.address), '--authkey', 'test'], env=env)
+
+    with pyscripts.RemoteExecutor(('127.0.0.1', 0), authkey=b'test', worker_timeout=1.5) as executor:
+
+        # The task is sent again if its worker dies
+        worker = start_worker(executor)
+        r = executor.apply_async(time.sleep, (1.,))
+        time.sleep(1.)
+        worker.kill()
+        worker.wait()
+
+        worker = start_worker(executor)
+        assert r.get(timeout=20) is None
+
+        # Exceptions in the callbacks do not stop the executor
+        r = executor.apply_async(abs, (-1,), callback=lambda v: 1 / 0)
+        r.wait(timeout=10)
+        assert r.get() == 1
+        assert 'ZeroDivisionError' in capfd.readouterr().err
+        assert executor.map(abs, [-2, -3]) == [2, 3]
+
+        worker.kill()
+        worker.wait()
+
+    # Tasks taken by the connection of an idle worker that died are sent again
+    with pyscripts.RemoteExecutor(('127.0.0.1', 0), authkey=b'test', worker_timeout=1.5) as executor:
+        worker = start_worker(executor)
+        time.sleep(1.)
+        worker.kill()
+        worker.wait()
+
+        results = [executor.apply_async(abs, (-i,)) for i in range(4)]
+
+        worker = start_worker(executor)
+        assert [r.get(timeout=20) for r in results] == [0, 1, 2, 3]
+
+        worker.kill()
+        worker.wait()
+
+    # The tasks fail after the retries
+    with pyscripts.RemoteExecutor(('127.0.0.1', 0), authkey=b'test', worker_timeout=1.5, retries=0) as executor:
+        worker = start_worker(executor)
+        r = executor.apply_async(time.sleep, (5.,))
+        time.sleep(1.)
+        worker.kill()
+        worker.wait()
+        with pytest.raises(RuntimeError):
+            r.get(timeout=20)
+
+    # Tasks taking too long
+    with pyscripts.RemoteExecutor(('127.0.0.1', 0), authkey=b'test', timeout=1.) as executor:
+        r = executor.apply_async(abs, (-1,))
+        with pytest.raises(multiprocessing.TimeoutError):
+            r.get(timeout=20)
+
+
+def test_worker_main():
+    '''
+    Test the "worker_main" function.
+    '''
+    executor = pyscripts.RemoteExecutor(('127.0.0.1', 0), authkey=b'test')
+
+    code = []
+
+    worker = threading.Thread(target=lambda: code.append(pyscripts.worker_main(
+        ['--address', '{}:{}'.format(*executor.address), '--authkey', 'test'])))
+    worker.start()
+
+    assert executor.map(abs, [-1, -2]) == [1, 2]
+
+    # Pending tasks fail when the executor is terminated
+    executor.terminate()
+    executor.join()
+
+    worker.join(timeout=10)
+    assert code == [0]
+
+
+def test_remoteexecutor_lazy_imports():
+    '''
+    Test that importing the package does not import the modules needed
+    only by some of the functions, like the managers of the executors.
+    '''
+    modules = ('argparse', 'hashlib', 'json', 'multiprocessing.managers',
+               'multiprocessing.pool', 'subprocess', 'tracemalloc')
+
+    code = 'import sys, pyscripts; print(" ".join(m for m in {!r} if m in sys.modules))'.format(modules)
+
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(pyscripts.__file__))))
+
+    out = subprocess.check_output([sys.executable, '-c', code], env=env, universal_newlines=True)
+
+    assert out.split() == []
@@ -0,0 +1,192 @@
+'''
+Test functions for the "manifests" module.
+'''
+
+__author__ = ['Miguel Ramos Pernas']
+__email__  = ['miguel.ramos.pernas@cern.ch']
+
+# Python
+import argparse
+import json
+import os
+import pytest
+
+# Local
+import pyscripts
+
+
+def _power( value, exponent, fail ):
+    ''' Mode used in the manifests '''
+    if fail:
+        raise RuntimeError('Failed')
+    return value ** exponent
+
+
+def _define_parser():
+    '''
+    Define a parser with the "_power" mode.
+    '''
+    parser = argparse.ArgumentParser()
+
+    def add_arguments( p ):
+        p.add_argument('value', type=int)
+        p.add_argument('--exponent', type=int, default=2)
+        p.add_argument('--fail', action='store_true')
+
+    pyscripts.define_modes(parser, [_power], apply_to_parsers=add_arguments)
+
+    return parser
+
+
+def _write_manifests( tmpdir, n ):
+    '''
+    Write a manifest in JSON Lines and CSV formats.
+    '''
+    jsonl = os.path.join(tmpdir, 'manifest.jsonl')
+    with open(jsonl, 'w') as f:
+        for i in range(n):
+            f.write(json.dumps({'mode': '_power', 'args': [i], 'exponent': 3}) + '\n')
+        f.write('\n')
+        f.write(json.dumps(['_power', '1', '--fail']) + '\n')
+
+    csv = os.path.join(tmpdir, 'manifest.csv')
+    with open(csv, 'w') as f:
+        f.write('mode,args,exponent,fail\n')
+        for i in range(n):
+            f.write('_power,{},,false\n'.format(i))
+        f.write('_power,1,,TRUE\n')
+
+    return jsonl, csv
+
+
+def test_call_manifest( tmpdir ):
+    '''
+    Test the "call_manifest" function.
+    '''
+    parser = _define_parser()
+
+    jsonl, csv = _write_manifests(str(tmpdir), 20)
+
+    results = sorted(pyscripts.call_manifest(parser, jsonl, processes=2, chunksize=6))
+
+    assert [r.index for r in results] == list(range(21))
+    assert [r.result for r in results[:20]] == [i ** 3 for i in range(20)]
+    assert 'RuntimeError' in results[20].error
+
+    results = sorted(pyscripts.call_manifest(parser, csv, processes=2, chunksize=6))
+    assert [r.result for r in results[:20]] == [i ** 2 for i in range(20)]
+    assert results[20].error is not None
+
+    # Records generated on the fly
+    records = ({'mode': '_power', 'args': str(i), 'exponent': 1} for i in range(5))
+    results = sorted(pyscripts.call_manifest(parser, records, processes=2))
+    assert [r.result for r in results] == list(range(5))
+
+    # Invalid records do not stop the rest
+    path = str(tmpdir.join('invalid.jsonl'))
+    with open(path, 'w') as f:
+        f.write('["_power", "2"]\n{bad\n5\n["_power", "3"]\n')
+
+    results = sorted(pyscripts.call_manifest(parser, path, processes=2))
+    assert [r.result for r in results] == [4, None, None, 9]
+    assert results[1].argv is None and 'line 2' in results[1].error
+    assert results[2].argv is None and 'line 3' in results[2].error
+
+
+def test_parse_manifest( tmpdir ):
+    '''
+    Test the "parse_manifest" function.
+    '''
+    parser = _define_parser()
+
+    jsonl, _ = _write_manifests(str(tmpdir), 10)
+
+    chunks = list(pyscripts.parse_manifest(parser, jsonl, chunksize=4))
+
+    assert list(map(len, chunks)) == [4, 4, 3]
+
+    parsed = [p for c in chunks for p in c]
+    assert [i for i, _, _ in parsed] == list(range(11))
+    assert all(e is None for _, _, e in parsed)
+    assert parsed[3][1].value == 3 and parsed[3][1].exponent == 3
+    assert parsed[10][1].fail
+
+    # Invalid arguments
+    records = [['_power', '1'], ['_power', 'none'], {'mode': 'unknown'}]
+    (chunk,) = pyscripts.parse_manifest(parser, records)
+
+    assert chunk[0][1].value == 1 and chunk[0][2] is None
+    assert chunk[1][1] is None and chunk[1][2] is not None
+    assert chunk[2][1] is None and chunk[2][2] is not None
+
+    (chunk,) = pyscripts.parse_manifest(parser, [['_power', '1'], 5, '_power 2'])
+    assert [p[1] is None for p in chunk] == [False, True, False]
+    assert 'Invalid record 1' in chunk[1][2]
+
+
+def test_read_manifest( tmpdir ):
+    '''
+    Test the "read_manifest" function.
+    '''
+    jsonl, csv = _write_manifests(str(tmpdir), 2)
+
+    assert list(pyscripts.read_manifest(jsonl)) == [
+        ['_power', '0', '--exponent', '3'],
+        ['_power', '1', '--exponent', '3'],
+        ['_power', '1', '--fail'],
+    ]
+
+    assert list(pyscripts.read_manifest(csv)) == [
+        ['_power', '0'],
+        ['_power', '1'],
+        ['_power', '1', '--fail'],
+    ]
+
+    # Options, lists and explicit format
+    path = os.path.join(str(tmpdir), 'manifest.txt')
+    with open(path, 'w') as f:
+        f.write(json.dumps({'mode': 'm', 'args': 'a "b c"', 'n_bins': [1, 2], '-x': None}) + '\n')
+
+    assert list(pyscripts.read_manifest(path, format='jsonl')) == [['m', 'a', 'b c', '--n-bins', '1', '2']]
+
+    with pytest.raises(ValueError):
+        list(pyscripts.read_manifest(path))
+
+    # Invalid records
+    path = os.path.join(str(tmpdir), 'invalid.csv')
+    with open(path, 'w') as f:
+        f.write('mode,args,flag\nm,true,true\nm,a,b,c\n')
+
+    with pytest.raises(ValueError):
+        list(pyscripts.read_manifest(path))
+
+    argvs = list(pyscripts.read_manifest(path, errors='yield'))
+    assert argvs[0] == ['m', 'true', '--flag']
+    assert isinstance(argvs[1], ValueError) and 'line 3' in str(argvs[1])
+
+    # Rows that can not be parsed (longer than the default size limit of the
+    # fields) or decoded do not stop the rest
+    path = os.path.join(str(tmpdir), 'unreadable.csv')
+    with open(path, 'wb') as f:
+        f.write(b'mode,args\nm,a\nm,' + b'x' * (128 * 1024 + 1) + b'\nm,\xff\nm,b\n')
+
+    argvs = list(pyscripts.read_manifest(path, errors='yield'))
+    assert argvs[0] == ['m', 'a'] and argvs[3] == ['m', 'b']
+    assert isinstance(argvs[1], ValueError) and 'line 3' in str(argvs[1])
+    assert isinstance(argvs[2], ValueError) and 'line 4' in str(argvs[2])
+
+    path = os.path.join(str(tmpdir), 'unreadable.jsonl')
+    with open(path, 'wb') as f:
+        f.write(b'["m", "a"]\n["m", "\xff"]\n["m", "b"]\n')
+
+    argvs = list(pyscripts.read_manifest(path, errors='yield'))
+    assert argvs[0] == ['m', 'a'] and argvs[2] == ['m', 'b']
+    assert isinstance(argvs[1], ValueError) and 'line 2' in str(argvs[1])
+
+    # JSON documents are rejected
+    path = os.path.join(str(tmpdir), 'manifest.json')
+    with open(path, 'w') as f:
+        json.dump([['m', 'a']], f)
+
+    with pytest.raises(ValueError, match='JSON Lines'):
+        list(pyscripts.read_manifest(path, errors='yield'))
@@ -7,6 +7,16 @@ __email__  = ['miguel.ramos.pernas@cern.ch']
 
 # Python
 import argparse
+import asyncio
+import json
+import os
+import pickle
+import pytest
+import signal
+import sys
+import textwrap
+import threading
+import time
 
 # Local
 import pyscripts
@@ -37,7 +47,95 @@ def _define_parser():
     return parser
 
 
-def test_call():
+def _sweep_mode( value, fail ):
+    ''' Mode used in sweeps '''
+    if fail:
+        raise RuntimeError('Failed')
+    return value ** 2
+
+
+async def _async_mode( value, delay ):
+    ''' Asynchronous mode '''
+    await asyncio.sleep(delay)
+    return value
+
+
+def _crash_mode( value ):
+    '''
+    Mode killing its process for negative values.
+    '''
+    if value < 0:
+        os.kill(os.getpid(), signal.SIGKILL)
+    return value
+
+
+def _define_concurrent_parser():
+    '''
+    Define a parser with a synchronous and an asynchronous mode.
+    '''
+    running = {'current': 0, 'max': 0}
+    lock = threading.Lock()
+
+    def sync_mode( value, delay ):
+        ''' Synchronous mode '''
+        with lock:
+            running['current'] += 1
+            running['max'] = max(running['max'], running['current'])
+        time.sleep(delay)
+        with lock:
+            running['current'] -= 1
+        if value < 0:
+            raise ValueError('Negative value')
+        return value
+
+    def add_arguments( p ):
+        p.add_argument('value', type=int)
+        p.add_argument('--delay', type=float, default=0.2)
+
+    parser = argparse.ArgumentParser()
+
+    pyscripts.define_modes(parser, [sync_mode, _async_mode], apply_to_parsers=add_arguments)
+
+    return parser, running
+
+
+def _write_lazy_module( tmpdir, monkeypatch, name ):
+    '''
+    Write a module to be loaded by a lazy mode, making it importable.
+    '''
+    tmpdir.join(name + '.py').write(textwrap.dedent('''\
+    \'\'\'
+    Module with lazy modes.
+    \'\'\'
+    def lazy_mode( value ):
+        \'\'\' Lazy mode \'\'\'
+        return 2 * value
+    '''))
+
+    monkeypatch.syspath_prepend(str(tmpdir))
+
+
+def test_argument_grid():
+    '''
+    Test the "argument_grid" function.
+    '''
+    argvs = pyscripts.argument_grid(['a', 'b'], {'--x': [1, 2], '--flag': [True, False], '--y': [(1, 2)]}, prefix=['--main'])
+
+    assert argvs == [
+        ['--main', 'a', '--x', '1', '--flag', '--y', '1', '2'],
+        ['--main', 'a', '--x', '1', '--y', '1', '2'],
+        ['--main', 'a', '--x', '2', '--flag', '--y', '1', '2'],
+        ['--main', 'a', '--x', '2', '--y', '1', '2'],
+        ['--main', 'b', '--x', '1', '--flag', '--y', '1', '2'],
+        ['--main', 'b', '--x', '1', '--y', '1', '2'],
+        ['--main', 'b', '--x', '2', '--flag', '--y', '1', '2'],
+        ['--main', 'b', '--x', '2', '--y', '1', '2'],
+    ]
+
+    assert pyscripts.argument_grid('a') == [['a']]
+
+
+def test_call( tmpdir ):
     '''
     Test the "call" function.
     '''
@@ -47,13 +145,117 @@ def test_call():
 
     assert pyscripts.call(args) == 2
 
+    # Profile the modes
+    parser = argparse.ArgumentParser()
+
+    def add_arguments( p ):
+        p.add_argument('--value', type=int)
+        p.add_argument('--fail', action='store_true')
+
+    pyscripts.define_modes(parser, [_sweep_mode], profile=True, apply_to_parsers=add_arguments)
+
+    metrics = tmpdir.join('metrics.jsonl')
+
+    args = parser.parse_args('_sweep_mode --value 3'.split())
+
+    assert pyscripts.call(args) == 9
+    assert not metrics.exists()
+
+    args = parser.parse_args('_sweep_mode --value 3 --profile {}'.format(metrics).split())
+
+    assert pyscripts.call(args) == 9
+    assert json.loads(metrics.read())['mode'] == '_sweep_mode'
+
+    for option in ('--profile-tracemalloc', '--profile-dump=stats.prof'):
+        args = parser.parse_args(['_sweep_mode', '--value', '3', option])
+        with pytest.raises(ValueError):
+            pyscripts.call(args)
 
-def test_define_modes():
+    # Coroutines
+    parser, _ = _define_concurrent_parser()
+
+    assert pyscripts.call(parser.parse_args('_async_mode 4 --delay 0'.split())) == 4
+
+
+def test_call_concurrently():
+    '''
+    Test the "call_concurrently" function.
+    '''
+    parser, running = _define_concurrent_parser()
+
+    args = [parser.parse_args([m, str(i)]) for i in range(4) for m in ('sync_mode', '_async_mode')]
+
+    start = time.perf_counter()
+    assert pyscripts.call_concurrently(args) == [i for i in range(4) for _ in range(2)]
+    assert time.perf_counter() - start < 0.2 * len(args) / 2
+
+    assert running['max'] > 1
+
+    # Limit the number of concurrent calls
+    running['max'] = 0
+
+    args = [parser.parse_args(['sync_mode', str(i), '--delay', '0.01']) for i in range(6)]
+
+    assert pyscripts.call_concurrently(args, limit=2) == list(range(6))
+    assert running['max'] <= 2
+
+    # Exceptions
+    args.append(parser.parse_args(['sync_mode', '-1', '--delay', '0']))
+
+    with pytest.raises(ValueError):
+        pyscripts.call_concurrently(args)
+
+    assert isinstance(pyscripts.call_concurrently(args, return_exceptions=True)[-1], ValueError)
+
+
+def test_define_modes( tmpdir, monkeypatch ):
     '''
     Test the "define_modes" function.
     '''
     _define_parser()
 
+    # Modes defined from import strings
+    _write_lazy_module(tmpdir, monkeypatch, 'lazy_define_modes')
+
+    parser = argparse.ArgumentParser()
+
+    subparsers = pyscripts.define_modes(parser, ['lazy_define_modes:lazy_mode'],
+                                        apply_to_parsers=lambda p: p.add_argument('value', type=int))
+
+    assert 'lazy_mode' in subparsers.choices
+    assert 'lazy_define_modes' not in sys.modules
+
+    args = parser.parse_args('lazy_mode 2'.split())
+
+    assert pyscripts.call(args) == 4
+    assert 'lazy_define_modes' in sys.modules
+
+
+def test_lazymode( tmpdir, monkeypatch ):
+    '''
+    Test the "LazyMode" class.
+    '''
+    _write_lazy_module(tmpdir, monkeypatch, 'lazy_lazymode')
+
+    mode = pyscripts.LazyMode('lazy_lazymode:lazy_mode')
+
+    assert mode.__name__ == 'lazy_mode'
+    assert mode.__doc__ == ' Lazy mode '
+    assert 'lazy_lazymode' not in sys.modules
+
+    mode = pickle.loads(pickle.dumps(mode))
+
+    assert mode(3) == 6
+    assert 'lazy_lazymode' in sys.modules
+
+    mode = pyscripts.LazyMode('lazy_lazymode:lazy_mode', name='other', help='Other')
+
+    assert mode.__name__ == 'other'
+    assert mode.__doc__ == 'Other'
+
+    with pytest.raises(ValueError):
+        pyscripts.LazyMode('lazy_lazymode.lazy_mode')
+
 
 def test_process_args():
     '''
@@ -71,3 +273,80 @@ def test_process_args():
     assert pyscripts.parsers.__callable_name__ not in dct
 
     assert getattr(args, pyscripts.parsers.__callable_name__)(**dct) == 1
+
+
+def test_sweep():
+    '''
+    Test the "sweep" function.
+    '''
+    parser = argparse.ArgumentParser()
+
+    def add_arguments( p ):
+        p.add_argument('--value', type=int, required=True)
+        p.add_argument('--fail', action='store_true')
+
+    pyscripts.define_modes(parser, [_sweep_mode], apply_to_parsers=add_arguments)
+
+    argvs = pyscripts.argument_grid('_sweep_mode', {'--value': range(10)})
+
+    argvs.append(['_sweep_mode', '--value', '3', '--fail'])  # fails running
+    argvs.append('_sweep_mode --value none')  # fails parsing
+
+    results = sorted(pyscripts.sweep(parser, iter(argvs), processes=2, max_pending=3))
+
+    assert [r.index for r in results] == list(range(12))
+
+    for r in results[:10]:
+        assert r.result == r.index ** 2
+        assert r.error is None
+
+    assert 'RuntimeError' in results[10].error
+    assert results[11].argv == ['_sweep_mode', '--value', 'none']
+    assert results[11].error is not None
+
+    # Arguments that could not be read
+    results = sorted(pyscripts.sweep(parser, [ValueError('Invalid'), argvs[2]], processes=1))
+    assert results[0].argv is None and 'Invalid' in results[0].error
+    assert results[1].result == 4
+
+    # Invalid argument vectors do not stop the rest of the tasks
+    for chunksize in (1, 2):
+        results = sorted(pyscripts.sweep(parser, [argvs[1], None, argvs[2], argvs[3]], processes=1,
+                                         chunksize=chunksize))
+        assert [r.result for r in results] == [1, None, 4, 9]
+        assert 'TypeError' in results[1].error
+
+    # Send the tasks in chunks
+    results = sorted(pyscripts.sweep(parser, argvs, processes=2, chunksize=4))
+
+    assert [r.result for r in results[:10]] == [i ** 2 for i in range(10)]
+    assert 'RuntimeError' in results[10].error and results[11].error is not None
+
+    # Use an executor
+    with pyscripts.LocalExecutor(2) as executor:
+        results = sorted(pyscripts.sweep(parser, argvs[:10], executor=executor))
+
+    assert [r.result for r in results] == [i ** 2 for i in range(10)]
+
+    # Modes that can not be sent to the workers
+    results = list(pyscripts.sweep(_define_parser(), ['mode_1 --entries 1'], processes=1))
+
+    assert len(results) == 1 and results[0].error is not None
+
+    # Tasks killing their process only make their chunk fail
+    parser = argparse.ArgumentParser()
+
+    pyscripts.define_modes(parser, [_crash_mode],
+                           apply_to_parsers=lambda p: p.add_argument('value', type=int))
+
+    argvs = ['_crash_mode -- {}'.format(v) for v in (1, -1, 2, 3)]
+
+    results = sorted(pyscripts.sweep(parser, argvs, processes=2))
+
+    assert [r.result for r in results] == [1, None, 2, 3]
+    assert 'code -{}'.format(signal.SIGKILL) in results[1].error
+
+    results = sorted(pyscripts.sweep(parser, argvs, processes=2, chunksize=2))
+
+    assert [r.result for r in results] == [None, None, 2, 3]
+    assert results[0].error == results[1].error
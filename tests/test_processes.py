@@ -0,0 +1,102 @@
+'''
+Test functions for the "processes" module.
+'''
+
+__author__ = ['Miguel Ramos Pernas']
+__email__  = ['miguel.ramos.pernas@cern.ch']
+
+# Python
+import ctypes
+import os
+import signal
+
+# Local
+import pyscripts
+
+
+def _exit_with( value ):
+    '''
+    Function to run on a forked process, displaying a message.
+    '''
+    print('child {}'.format(value))
+    if isinstance(value, Exception):
+        raise value
+    elif value == 'kill':
+        os.kill(os.getpid(), signal.SIGKILL)
+    elif value == 'exit':
+        raise SystemExit('exit message')
+    return value
+
+
+def test_exit_code( capfd ):
+    '''
+    Test the "exit_code" function.
+    '''
+    assert pyscripts.exit_code(SystemExit()) == 0
+    assert pyscripts.exit_code(SystemExit(3)) == 3
+    assert pyscripts.exit_code(SystemExit('message')) == 1
+    assert capfd.readouterr().err == 'message\n'
+
+
+def test_exit_status():
+    '''
+    Test the "exit_status" function.
+    '''
+    pid = os.fork()
+    if pid == 0:
+        os._exit(5)
+    assert pyscripts.exit_status(os.waitpid(pid, 0)[1]) == 5
+
+    pid = os.fork()
+    if pid == 0:
+        os.kill(os.getpid(), signal.SIGKILL)
+    assert pyscripts.exit_status(os.waitpid(pid, 0)[1]) == -signal.SIGKILL
+
+
+def test_flush_c_stdout( capfd ):
+    '''
+    Test the "flush_c_stdout" function.
+    '''
+    libc = ctypes.CDLL(None)
+    libc.printf(b'c output')
+    pyscripts.flush_c_stdout()
+    assert capfd.readouterr().out == 'c output'
+
+
+def test_flush_streams( capfd ):
+    '''
+    Test the "flush_streams" function.
+    '''
+    print('python output', end='')
+    pyscripts.flush_streams()
+    assert capfd.readouterr().out == 'python output'
+
+
+def test_fork_call( capfd ):
+    '''
+    Test the "fork_call" function.
+    '''
+    # The exit code is returned by the function
+    assert pyscripts.wait_process(pyscripts.fork_call(_exit_with, 4)) == 4
+    assert pyscripts.wait_process(pyscripts.fork_call(_exit_with, None)) == 0
+    assert capfd.readouterr().out == 'child 4\nchild None\n'
+
+    # Exceptions and signals
+    assert pyscripts.wait_process(pyscripts.fork_call(_exit_with, 'exit')) == 1
+    assert capfd.readouterr().err == 'exit message\n'
+
+    assert pyscripts.wait_process(pyscripts.fork_call(_exit_with, ValueError('failure'))) == 1
+    assert 'ValueError: failure' in capfd.readouterr().err
+
+    # The buffered output is not written twice
+    print('parent', end='')
+    assert pyscripts.wait_process(pyscripts.fork_call(_exit_with, 0)) == 0
+    assert capfd.readouterr().out == 'parentchild 0\n'
+
+
+def test_wait_process( capfd ):
+    '''
+    Test the "wait_process" function.
+    '''
+    assert pyscripts.wait_process(pyscripts.fork_call(_exit_with, 'kill')) == -signal.SIGKILL
+    assert capfd.readouterr().out == 'child kill\n'
@@ -0,0 +1,52 @@
+'''
+Test functions for the "profiling" module.
+'''
+
+__author__ = ['Miguel Ramos Pernas']
+__email__  = ['miguel.ramos.pernas@cern.ch']
+
+# Python
+import json
+import os
+import pstats
+import pytest
+
+# Local
+import pyscripts
+
+
+def _allocate( size ):
+    ''' Allocate memory '''
+    return len(bytearray(size))
+
+
+def test_profiled_call( tmpdir ):
+    '''
+    Test the "profiled_call" function.
+    '''
+    metrics = str(tmpdir.join('metrics.jsonl'))
+    dump    = str(tmpdir.join('{mode}-{pid}.prof'))
+
+    assert pyscripts.profiled_call(_allocate, {'size': 10**7}, metrics) == 10**7
+    assert pyscripts.profiled_call(_allocate, {'size': 10**7}, metrics, dump=dump, trace_memory=True) == 10**7
+
+    with pytest.raises(TypeError):
+        pyscripts.profiled_call(_allocate, {}, metrics)
+
+    with open(metrics) as f:
+        records = [json.loads(l) for l in f]
+
+    assert len(records) == 3
+
+    for r in records:
+        assert r['mode'] == '_allocate'
+        assert r['pid'] == os.getpid()
+        assert r['wall'] >= 0 and r['cpu'] >= 0 and r['process_max_rss'] > 0
+
+    assert 'tracemalloc_peak' not in records[0]
+    assert records[1]['tracemalloc_peak'] >= 10**7
+    assert 'error' not in records[1]
+    assert 'TypeError' in records[2]['error']
+
+    stats = pstats.Stats(dump.format(mode='_allocate', pid=os.getpid()))
+    assert any(f[2] == '_allocate' for f in stats.stats)
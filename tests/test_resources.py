@@ -0,0 +1,127 @@
+'''
+Test functions for the "resources" module.
+'''
+
+__author__ = ['Miguel Ramos Pernas']
+__email__  = ['miguel.ramos.pernas@cern.ch']
+
+# Python
+import argparse
+import json
+import os
+import pytest
+import time
+
+# Local
+import pyscripts
+
+
+def _heavy( delay ):
+    ''' Mode needing many resources '''
+    time.sleep(delay)
+    return os.environ['OMP_NUM_THREADS']
+
+
+def _light( delay, size ):
+    ''' Mode needing few resources '''
+    time.sleep(delay)
+    if size < 0:
+        raise ValueError('Negative size')
+    return len(bytearray(size))
+
+
+def _define_parser():
+    '''
+    Define a parser with modes needing different resources.
+    '''
+    parser = argparse.ArgumentParser()
+
+    subparsers = pyscripts.define_modes(parser, [_heavy, _light],
+                                        apply_to_parsers=lambda p: p.add_argument('--delay', type=float, default=0.2),
+                                        resources={'_heavy': pyscripts.Resources(cores=4, memory='1G', threads=3)})
+
+    subparsers.choices['_light'].add_argument('--size', type=int, default=0)
+
+    return parser
+
+
+def test_resources():
+    '''
+    Test the "Resources" class.
+    '''
+    r = pyscripts.Resources()
+    assert (r.cores, r.memory, r.threads) == (1, 0, 1)
+
+    r = pyscripts.Resources(cores=2, memory='1.5K')
+    assert (r.cores, r.memory, r.threads) == (2, 1536, 2)
+
+    assert pyscripts.Resources(memory='16GB').memory == 16 * 1024**3
+    assert pyscripts.Resources(memory=100).memory == 100
+
+    with pytest.raises(ValueError):
+        pyscripts.Resources(memory='lots')
+
+    # The resources are not passed to the modes
+    args = _define_parser().parse_args(['_heavy'])
+
+    assert getattr(args, pyscripts.parsers.__resources_name__).cores == 4
+    assert pyscripts.process_args(args) == {'delay': 0.2}
+
+
+def test_parse_memory():
+    '''
+    Test the "parse_memory" function.
+    '''
+    assert pyscripts.parse_memory(100) == 100
+    assert pyscripts.parse_memory('100') == 100
+    assert pyscripts.parse_memory('2K') == 2048
+    assert pyscripts.parse_memory('1.5gb') == 3 << 29
+    assert pyscripts.parse_memory('1T') == 1 << 40
+
+    with pytest.raises(ValueError):
+        pyscripts.parse_memory('1X')
+
+
+def test_schedule( tmpdir ):
+    '''
+    Test the "schedule" function.
+    '''
+    parser = _define_parser()
+
+    args = [parser.parse_args(['_heavy']) for _ in range(2)]
+    args += [parser.parse_args(['_light', '--size', str(10**8)]) for _ in range(2)]
+    args.append(parser.parse_args(['_light', '--size', '-1', '--delay', '0']))
+
+    log = str(tmpdir.join('usage.jsonl'))
+
+    results = sorted(pyscripts.schedule(args, cores=5, memory='2G', log=log), key=lambda r: r.index)
+
+    assert [r.result for r in results] == ['3', '3', 10**8, 10**8, None]
+    assert all(r.error is None for r in results[:4])
+    assert 'ValueError' in results[4].error
+
+    # The heavy modes do not overlap
+    heavy = sorted((r.usage['start'], r.usage['end']) for r in results[:2])
+    assert heavy[1][0] >= heavy[0][1]
+
+    # The light modes run at the same time as the heavy ones
+    assert any(r.usage['start'] < heavy[0][1] for r in results[2:4])
+
+    assert all(r.usage['peak_rss'] > 10**8 for r in results[2:4])
+
+    with open(log) as f:
+        records = [json.loads(l) for l in f]
+
+    assert sorted(r['index'] for r in records) == list(range(5))
+
+    # Tasks needing many resources are not overtaken indefinitely
+    mixed  = [parser.parse_args(['_light'])]
+    mixed += [parser.parse_args(['_heavy', '--delay', '0'])]
+    mixed += [parser.parse_args(['_light']) for _ in range(12)]
+
+    order = [r.index for r in pyscripts.schedule(mixed, cores=4)]
+    assert order.index(1) <= 4
+
+    # Tasks needing more resources than those available run alone
+    results = list(pyscripts.schedule(args[:2], cores=2))
+    assert [r.result for r in results] == ['3', '3']
@@ -0,0 +1,49 @@
+'''
+Test functions for the "runner" module.
+'''
+
+__author__ = ['Miguel Ramos Pernas']
+__email__  = ['miguel.ramos.pernas@cern.ch']
+
+# Python
+import os
+import sys
+
+# Local
+import pyscripts
+
+__script_path__ = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts/runner.py')
+
+
+def test_run_script( capfd ):
+    '''
+    Test the "run_script" function.
+    '''
+    argv, path = list(sys.argv), list(sys.path)
+
+    # In the same process
+    assert pyscripts.run_script(__script_path__, ['a', 'b']) == 0
+    assert capfd.readouterr().out == 'a b\n'
+
+    assert sys.argv == argv and sys.path == path
+    assert 'package.mod1' not in sys.modules
+
+    # The local modules are imported again
+    assert pyscripts.run_script(__script_path__, ['value']) == 1
+
+    assert pyscripts.run_script(__script_path__, ['value'], keep_modules=lambda m: True) == 1
+    assert pyscripts.run_script(__script_path__, ['value'], keep_modules=lambda m: True) == 2
+
+    del sys.modules['package.mod1'], sys.modules['package']
+
+    assert pyscripts.run_script(__script_path__, ['fail']) == 1
+    assert 'RuntimeError' in capfd.readouterr().err
+
+    # In a forked process
+    assert pyscripts.run_script(__script_path__, ['a'], fork=True) == 0
+    assert capfd.readouterr().out == 'a\n'
+
+    assert pyscripts.run_script(__script_path__, ['fail'], fork=True) == 1
+    assert 'RuntimeError' in capfd.readouterr().err
+
+    assert 'package.mod1' not in sys.modules
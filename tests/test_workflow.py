@@ -0,0 +1,134 @@
+'''
+Test functions for the "workflow" module.
+'''
+
+__author__ = ['Miguel Ramos Pernas']
+__email__  = ['miguel.ramos.pernas@cern.ch']
+
+# Python
+import os
+import pytest
+import time
+
+# Local
+import pyscripts
+
+__script_path__ = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts/workflow.py')
+
+
+def _task( tmpdir, output, inputs = None, **kwargs ):
+    '''
+    Build a task running the test script.
+    '''
+    inputs  = [str(tmpdir.join(i)) for i in (inputs or [])]
+    output  = str(tmpdir.join(output))
+    options = ['--{}'.format(k) if v is True else '--{}={}'.format(k, v) for k, v in kwargs.items()]
+    return pyscripts.Task(__script_path__, [output] + inputs + options,
+                          inputs=inputs, outputs=[output], name=os.path.basename(output))
+
+
+def test_task( tmpdir ):
+    '''
+    Test the "Task" class.
+    '''
+    task = _task(tmpdir, 'b', ['a'])
+
+    assert task.name == 'b'
+    assert not task.up_to_date()
+
+    tmpdir.join('a').write('a')
+    assert not task.up_to_date()
+
+    tmpdir.join('b').write('b')
+    assert task.up_to_date()
+
+    os.utime(str(tmpdir.join('a')), (time.time() + 10, time.time() + 10))
+    assert not task.up_to_date()
+
+    task = pyscripts.Task(__script_path__, ['x'])
+    assert task.name == 'workflow.py x'
+
+
+def test_task_dependencies( tmpdir, monkeypatch ):
+    '''
+    Test that the dependencies of the scripts of the tasks are only
+    calculated once.
+    '''
+    calls = []
+
+    def dependencies( script, pkg_name, abspath ):
+        calls.append(script)
+        return [str(tmpdir.join('module.py'))]
+
+    monkeypatch.setattr(pyscripts.workflow, 'dependencies', dependencies)
+    monkeypatch.setattr(pyscripts.workflow, '_dependencies', {})
+
+    tmpdir.join('module.py').write('')
+
+    tasks = [pyscripts.Task(__script_path__, [str(i)], outputs=[str(tmpdir.join(str(i)))], pkg_name='package')
+             for i in range(5)]
+
+    for t in tasks:
+        tmpdir.join(t.argv[0]).write('')
+        assert t.up_to_date()
+
+    assert calls == [__script_path__]
+
+    os.utime(str(tmpdir.join('module.py')), (time.time() + 10, time.time() + 10))
+    assert not any(t.up_to_date() for t in tasks)
+
+
+def test_run_workflow( tmpdir ):
+    '''
+    Test the "run_workflow" function.
+    '''
+    tmpdir.join('input').write('input\n')
+
+    tasks = [_task(tmpdir, 'a', ['input'], sleep=0.3),
+             _task(tmpdir, 'b', ['input'], sleep=0.3),
+             _task(tmpdir, 'c', ['a', 'b'])]
+
+    start = time.time()
+    report = pyscripts.run_workflow(reversed(tasks), processes=2, log_dir=str(tmpdir.join('logs')))
+    assert time.time() - start < 0.9  # "a" and "b" run in parallel
+
+    assert all(s['status'] == 'done' for s in report['tasks'].values())
+    assert report['tasks']['c']['start'] >= max(report['tasks'][n]['end'] for n in ('a', 'b'))
+    assert report['critical_path'][-1] == 'c' and len(report['critical_path']) == 2
+    assert report['critical_time'] >= 0.3
+
+    assert tmpdir.join('c').read() == 'c\na\ninput\nb\ninput\n'
+
+    # Nothing to do
+    report = pyscripts.run_workflow(tasks)
+    assert all(s['status'] == 'skipped' for s in report['tasks'].values())
+
+    # Changes in one of the inputs
+    os.utime(str(tmpdir.join('b')), (time.time() + 10, time.time() + 10))
+
+    report = pyscripts.run_workflow(tasks)
+    assert [report['tasks'][n]['status'] for n in 'abc'] == ['skipped', 'skipped', 'done']
+
+    assert pyscripts.run_workflow(tasks, force=True)['tasks']['a']['status'] == 'done'
+
+    # Failures
+    tasks = [_task(tmpdir, 'd', ['input'], fail=True), _task(tmpdir, 'e', ['d']), _task(tmpdir, 'f', ['input'])]
+
+    report = pyscripts.run_workflow(tasks)
+    assert [report['tasks'][n]['status'] for n in 'def'] == ['failed', 'cancelled', 'done']
+
+    # Long names and tasks that can not be started
+    logs = tmpdir.join('logs')
+    logs.join('j.log').ensure(dir=True)
+
+    tasks = [_task(tmpdir, 'i', ['input']), _task(tmpdir, 'j', ['input']), _task(tmpdir, 'k', ['j'])]
+    tasks[0].name = 'i' * 300
+
+    report = pyscripts.run_workflow(tasks, log_dir=str(logs))
+    assert [report['tasks'][n]['status'] for n in ('i' * 300, 'j', 'k')] == ['done', 'failed', 'cancelled']
+    assert 'error' in report['tasks']['j']
+    assert any(len(f.basename) < 255 and f.basename.startswith('iii') for f in logs.listdir())
+
+    # Cyclic dependencies
+    with pytest.raises(ValueError):
+        pyscripts.run_workflow([_task(tmpdir, 'g', ['h']), _task(tmpdir, 'h', ['g'])])